@@ -0,0 +1,209 @@
+"""
+Admission control: per-client token buckets and a prioritized,
+bounded wait queue in front of the request handlers.
+
+- TokenBucketLimiter limits each key (session or IP) to `rate` requests
+  per second with bursts of `burst`.
+- AdmissionController caps requests in progress (and, among them, the
+  ones that call the LLM). Requests that can't start right away wait in a
+  bounded priority queue; when it is full or the wait runs out they are
+  shed with Overloaded, so callers can answer 429 + Retry-After at once
+  instead of piling up behind slow calls.
+"""
+import heapq
+import itertools
+import math
+import threading
+import time
+from collections import OrderedDict
+
+
+class Overloaded(Exception):
+    """
+    Raised when a request is refused. `reason` says why ("rate_session",
+    "rate_ip", "queue_full", "queue_timeout", "evicted", or "upstream"
+    when the LLM provider itself is overloaded); `retry_after` is a hint
+    in seconds.
+    """
+
+    def __init__(self, reason, retry_after=1.0):
+        super().__init__(f"Request refused: {reason}")
+        self.reason = reason
+        self.retry_after = retry_after
+
+# ----------------------------------------------------------------
+# TOKEN BUCKETS
+# ----------------------------------------------------------------
+
+
+class TokenBucketLimiter:
+    """
+    One token bucket per key, created full. Least recently used keys are
+    dropped past max_keys (a dropped key simply starts with a full bucket).
+    """
+
+    def __init__(self, rate, burst, max_keys=100000):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()   # key -> [tokens, last refill time]
+
+    def take(self, key, cost=1.0):
+        """
+        Take `cost` tokens. Returns 0 if allowed, otherwise the seconds
+        until enough tokens will be available.
+        """
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.burst, now]
+                while len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                return 0.0
+            return (cost - bucket[0]) / self.rate if self.rate > 0 else 60.0
+
+    def __len__(self):
+        return len(self._buckets)
+
+# ----------------------------------------------------------------
+# CONCURRENCY + PRIORITY QUEUE
+# ----------------------------------------------------------------
+
+
+class _Waiter:
+    __slots__ = ('priority', 'llm', 'state')
+
+    def __init__(self, priority, llm):
+        self.priority = priority
+        self.llm = llm
+        self.state = 'waiting'   # -> 'granted' | 'evicted'
+
+
+class AdmissionController:
+    """
+    At most max_active requests run at once, and at most max_llm of them
+    may be LLM-bound. Lower priority numbers are served first; a cheap
+    request is never stuck behind LLM requests waiting for an LLM slot.
+    """
+
+    def __init__(self, max_active=64, max_llm=16, max_queue=128, queue_timeout=5.0):
+        self.max_active = max_active
+        self.max_llm = max_llm
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self._queue = []          # heap of (priority, seq, waiter)
+        self._seq = itertools.count()
+        self.active = 0
+        self.active_llm = 0
+        self._hold_ewma = 1.0     # seconds a slot is typically held
+        self.counters = {'admitted': 0, 'queued': 0, 'queue_full': 0, 'queue_timeout': 0, 'evicted': 0}
+
+    def _fits(self, llm):
+        return self.active < self.max_active and (not llm or self.active_llm < self.max_llm)
+
+    def _grant(self, waiter):
+        waiter.state = 'granted'
+        self.active += 1
+        if waiter.llm:
+            self.active_llm += 1
+        self.counters['admitted'] += 1
+
+    def _dispatch(self):
+        # Grant queued waiters in priority order, skipping LLM waiters while LLM slots are full
+        if not self._queue or self.active >= self.max_active:
+            return
+        remaining = []
+        granted = False
+        for item in sorted(self._queue):
+            waiter = item[2]
+            if waiter.state == 'waiting' and self._fits(waiter.llm):
+                self._grant(waiter)
+                granted = True
+            elif waiter.state == 'waiting':
+                remaining.append(item)
+        heapq.heapify(remaining)
+        self._queue = remaining
+        if granted:
+            self._cond.notify_all()
+
+    def retry_after(self):
+        """
+        Rough seconds until a slot frees up for a new arrival.
+        """
+        backlog = (len(self._queue) + 1) / max(self.max_active, 1)
+        return max(1, math.ceil(self._hold_ewma * backlog))
+
+    def acquire(self, priority=1, llm=False, timeout=None):
+        """
+        Wait for a slot. Returns the seconds spent queued; raises
+        Overloaded if the request is shed. Pair with release(llm).
+        """
+        timeout = self.queue_timeout if timeout is None else timeout
+        with self._cond:
+            waiter = _Waiter(priority, llm)
+            # Queued waiters are only those that don't fit right now, so
+            # a request that fits isn't jumping ahead of anyone who could run
+            if self._fits(llm):
+                self._grant(waiter)
+                return 0.0
+
+            if len(self._queue) >= self.max_queue:
+                # Full: shed the least important waiter if this request outranks it
+                worst = max(self._queue)
+                if worst[0] <= priority:
+                    self.counters['queue_full'] += 1
+                    raise Overloaded('queue_full', self.retry_after())
+                self._queue.remove(worst)
+                heapq.heapify(self._queue)
+                worst[2].state = 'evicted'
+                self.counters['evicted'] += 1
+                self._cond.notify_all()
+
+            heapq.heappush(self._queue, (priority, next(self._seq), waiter))
+            self.counters['queued'] += 1
+            self._dispatch()
+
+            started = time.monotonic()
+            deadline = started + timeout
+            while waiter.state == 'waiting':
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._queue = [item for item in self._queue if item[2] is not waiter]
+                    heapq.heapify(self._queue)
+                    self.counters['queue_timeout'] += 1
+                    raise Overloaded('queue_timeout', self.retry_after())
+                self._cond.wait(remaining)
+
+            if waiter.state == 'evicted':
+                raise Overloaded('evicted', self.retry_after())
+            return time.monotonic() - started
+
+    def release(self, llm=False, held=None):
+        """
+        Free a slot taken by acquire(). held (seconds) feeds the Retry-After estimate.
+        """
+        with self._cond:
+            self.active -= 1
+            if llm:
+                self.active_llm -= 1
+            if held is not None:
+                self._hold_ewma = 0.9 * self._hold_ewma + 0.1 * held
+            self._dispatch()
+
+    def stats(self):
+        with self._cond:
+            return dict(
+                self.counters,
+                active=self.active,
+                active_llm=self.active_llm,
+                waiting=len(self._queue),
+            )
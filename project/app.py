@@ -1,43 +1,533 @@
 import os
-import openai
 import re
 import uuid
 import json
+import copy
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 
-from flask import Flask, render_template, request, jsonify, session
+from flask import Flask, Response, render_template, request, jsonify, session, stream_with_context, g, url_for
+from werkzeug.middleware.proxy_fix import ProxyFix
 from dotenv import load_dotenv
 
+from recipe_cache import create_recipe_cache, make_cache_key
+from stores import create_store
+from conversation import ConversationHistory
+from validation import ValidationPipeline, classify_recipe
+from llm_client import create_llm_client, LLMError
+from recipe_parser import RecipeStreamParser, iter_recipes, strip_code_fences
+from quantities import Ingredient, MacroVector
+from singleflight import SingleFlight, SingleFlightTimeout
+from recipe_index import RecipeIndex, missing_ingredients
+from prompts import get_prompt, compact_json, format_preferences, count_message_tokens, prompt_stats, PROMPT_VARIANT
+from metrics import REGISTRY, CONTENT_TYPE
+from logs import setup_logging
+from pantry_similarity import PantrySimilarityIndex
+from prefetch import RecipePrefetcher
+from meal_plan import BatchRunner, BatchRejected
+from admission import AdmissionController, TokenBucketLimiter, Overloaded
+from chat_cache import ChatReplyCache
+from assets import AssetPipeline, Asset, IMMUTABLE, content_hash
+
 load_dotenv()
 
 app = Flask(__name__)
 app.secret_key = "SUPER_SECRET_KEY"  # needed for Flask session usage
 
+# Behind a reverse proxy / router, take the client IP from X-Forwarded-For
+TRUST_PROXY = os.getenv('CHEFBOT_TRUST_PROXY', '0') == '1'
+if TRUST_PROXY:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1)
+
+# Static files are hashed and precompressed once at startup and served from
+# /assets/ with immutable caching. CHEFBOT_ASSETS=0 (e.g. while editing the
+# front end) falls back to plain /static/ and renders the index every time.
+ASSETS = None
+if os.getenv('CHEFBOT_ASSETS', '1') == '1':
+    ASSETS = AssetPipeline(os.path.join(app.root_path, 'static')).build()
+
+# The rendered index page, built on the first request
+INDEX_PAGE = None
+
+
+@app.template_global()
+def asset_url(filename):
+    """
+    Hashed /assets/ URL for a static file, or its plain /static/ URL.
+    """
+    url = ASSETS.url(filename) if ASSETS is not None else None
+    return url or url_for('static', filename=filename)
+
+# ----------------------------------------------------------------
+# INSTRUMENTATION
+# ----------------------------------------------------------------
+
+# Queued, leveled logging; CHEFBOT_LOG_LEVEL=DEBUG for per-call detail
+log = setup_logging(level=os.getenv('CHEFBOT_LOG_LEVEL', 'INFO'))
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    'chefbot_request_seconds', 'Request latency by route and chatbot command.', ('route', 'command', 'status'))
+LLM_CALLS = REGISTRY.counter(
+    'chefbot_llm_calls_total', 'LLM calls by prompt and outcome.', ('call', 'outcome'))
+LLM_RETRIES = REGISTRY.counter(
+    'chefbot_llm_retries_total', 'LLM attempts retried after a retryable error.', ('call',))
+LLM_QUEUE_SECONDS = REGISTRY.histogram(
+    'chefbot_llm_queue_seconds', 'Time waiting for an LLM concurrency slot.', ('call',))
+LLM_NETWORK_SECONDS = REGISTRY.histogram(
+    'chefbot_llm_network_seconds', 'Time waiting on the LLM backend.', ('call',))
+LLM_PARSE_SECONDS = REGISTRY.histogram(
+    'chefbot_llm_parse_seconds', 'Time parsing LLM replies.', ('call',))
+LLM_PROMPT_TOKENS = REGISTRY.counter(
+    'chefbot_llm_prompt_tokens_total', 'Estimated prompt tokens sent.', ('call',))
+LLM_COMPLETION_TOKENS = REGISTRY.counter(
+    'chefbot_llm_completion_tokens_total', 'Estimated completion tokens received.', ('call',))
+JSON_PARSE_FAILURES = REGISTRY.counter(
+    'chefbot_json_parse_failures_total', 'LLM replies or recipe objects that could not be parsed.', ('call',))
+VALIDATION_RETRIES = REGISTRY.counter(
+    'chefbot_validation_retries_total', 'Regeneration rounds for recipes that failed preference validation.')
+
+def _prompt_series(key):
+    return [({'variant': variant, 'prompt': name}, stats[key])
+            for variant, templates in prompt_stats().items() for name, stats in templates.items()]
+
+
+REGISTRY.callback('chefbot_prompt_variant', 'Prompt variant in use (CHEFBOT_PROMPT_VARIANT).',
+                  lambda: [({'variant': PROMPT_VARIANT}, 1)], labelnames=('variant',))
+REGISTRY.callback('chefbot_prompt_calls_total', 'Calls by prompt template and variant.',
+                  lambda: _prompt_series('calls'), kind='counter', labelnames=('variant', 'prompt'))
+REGISTRY.callback('chefbot_prompt_tokens_total', 'Estimated prompt tokens by template and variant.',
+                  lambda: _prompt_series('prompt_tokens'), kind='counter', labelnames=('variant', 'prompt'))
+REGISTRY.callback('chefbot_prompt_seconds_total', 'Wall time of calls by template and variant.',
+                  lambda: _prompt_series('seconds'), kind='counter', labelnames=('variant', 'prompt'))
+
+# "openai" for the real API, "fake" for the offline stand-in (load tests, dev)
+LLM_BACKEND = os.getenv('CHEFBOT_LLM_BACKEND', 'openai')
+
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
-if not OPENAI_API_KEY:
+if LLM_BACKEND == 'openai' and not OPENAI_API_KEY:
     raise ValueError("No OpenAI API key found. Please set OPENAI_API_KEY in your .env.")
 
-openai.api_key = OPENAI_API_KEY
+if LLM_BACKEND == 'fake':
+    llm_backend_options = {
+        'latency': float(os.getenv('CHEFBOT_FAKE_LATENCY', '0.05')),
+        'jitter': float(os.getenv('CHEFBOT_FAKE_JITTER', '0')),
+        'failure_rate': float(os.getenv('CHEFBOT_FAKE_FAILURE_RATE', '0')),
+        'seed': int(os.getenv('CHEFBOT_FAKE_SEED', '0')),
+    }
+    if os.getenv('CHEFBOT_FAKE_RESPONSES'):
+        with open(os.getenv('CHEFBOT_FAKE_RESPONSES')) as f:
+            llm_backend_options['responses'] = json.load(f)
+else:
+    llm_backend_options = {
+        'pool_size': int(os.getenv('CHEFBOT_LLM_POOL_SIZE', '32')),
+        'connect_timeout': float(os.getenv('CHEFBOT_LLM_CONNECT_TIMEOUT', '5')),
+        'read_timeout': float(os.getenv('CHEFBOT_LLM_READ_TIMEOUT', '60')),
+    }
+
+# Shared client for every GPT call: pooled connections, retries, concurrency cap
+LLM = create_llm_client(
+    LLM_BACKEND,
+    api_key=OPENAI_API_KEY,
+    max_concurrency=int(os.getenv('CHEFBOT_LLM_MAX_CONCURRENCY', '16')),
+    max_retries=int(os.getenv('CHEFBOT_LLM_MAX_RETRIES', '2')),
+    acquire_timeout=float(os.getenv('CHEFBOT_LLM_ACQUIRE_TIMEOUT', '30')),
+    observer=lambda call: observe_llm_call(call),
+    **llm_backend_options,
+)
 
 # ----------------------------------------------------------------
 # IN-MEMORY STORES
 # ----------------------------------------------------------------
 
+# "memory" keeps state per worker; "sqlite" shares it between all
+# gunicorn workers on the box so recipe IDs survive worker hops; "log"
+# keeps it in memory but appends every change to a log under
+# CHEFBOT_STATE_PATH (a directory), so it survives restarts and deploys.
+STATE_BACKEND = os.getenv('CHEFBOT_STATE_BACKEND', 'memory')
+STATE_PATH = os.getenv('CHEFBOT_STATE_PATH')
+STATE_LOG_OPTIONS = {
+    'compress': os.getenv('CHEFBOT_LOG_COMPRESS', '0') == '1',
+    'fsync': os.getenv('CHEFBOT_LOG_FSYNC', 'interval'),
+    'fsync_interval': float(os.getenv('CHEFBOT_LOG_FSYNC_INTERVAL', '1')),
+    'snapshot_bytes': int(os.getenv('CHEFBOT_LOG_SNAPSHOT_BYTES', str(32 * 1024 * 1024))),
+    'snapshot_interval': float(os.getenv('CHEFBOT_LOG_SNAPSHOT_INTERVAL', '3600')),
+    'lock_timeout': float(os.getenv('CHEFBOT_LOG_LOCK_TIMEOUT', '5')),
+    'touch_interval': float(os.getenv('CHEFBOT_LOG_TOUCH_INTERVAL', '30')),
+}
+
 # Maps recipe_id -> full recipe data generated by GPT
-RECIPES_STORE = {}
+RECIPES_STORE = create_store(
+    'recipes',
+    backend=STATE_BACKEND,
+    path=STATE_PATH,
+    log_options=STATE_LOG_OPTIONS,
+    max_entries=int(os.getenv('CHEFBOT_RECIPE_STORE_MAX_ENTRIES', '20000')),
+    max_bytes=int(os.getenv('CHEFBOT_RECIPE_STORE_MAX_BYTES', str(64 * 1024 * 1024))),
+    ttl=int(os.getenv('CHEFBOT_RECIPE_STORE_TTL', str(24 * 3600))),
+)
+
+# Maps session_id -> serialized ConversationHistory
+CONVERSATION_STORE = create_store(
+    'conversations',
+    backend=STATE_BACKEND,
+    path=STATE_PATH,
+    log_options=STATE_LOG_OPTIONS,
+    max_entries=int(os.getenv('CHEFBOT_CONVERSATION_STORE_MAX_ENTRIES', '10000')),
+    max_bytes=int(os.getenv('CHEFBOT_CONVERSATION_STORE_MAX_BYTES', str(32 * 1024 * 1024))),
+    ttl=int(os.getenv('CHEFBOT_CONVERSATION_STORE_TTL', str(6 * 3600))),
+    # Contexts change every turn, so never serve them from a stale local copy
+    read_cache_ttl=0,
+)
+
+if STATE_BACKEND == 'log':
+    for name, store in (('recipes', RECIPES_STORE), ('conversations', CONVERSATION_STORE)):
+        log_stats = store.log.stats()
+        if log_stats['read_only']:
+            log.info("State log for %s is owned by another process; appending to its log until "
+                     "this worker takes the lock over", name)
+        log.info("Restored %d %s (%d snapshot, %d log records) in %.3fs", len(store), name,
+                 log_stats['restored'], log_stats['replayed'], log_stats['restore_seconds'])
+
+# Local-rules-first preference validation with a hard retry/time budget
+VALIDATION_PIPELINE = ValidationPipeline(
+    model_check=lambda recipes, prefs: validate_recipes_with_gpt(recipes, prefs),
+    max_rounds=int(os.getenv('CHEFBOT_VALIDATION_MAX_ROUNDS', '2')),
+    time_budget=float(os.getenv('CHEFBOT_VALIDATION_TIME_BUDGET', '20')),
+)
+
+_VALIDATION_STAGE_CALLS = {'local': 'rounds', 'model': 'model_calls', 'regenerate': 'regenerate_calls'}
 
-# Maps session_id -> conversation context string
-CONVERSATION_STORE = {}
+
+def _validation_stage_seconds():
+    stats = VALIDATION_PIPELINE.stats()
+    return [({'stage': stage}, (stats['timings_ms'][stage] / 1000, stats[calls]))
+            for stage, calls in _VALIDATION_STAGE_CALLS.items()]
+
+
+REGISTRY.callback('chefbot_validation_stage_seconds', 'Time spent in each validation stage.',
+                  _validation_stage_seconds, kind='summary', labelnames=('stage',))
+REGISTRY.callback(
+    'chefbot_validation_recipes_total', 'Recipes checked by the validation pipeline, by verdict.',
+    lambda: [({'verdict': verdict}, VALIDATION_PIPELINE.stats()[verdict])
+             for verdict in ('passed', 'failed', 'ambiguous', 'dropped')],
+    kind='counter', labelnames=('verdict',))
+REGISTRY.callback('chefbot_validation_runs_total', 'Validation pipeline runs.',
+                  lambda: VALIDATION_PIPELINE.stats()['runs'], kind='counter')
+
+# Identical in-flight generations share one GPT call. Set
+# CHEFBOT_SINGLEFLIGHT_LOCK_DIR to also coalesce across workers (needs the
+# sqlite recipe cache so waiting workers can pick up the result).
+GENERATION_FLIGHTS = SingleFlight(
+    timeout=float(os.getenv('CHEFBOT_SINGLEFLIGHT_TIMEOUT', '60')),
+    lock_dir=os.getenv('CHEFBOT_SINGLEFLIGHT_LOCK_DIR'),
+    lock_stripes=int(os.getenv('CHEFBOT_SINGLEFLIGHT_LOCK_STRIPES', '256')),
+)
+# Retry-After (seconds) for a request whose shared generation timed out
+GENERATION_RETRY_AFTER = float(os.getenv('CHEFBOT_GENERATION_RETRY_AFTER', '5'))
+
+# "single": one completion for the whole batch.
+# "fanout": several small concurrent completions, merged by a deadline.
+GENERATION_MODE = os.getenv('CHEFBOT_GENERATION_MODE', 'single')
+FANOUT_RECIPES_PER_CALL = int(os.getenv('CHEFBOT_FANOUT_RECIPES_PER_CALL', '2'))
+FANOUT_DEADLINE = float(os.getenv('CHEFBOT_FANOUT_DEADLINE', '15'))
+# A meal-plan stream closes if no job finishes for this long (clients then poll)
+MEAL_PLAN_IDLE_TIMEOUT = float(os.getenv('CHEFBOT_MEAL_PLAN_IDLE_TIMEOUT', '120'))
+GENERATION_POOL = ThreadPoolExecutor(
+    max_workers=int(os.getenv('CHEFBOT_FANOUT_WORKERS', '16')),
+    thread_name_prefix='recipe-fanout',
+)
+
+# Per-session chat history limits (prompt tokens sent to GPT per chat call)
+CHAT_HISTORY_LIMITS = {
+    'max_turns': int(os.getenv('CHEFBOT_CHAT_MAX_TURNS', '20')),
+    'token_budget': int(os.getenv('CHEFBOT_CHAT_TOKEN_BUDGET', '2000')),
+}
+
+# Replies to context-independent chat questions, shared by all sessions
+# and keyed by the pinned recipe. CHEFBOT_CHAT_CACHE=0 turns it off.
+CHAT_CACHE = None
+if os.getenv('CHEFBOT_CHAT_CACHE', '1') == '1':
+    CHAT_CACHE = ChatReplyCache(
+        max_entries=int(os.getenv('CHEFBOT_CHAT_CACHE_MAX_ENTRIES', '5000')),
+        ttl=int(os.getenv('CHEFBOT_CHAT_CACHE_TTL', '3600')),
+    )
+
+# Every stored recipe, indexed by ingredient for strict-ingredient queries
+RECIPE_INDEX = RecipeIndex(max_docs=int(os.getenv('CHEFBOT_RECIPE_INDEX_MAX_DOCS', '50000')))
+
+# Caches generated recipe batches by normalized (ingredients, preferences)
+RECIPE_CACHE = create_recipe_cache(
+    backend=os.getenv('CHEFBOT_CACHE_BACKEND', 'memory'),
+    path=os.getenv('CHEFBOT_CACHE_PATH'),
+    ttl=int(os.getenv('CHEFBOT_CACHE_TTL', '3600')),
+    max_entries=int(os.getenv('CHEFBOT_CACHE_MAX_ENTRIES', '1000')),
+)
+
+# Maps generated pantries to their RECIPE_CACHE keys so near-duplicate
+# pantries (same preferences, Jaccard >= threshold) reuse the batch.
+# CHEFBOT_SIMILARITY_THRESHOLD=1 turns this back into exact matching.
+PANTRY_INDEX = PantrySimilarityIndex(
+    threshold=float(os.getenv('CHEFBOT_SIMILARITY_THRESHOLD', '0.75')),
+    num_perm=int(os.getenv('CHEFBOT_SIMILARITY_NUM_PERM', '64')),
+    bands=int(os.getenv('CHEFBOT_SIMILARITY_BANDS', '16')),
+    max_entries=int(os.getenv('CHEFBOT_SIMILARITY_MAX_ENTRIES', '100000')),
+)
+
+# Optional: after /get_recipes, generate the session's next "I want new
+# recipes" batch in the background so that request is served from memory
+PREFETCHER = None
+if os.getenv('CHEFBOT_PREFETCH', '0') == '1':
+    PREFETCHER = RecipePrefetcher(
+        generate=lambda ingredients, preferences: generate_recipes(ingredients, preferences, fresh_call=True),
+        max_workers=int(os.getenv('CHEFBOT_PREFETCH_WORKERS', '4')),
+        max_in_flight=int(os.getenv('CHEFBOT_PREFETCH_MAX_IN_FLIGHT', '8')),
+        per_session_limit=int(os.getenv('CHEFBOT_PREFETCH_PER_SESSION', '2')),
+        ttl=float(os.getenv('CHEFBOT_PREFETCH_TTL', '600')),
+    )
+    REGISTRY.callback(
+        'chefbot_prefetch_events_total', 'Prefetch outcomes (hits, joined, misses, cancelled, ...).',
+        lambda: [({'event': key}, value) for key, value in PREFETCHER.stats().items()
+                 if key in PREFETCHER.counters],
+        kind='counter', labelnames=('event',))
+    REGISTRY.callback('chefbot_prefetch_in_flight', 'Prefetches queued or running.',
+                      lambda: PREFETCHER.stats()['in_flight'])
+
+# Bulk meal-planning batches (/meal_plan), on their own bounded pool so
+# they can't take every LLM slot from interactive requests. Batches run in
+# the worker that took them; with the sqlite backend their status is also
+# written to the shared database, so GET /meal_plan/<id> works on any
+# worker. Otherwise the router must send polls to the same worker.
+MEAL_PLAN_TTL = float(os.getenv('CHEFBOT_MEAL_PLAN_TTL', '3600'))
+MEAL_PLAN_STATUS_STORE = None
+if STATE_BACKEND == 'sqlite':
+    MEAL_PLAN_STATUS_STORE = create_store(
+        'meal_plans',
+        backend=STATE_BACKEND,
+        path=STATE_PATH,
+        max_entries=int(os.getenv('CHEFBOT_MEAL_PLAN_STORE_MAX_ENTRIES', '100000')),
+        max_bytes=int(os.getenv('CHEFBOT_MEAL_PLAN_STORE_MAX_BYTES', str(64 * 1024 * 1024))),
+        ttl=MEAL_PLAN_TTL,
+        # Progress changes with every job, so always read the database
+        read_cache_ttl=0,
+    )
+MEAL_PLANS = BatchRunner(
+    run_job=lambda job: run_meal_plan_job(job),
+    max_workers=int(os.getenv('CHEFBOT_MEAL_PLAN_WORKERS', '4')),
+    max_jobs_per_batch=int(os.getenv('CHEFBOT_MEAL_PLAN_MAX_JOBS', '500')),
+    max_pending=int(os.getenv('CHEFBOT_MEAL_PLAN_MAX_PENDING', '2000')),
+    ttl=MEAL_PLAN_TTL,
+    status_store=MEAL_PLAN_STATUS_STORE,
+)
+REGISTRY.callback(
+    'chefbot_meal_plan_jobs_total', 'Meal-plan jobs by outcome.',
+    lambda: [({'outcome': 'submitted'}, MEAL_PLANS.stats()['jobs']),
+             ({'outcome': 'failed'}, MEAL_PLANS.stats()['failed'])],
+    kind='counter', labelnames=('outcome',))
+REGISTRY.callback('chefbot_meal_plan_jobs_pending', 'Meal-plan jobs queued or running.',
+                  lambda: MEAL_PLANS.stats()['pending'])
+
+# ----------------------------------------------------------------
+# ADMISSION CONTROL
+# ----------------------------------------------------------------
+
+ADMISSION_ENABLED = os.getenv('CHEFBOT_ADMISSION', '1') == '1'
+
+# Per route: queue priority (lower is served first), whether it calls the
+# LLM, and the token bucket per session (requests/sec, burst). Each client
+# IP gets CHEFBOT_IP_RATE_MULTIPLIER times the session allowance, but only
+# with CHEFBOT_TRUST_PROXY: behind a router without it every request has
+# the router's address and the IP bucket would be one global limit.
+ADMISSION_POLICIES = {
+    '/see_more': {'priority': 0, 'llm': False, 'rate': 10.0, 'burst': 30},
+    '/get_recipes': {'priority': 1, 'llm': True, 'rate': 0.5, 'burst': 5},
+    '/chatbot': {'priority': 2, 'llm': True, 'rate': 1.0, 'burst': 10},
+    '/chatbot_stream': {'priority': 2, 'llm': True, 'rate': 1.0, 'burst': 10},
+    '/meal_plan': {'priority': 3, 'llm': True, 'rate': 0.05, 'burst': 2},
+}
+IP_RATE_MULTIPLIER = float(os.getenv('CHEFBOT_IP_RATE_MULTIPLIER', '10'))
+SESSION_LIMITERS = {
+    route: TokenBucketLimiter(policy['rate'], policy['burst'])
+    for route, policy in ADMISSION_POLICIES.items()
+}
+IP_LIMITERS = {
+    route: TokenBucketLimiter(policy['rate'] * IP_RATE_MULTIPLIER, policy['burst'] * IP_RATE_MULTIPLIER)
+    for route, policy in ADMISSION_POLICIES.items()
+}
+
+# Keep max_active below the gunicorn thread count so shed responses can still be served
+ADMISSION = AdmissionController(
+    max_active=int(os.getenv('CHEFBOT_ADMISSION_MAX_ACTIVE', '80')),
+    max_llm=int(os.getenv('CHEFBOT_ADMISSION_MAX_LLM', '32')),
+    max_queue=int(os.getenv('CHEFBOT_ADMISSION_MAX_QUEUE', '128')),
+    queue_timeout=float(os.getenv('CHEFBOT_ADMISSION_QUEUE_TIMEOUT', '5')),
+)
+ADMISSION_SHED = REGISTRY.counter(
+    'chefbot_admission_shed_total', 'Requests refused with 429 by route and reason.', ('route', 'reason'))
+ADMISSION_WAIT_SECONDS = REGISTRY.histogram(
+    'chefbot_admission_wait_seconds', 'Time admitted requests spent in the wait queue.', ('route',))
+REGISTRY.callback(
+    'chefbot_admission_requests', 'Requests running or waiting for admission.',
+    lambda: [({'state': 'active'}, ADMISSION.active), ({'state': 'active_llm'}, ADMISSION.active_llm),
+             ({'state': 'waiting'}, ADMISSION.stats()['waiting'])],
+    labelnames=('state',))
+
+if CHAT_CACHE is not None:
+    REGISTRY.callback(
+        'chefbot_chat_cache_lookups_total', 'Chat reply cache lookups by result.',
+        lambda: [({'result': result}, CHAT_CACHE.stats()[key])
+                 for result, key in (('hit', 'hits'), ('miss', 'misses'), ('bypass', 'bypassed'))],
+        kind='counter', labelnames=('result',))
+    REGISTRY.callback(
+        'chefbot_chat_cache_saved_tokens_total', 'Estimated tokens not sent or generated thanks to cache hits.',
+        lambda: [({'kind': 'prompt'}, CHAT_CACHE.stats()['saved_prompt_tokens']),
+                 ({'kind': 'completion'}, CHAT_CACHE.stats()['saved_completion_tokens'])],
+        kind='counter', labelnames=('kind',))
+
+if STATE_BACKEND == 'log':
+    REGISTRY.callback(
+        'chefbot_state_log_events_total', 'State log records, fsyncs, snapshots and lock take-overs by store.',
+        lambda: [({'store': name, 'event': event}, store.log.stats()[event])
+                 for name, store in (('recipes', RECIPES_STORE), ('conversations', CONVERSATION_STORE))
+                 for event in ('appended', 'touches', 'fsyncs', 'snapshots', 'dropped', 'promotions', 'merged')],
+        kind='counter', labelnames=('store', 'event'))
+
+# Sizes are read from each component's stats() at scrape time
+REGISTRY.callback(
+    'chefbot_store_entries', 'Entries held by each store.',
+    lambda: [({'store': name}, stats['entries']) for name, stats in store_stats()], labelnames=('store',))
+REGISTRY.callback(
+    'chefbot_store_bytes', 'Approximate bytes held by each store.',
+    lambda: [({'store': name}, stats['bytes']) for name, stats in store_stats() if 'bytes' in stats],
+    labelnames=('store',))
+REGISTRY.callback(
+    'chefbot_store_evictions_total', 'Entries evicted from each store by reason (ttl, entries, bytes).',
+    lambda: [({'store': name, 'reason': reason}, count) for name, reason, count in store_evictions()],
+    kind='counter', labelnames=('store', 'reason'))
+REGISTRY.callback(
+    'chefbot_recipe_cache_lookups_total', 'Recipe cache lookups by result.',
+    lambda: [({'result': 'hit'}, RECIPE_CACHE.stats()['hits']), ({'result': 'miss'}, RECIPE_CACHE.stats()['misses'])],
+    kind='counter', labelnames=('result',))
+REGISTRY.callback(
+    'chefbot_generations_in_flight', 'Recipe generations currently running in this worker.',
+    GENERATION_FLIGHTS.in_flight)
+REGISTRY.callback(
+    'chefbot_generation_flights_total', 'Coalesced generation outcomes (executions, coalesced, timeouts, ...).',
+    lambda: [({'event': key}, value) for key, value in GENERATION_FLIGHTS.stats().items()
+             if key in GENERATION_FLIGHTS.counters],
+    kind='counter', labelnames=('event',))
 
 # ----------------------------------------------------------------
 # MAIN ROUTES
 # ----------------------------------------------------------------
 
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.command = None
+
+
+@app.before_request
+def admit_request():
+    """
+    Rate-limit by client IP (when it can be trusted) and session, then wait
+    for a slot in the admission queue. Refused requests get 429 +
+    Retry-After right away.
+    """
+    if not ADMISSION_ENABLED or request.url_rule is None:
+        return None
+    route = request.url_rule.rule
+    policy = ADMISSION_POLICIES.get(route)
+    if policy is None:
+        return None
+
+    checks = [('rate_session', SESSION_LIMITERS[route], get_or_create_session_id())]
+    if TRUST_PROXY:
+        checks.insert(0, ('rate_ip', IP_LIMITERS[route], request.remote_addr or 'unknown'))
+    for reason, limiter, key in checks:
+        wait_for = limiter.take(key)
+        if wait_for:
+            return shed_request(route, Overloaded(reason, wait_for))
+
+    try:
+        waited = ADMISSION.acquire(policy['priority'], llm=policy['llm'])
+    except Overloaded as e:
+        return shed_request(route, e)
+    ADMISSION_WAIT_SECONDS.observe(waited, route=route)
+    g.admission = (policy['llm'], time.monotonic())
+    return None
+
+
+@app.teardown_request
+def release_admission(error=None):
+    admitted = g.pop('admission', None)
+    if admitted is not None:
+        llm, started = admitted
+        ADMISSION.release(llm, held=time.monotonic() - started)
+
+
+@app.after_request
+def flush_stores(response):
+    """
+    Commit any buffered store writes before the response goes out,
+    so the next request can land on any worker.
+    """
+    RECIPES_STORE.flush()
+    CONVERSATION_STORE.flush()
+    RECIPE_CACHE.flush()
+    g.status = response.status_code
+    return response
+
+
+@app.teardown_request
+def record_request_latency(error=None):
+    """
+    Observe request latency. For streamed responses this runs once the
+    stream has finished, so it covers the whole reply.
+    """
+    started = g.get('request_started')
+    if started is None:
+        return
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    REQUEST_SECONDS.observe(
+        time.perf_counter() - started,
+        route=route,
+        command=g.get('command') or 'none',
+        status=500 if error is not None else g.get('status', 500),
+    )
+
+
+@app.route('/metrics')
+def metrics():
+    """
+    Prometheus text exposition of this worker's metrics.
+    """
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+
 @app.route('/')
 def index():
     """
     Render the main page with the ingredient selection UI and chat interface.
+    The page only changes on deploy, so it is rendered once and revalidated by ETag.
     """
-    return render_template('index.html')
+    global INDEX_PAGE
+    if ASSETS is None:
+        return render_template('index.html')
+    if INDEX_PAGE is None:
+        INDEX_PAGE = Asset('index.html', render_template('index.html').encode('utf-8'), 'text/html')
+    return send_asset(INDEX_PAGE, 'no-cache')
+
+
+@app.route('/assets/<path:filename>')
+def hashed_asset(filename):
+    """
+    Serve a content-hashed static file, precompressed when the client allows.
+    """
+    asset = ASSETS.get(filename) if ASSETS is not None else None
+    if asset is None:
+        return Response('Not found', status=404, mimetype='text/plain')
+    return send_asset(asset, IMMUTABLE)
 
 
 @app.route('/get_recipes', methods=['POST'])
@@ -55,23 +545,21 @@ def get_recipes():
 
     session_id = get_or_create_session_id()
 
-    # Generate recipes with GPT (3 recipes)
-    new_recipes = generate_recipes_with_gpt(ingredients, preferences, fresh_call=False)
+    # Generate recipes with GPT (or reuse a cached batch for the same or a similar pantry)
+    try:
+        new_recipes, match = get_cached_recipes(ingredients, preferences, fresh_call=False)
+    except Overloaded as e:
+        return shed_request('/get_recipes', e)
     if not new_recipes:
         return jsonify({'error': 'No recipes generated by GPT.'}), 404
 
     # Store each recipe in memory by ID
-    minimal_data = []
-    for recipe in new_recipes:
-        recipe_id = str(uuid.uuid4())[:8]  # short random ID
-        recipe['id'] = recipe_id
-        RECIPES_STORE[recipe_id] = recipe
-        minimal_data.append({
-            'id': recipe_id,
-            'title': recipe.get('title', 'Untitled Recipe'),
-        })
+    minimal_data = store_recipes(new_recipes)
 
-    return jsonify({'recipes': minimal_data})
+    if PREFETCHER is not None:
+        PREFETCHER.schedule(session_id, ingredients, preferences)
+
+    return jsonify({'recipes': minimal_data, 'match': match})
 
 
 @app.route('/see_more', methods=['POST'])
@@ -89,7 +577,9 @@ def see_more():
     if not recipe:
         return jsonify({'error': 'Recipe not found.'}), 404
 
-    return jsonify({
+    # Stored recipes never change, so the client can revalidate its copy
+    # with If-None-Match and get an empty 304 back
+    body = compact_json({
         'info': {
             'title': recipe.get('title', 'Untitled'),
             'ingredients': recipe.get('ingredients', []),
@@ -97,7 +587,15 @@ def see_more():
             'instructions': recipe.get('instructions', 'No instructions'),
             'servings': recipe.get('servings', 2)
         }
-    })
+    }).encode('utf-8')
+    etag = content_hash(body)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 
 @app.route('/chatbot', methods=['POST'])
@@ -125,7 +623,8 @@ def chatbot():
         return jsonify({'error': 'No message provided.'}), 400
 
     session_id = get_or_create_session_id()
-    context = CONVERSATION_STORE.get(session_id, "")
+    history = load_history(session_id)
+    context = history.render_context()
 
     user_message_lower = user_message.lower()
 
@@ -134,23 +633,27 @@ def chatbot():
     # ----------------------------------------------------------------
     # This should clear the conversation context, generate new recipes, and list them at the top.
     if user_message_lower == 'i want new recipes':
+        g.command = 'new_recipes'
         # Clear conversation context
-        CONVERSATION_STORE[session_id] = ""
+        history.clear()
+        save_history(session_id, history)
         context = ""
 
-        new_recipes = generate_recipes_with_gpt(ingredients, preferences, fresh_call=True)
+        new_recipes = None
+        if PREFETCHER is not None:
+            if 'preferences' not in data:
+                # Older pages don't resend them; use the ones the prefetch was made for
+                preferences = PREFETCHER.preferences(session_id) or preferences
+            new_recipes = PREFETCHER.take(session_id, ingredients, preferences)
+        if not new_recipes:
+            new_recipes = generate_recipes(ingredients, preferences, fresh_call=True)
         if not new_recipes:
             return jsonify({'reply': "I'm sorry, I couldn't generate any new recipes.", 'context': context})
 
-        minimal_data = []
-        for recipe in new_recipes:
-            recipe_id = str(uuid.uuid4())[:8]
-            recipe['id'] = recipe_id
-            RECIPES_STORE[recipe_id] = recipe
-            minimal_data.append({
-                'id': recipe_id,
-                'title': recipe.get('title', 'Untitled Recipe'),
-            })
+        minimal_data = store_recipes(new_recipes)
+        if PREFETCHER is not None:
+            # Have the batch after this one ready too
+            PREFETCHER.schedule(session_id, ingredients, preferences)
 
         return jsonify({
             'reply': "Here are some **brand new** recipes from GPT!",
@@ -162,6 +665,7 @@ def chatbot():
     # SPECIAL COMMAND: "CHOOSE_RECIPE_{id}__SERVINGS_{servings}"
     # ----------------------------------------------------------------
     if user_message_lower.startswith('choose_recipe_'):
+        g.command = 'choose_recipe'
         try:
             parts = user_message.split('__SERVINGS_')
             left = parts[0]  # e.g. "CHOOSE_RECIPE_abc123"
@@ -169,43 +673,28 @@ def chatbot():
             servings = int(servings_str)
 
             recipe_id = left.split('_')[-1]
-            recipe_info = RECIPES_STORE.get(recipe_id)
+            # Scaled from the stored original; the stored recipe is never changed
+            recipe_info = RECIPES_STORE.get_scaled(recipe_id, servings)
             if not recipe_info:
                 return jsonify({'reply': "Sorry, I couldn't find that recipe in memory.", 'context': context})
 
-            # Scale the recipe if needed
-            original_servings = recipe_info.get('servings', 2)
-            if servings != original_servings and original_servings > 0:
-                scale_factor = servings / original_servings
-
-                scaled_ingredients = []
-                for ing in recipe_info.get('ingredients', []):
-                    scaled_ingredients.append(scale_ingredient(ing, scale_factor))
-                recipe_info['ingredients'] = scaled_ingredients
-
-                if 'macros' in recipe_info:
-                    recipe_info['macros'] = scale_macros(recipe_info['macros'], scale_factor)
-
-                recipe_info['servings'] = servings
-
             # Build a details message to reply with
             reply_msg = generate_recipe_details_msg(recipe_info)
 
-            # We incorporate these details into context for future GPT conversation
-            updated_context = context + f"\nCHOSEN_RECIPE_DETAILS:\n{reply_msg}\n"
-            CONVERSATION_STORE[session_id] = updated_context
+            # Pin these details into the history for future GPT conversation
+            history.pin_recipe(reply_msg)
+            save_history(session_id, history)
 
-            return jsonify({'reply': reply_msg, 'context': updated_context})
+            return jsonify({'reply': reply_msg, 'context': history.render_context()})
         except Exception as e:
-            print("Error parsing CHOOSE_RECIPE command:", e)
+            log.warning("Error parsing CHOOSE_RECIPE command: %s", e)
             return jsonify({'reply': "Error: invalid recipe choose command.", 'context': context})
 
-
-    #Används inte just nu.
     # ----------------------------------------------------------------
     # If user explicitly says: "I want a recipe with chicken and rice", do strict
     # ----------------------------------------------------------------
     if user_message_lower.startswith("i want a recipe with "):
+        g.command = 'strict_recipe'
         # Extract everything after 'with'
         after_with = user_message_lower.replace("i want a recipe with", "").strip()
         # naive approach => split on "and" or ","
@@ -219,15 +708,7 @@ def chatbot():
                 'context': context
             })
 
-        minimal_data = []
-        for recipe in strict_recipes:
-            recipe_id = str(uuid.uuid4())[:8]
-            recipe['id'] = recipe_id
-            RECIPES_STORE[recipe_id] = recipe
-            minimal_data.append({
-                'id': recipe_id,
-                'title': recipe.get('title', 'Untitled Recipe'),
-            })
+        minimal_data = store_recipes(strict_recipes)
 
         return jsonify({
             'reply': f"Here are strictly matched recipes with: {', '.join(requested_ings)}",
@@ -238,19 +719,157 @@ def chatbot():
     # ----------------------------------------------------------------
     # NORMAL CONVERSATION with GPT (just a chat)
     # ----------------------------------------------------------------
-    updated_context = context + f"\nUser: {user_message}\n"
+    g.command = 'chat'
+    history.add('user', user_message)
     try:
-        gpt_reply = call_gpt_chat(updated_context)
-        updated_context += f"Assistant: {gpt_reply}\n"
-        CONVERSATION_STORE[session_id] = updated_context
-        return jsonify({'reply': gpt_reply, 'context': updated_context})
+        gpt_reply = lookup_chat_reply(history, user_message)
+        cached = gpt_reply is not None
+        if not cached:
+            gpt_reply = call_gpt_chat(history)
+            remember_chat_reply(history, user_message, gpt_reply)
+        history.add('assistant', gpt_reply)
+        save_history(session_id, history)
+        return jsonify({'reply': gpt_reply, 'context': history.render_context(), 'cached': cached})
+    except LLMError as e:
+        if e.retryable:
+            # Upstream is rate limiting or overloaded: say when to retry instead of a generic error
+            return shed_request('/chatbot', Overloaded('upstream', e.retry_after or 5))
+        return jsonify({'reply': f"An error occurred: {str(e)}", 'context': history.render_context()})
     except Exception as e:
-        return jsonify({'reply': f"An error occurred: {str(e)}", 'context': updated_context})
+        return jsonify({'reply': f"An error occurred: {str(e)}", 'context': history.render_context()})
+
+
+@app.route('/chatbot_stream', methods=['POST'])
+def chatbot_stream():
+    """
+    Streaming variant of /chatbot for normal conversation. Sends GPT's reply
+    as Server-Sent Events while it is generated:
+
+    - "token" events carry the next piece of the reply
+    - a final "done" event carries the full reply and the updated context
+    - an "error" event is sent instead of "done" if GPT fails
+
+    Special commands are not streamed; they get the regular /chatbot JSON.
+    """
+    data = request.get_json()
+    user_message = data.get('message', '').strip()
+    user_message_lower = user_message.lower()
+
+    if (not user_message
+            or user_message_lower == 'i want new recipes'
+            or user_message_lower.startswith('choose_recipe_')
+            or user_message_lower.startswith('i want a recipe with ')):
+        return chatbot()
+
+    g.command = 'chat'
+    session_id = get_or_create_session_id()
+    history = load_history(session_id)
+    history.add('user', user_message)
+    cached_reply = lookup_chat_reply(history, user_message)
+
+    def generate():
+        if cached_reply is not None:
+            gpt_reply = cached_reply
+            yield sse_event('token', {'token': gpt_reply})
+        else:
+            reply_parts = []
+            try:
+                for token in stream_gpt_chat(history):
+                    reply_parts.append(token)
+                    yield sse_event('token', {'token': token})
+            except Exception as e:
+                yield sse_event('error', {'reply': f"An error occurred: {str(e)}", 'context': history.render_context()})
+                return
+            gpt_reply = "".join(reply_parts).strip()
+            remember_chat_reply(history, user_message, gpt_reply)
+
+        history.add('assistant', gpt_reply)
+        # after_request has already run by now, so commit the context here
+        save_history(session_id, history)
+        CONVERSATION_STORE.flush()
+        yield sse_event('done', {'reply': gpt_reply, 'context': history.render_context()})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+@app.route('/meal_plan', methods=['POST'])
+def meal_plan():
+    """
+    Generate recipes for many pantries in one request.
+
+    Body: {"jobs": [{"ingredients": [...], "preferences": {...}, "count": 5}, ...],
+           "stream": true}
+
+    With "stream" (the default) the response is NDJSON: a header line with
+    the batch_id, one line per job as it finishes (in completion order,
+    "job" is its index in the request), and a final summary line.
+    Otherwise it returns 202 with the batch_id to poll GET /meal_plan/<id>.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        batch = MEAL_PLANS.submit(data.get('jobs'))
+    except BatchRejected as e:
+        return jsonify({'error': str(e)}), e.status
+
+    status_url = f"/meal_plan/{batch.id}"
+    if not data.get('stream', True):
+        return jsonify(dict(batch.summary(), status_url=status_url)), 202
+
+    def generate():
+        yield json.dumps(dict(batch.summary(), status_url=status_url)) + "\n"
+        for result in MEAL_PLANS.iter_results(batch, timeout=MEAL_PLAN_IDLE_TIMEOUT):
+            yield json.dumps(result) + "\n"
+        # Stream ended early (idle timeout) => done is false; poll status_url
+        yield json.dumps(MEAL_PLANS.status(batch, since=batch.total)) + "\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={'X-Batch-Id': batch.id, 'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+@app.route('/meal_plan/<batch_id>', methods=['GET'])
+def meal_plan_status(batch_id):
+    """
+    Progress of a meal-plan batch plus job results from ?since=N on.
+    """
+    since = max(request.args.get('since', 0, type=int), 0)
+    batch = MEAL_PLANS.get(batch_id)
+    if batch is not None:
+        return jsonify(MEAL_PLANS.status(batch, since=since))
+    # Run by another worker: answer from the shared status store, if any
+    status = MEAL_PLANS.lookup(batch_id, since=since)
+    if status is not None:
+        return jsonify(status)
+    error = 'Unknown or expired batch.'
+    if MEAL_PLAN_STATUS_STORE is None:
+        error += (' Batch status is kept by the worker that ran the batch, so polls must be routed'
+                  ' to it (sticky sessions), or set CHEFBOT_STATE_BACKEND=sqlite to share it.')
+    return jsonify({'error': error}), 404
 
 # ----------------------------------------------------------------
 # HELPER FUNCTIONS
 # ----------------------------------------------------------------
 
+def shed_request(route, overloaded):
+    """
+    429 response for a refused request, with a Retry-After hint.
+    """
+    ADMISSION_SHED.inc(route=route, reason=overloaded.reason)
+    retry_after = max(1, math.ceil(overloaded.retry_after))
+    response = jsonify({
+        'error': "ChefBot is busy right now, please try again in a few seconds.",
+        'retry_after': retry_after,
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
 def get_or_create_session_id():
     """
     Retrieve or create a session_id for the user.
@@ -260,227 +879,472 @@ def get_or_create_session_id():
     return session['session_id']
 
 
-def call_gpt_chat(context):
+def store_recipes(recipes):
     """
-    Uses the OpenAI ChatCompletion endpoint to continue the conversation
-    based on the context. Returns GPT's reply as text.
+    Give each recipe a short random ID, store it in RECIPES_STORE and add it
+    to RECIPE_INDEX. Returns the minimal info (id, title) for the client.
     """
-    system_instructions = (
-        "You are ChefBot, a helpful cooking assistant. "
-        "Generate or discuss recipes based on user questions. "
-        "If CHOSEN_RECIPE_DETAILS is in the context, you can reference it. "
-        "Use JSON or structured text where relevant."
-    )
+    minimal_data = []
+    for recipe in recipes:
+        recipe_id = str(uuid.uuid4())[:8]  # short random ID
+        recipe['id'] = recipe_id
+        RECIPE_INDEX.add(recipe)
+        minimal_data.append({
+            'id': recipe_id,
+            'title': recipe.get('title', 'Untitled Recipe'),
+        })
+    # One bulk insert per batch
+    RECIPES_STORE.set_many((recipe['id'], recipe) for recipe in recipes)
+    return minimal_data
 
-    messages = [
-        {"role": "system", "content": system_instructions},
-        {"role": "assistant", "content": context},
-    ]
 
-    response = openai.chat.completions.create(
-        model='gpt-3.5-turbo',
-        messages=messages,
-        max_tokens=300,
-        temperature=0.7,
-    )
-    return response.choices[0].message.content.strip()
+def run_meal_plan_job(job):
+    """
+    One meal-plan job: the cached / coalesced batch for the pantry, topped
+    up with fresh recipes if more were asked for, stored in one bulk insert.
+    """
+    recipes, match = get_cached_recipes(job['ingredients'], job['preferences'])
+    recipes = recipes[:job['count']]
+    if len(recipes) < job['count']:
+        recipes += generate_recipes(
+            job['ingredients'], job['preferences'], fresh_call=True, count=job['count'] - len(recipes)
+        )
+    if not recipes:
+        raise RuntimeError("No recipes generated by GPT.")
+    store_recipes(recipes)
+    # Background thread: no after_request hook will commit these
+    RECIPES_STORE.flush()
+    return {'recipes': recipes, 'match': match}
 
 
-def generate_recipes_with_gpt(ingredients, preferences, fresh_call=False):
+def load_history(session_id):
     """
-    Generates 5 recipes using GPT. We use few-shot style prompts to ensure
-    the output is in valid JSON.
+    Load the ConversationHistory for a session (empty if there is none).
     """
-    print("\n[DEBUG] generate_recipes_with_gpt() called")
-    print(f"[DEBUG] ingredients={ingredients}, preferences={preferences}, fresh_call={fresh_call}")
+    return ConversationHistory.from_dict(CONVERSATION_STORE.get(session_id), **CHAT_HISTORY_LIMITS)
 
-    #system_instructions = (
-    #    "You are ChefBot, a helpful cooking assistant. "
-    #    "You provide ONLY valid JSON with keys: title, ingredients, macros, instructions, servings. "
-    #    "No extra text outside JSON."
-    #)
-    
-    system_instructions = (
-    "You are ChefBot, a helpful and knowledgeable cooking assistant. "
-    "Your goal is to generate high-quality, creative, and well-balanced recipes based on user input. "
-    "Follow these steps before providing the final JSON response:\n\n"
 
-    "1 **Analyze Ingredients:** Carefully review the given ingredients and think about their compatibility. "
-    "Consider common cooking techniques that work well for these ingredients.\n\n"
+def save_history(session_id, history):
+    CONVERSATION_STORE[session_id] = history.to_dict()
 
-    "2 **Select a Recipe Style:** Decide if the recipe should be a salad, soup, main dish, or side dish. "
-    "Choose based on ingredient suitability and cooking methods.\n\n"
 
-    "3 **Ensure Nutritional Balance:** Make sure the recipe includes a balance of proteins, carbs, and healthy fats. "
-    "If an ingredient list lacks a key macronutrient, suggest minor improvements.\n\n"
+def get_cached_recipes(ingredients, preferences, fresh_call=False):
+    """
+    Cache-aware wrapper around generate_recipes_with_gpt.
+    Fresh calls ("I want new recipes") always bypass the cache; an exact
+    miss falls back to the most similar cached pantry (PANTRY_INDEX), and
+    remaining misses for the same key are coalesced by GENERATION_FLIGHTS.
+
+    Returns (recipes, match), where match says where the batch came from:
+    {'source': 'generated' | 'exact' | 'similar', 'similarity': float}.
+    Raises Overloaded if the shared generation timed out with nothing cached.
+    """
+    if fresh_call:
+        return generate_recipes(ingredients, preferences, fresh_call=True), {'source': 'generated', 'similarity': 0.0}
 
-    "4 **Check Flavor Pairings:** Consider how the ingredients will taste together. "
-    "Use herbs, spices, and seasoning to enhance flavors without overpowering the dish.\n\n"
+    cache_key = make_cache_key(ingredients, preferences, fresh_call)
+    cached, match = lookup_cached_recipes(cache_key, ingredients, preferences)
+    if cached is not None:
+        return cached, match
 
-    "5 **Generate a Step-by-Step Cooking Process:** Provide clear, structured cooking instructions. "
-    "Ensure that steps follow a logical order and are easy to follow.\n\n"
+    def generate_and_cache():
+        recipes = generate_recipes(ingredients, preferences, fresh_call=False)
+        if recipes:
+            RECIPE_CACHE.set(cache_key, recipes)
+            PANTRY_INDEX.add(ingredients, preferences, cache_key)
+        return recipes
 
-    "6 **Format the Response as JSON:** Provide ONLY valid JSON with the following keys: "
-    "'title', 'ingredients', 'macros', 'instructions', and 'servings'. "
-    "DO NOT include explanations, comments, or extra text outside of the JSON response.\n"
-)
+    # Concurrent identical requests (e.g. a double-clicked button) share one call
+    try:
+        recipes = GENERATION_FLIGHTS.do(cache_key, generate_and_cache, lookup=lambda: RECIPE_CACHE.get(cache_key))
+    except SingleFlightTimeout:
+        # Only the leader generates: piling more calls onto a slow upstream
+        # makes it slower. Take whatever got cached meanwhile, else ask the
+        # client to retry.
+        cached, match = lookup_cached_recipes(cache_key, ingredients, preferences)
+        if cached is not None:
+            return cached, match
+        log.warning("Timed out waiting for an in-flight generation")
+        raise Overloaded('upstream', GENERATION_RETRY_AFTER)
+    # Every caller gets its own copy, since callers assign recipe IDs in place
+    return copy.deepcopy(recipes), {'source': 'generated', 'similarity': round(match['similarity'], 3)}
+
+
+def lookup_cached_recipes(cache_key, ingredients, preferences):
+    """
+    Cached batch for this exact pantry, or else for the most similar one.
+    Returns (recipes, match), with recipes None on a miss.
+    """
+    cached = RECIPE_CACHE.get(cache_key)
+    if cached is not None:
+        return cached, {'source': 'exact', 'similarity': 1.0}
+
+    similar_key, similarity = PANTRY_INDEX.lookup(ingredients, preferences)
+    if similar_key is not None:
+        cached = RECIPE_CACHE.get(similar_key)
+        if cached is not None:
+            log.debug("Reusing recipes from a similar pantry (similarity=%.2f)", similarity)
+            return cached, {'source': 'similar', 'similarity': round(similarity, 3)}
+        # The batch expired from the cache; stop matching against it
+        PANTRY_INDEX.discard(similar_key)
+    return None, {'source': 'generated', 'similarity': similarity}
+
+
+def generate_recipes(ingredients, preferences, fresh_call=False, count=5):
+    """
+    Generate a batch of recipes using the configured GENERATION_MODE.
+    """
+    if GENERATION_MODE == 'fanout':
+        return generate_recipes_fanout(ingredients, preferences, fresh_call, count)
+    return generate_recipes_with_gpt(ingredients, preferences, fresh_call=fresh_call, count=count)
 
 
-    # Few-shot examples:
-    example_user_1 = "I want new recipes."
-    example_assistant_1 = (
-        '[\n'
-        '  {\n'
-        '    "title": "Cheesy Tomato & Onion Bake",\n'
-        '    "ingredients": ["2 tomatoes", "1 onion", "1 cup cheese"],\n'
-        '    "macros": "Calories: 300, Fat: 15g, Protein: 12g, Carbs: 28g",\n'
-        '    "instructions": "1. Preheat oven to 200°C. 2. Slice tomatoes and onions. 3. Layer slices in a baking dish, sprinkling cheese between layers. 4. Bake for 20 minutes until cheese is melted and golden.",\n'
-        '    "servings": 2\n'
-        '  }\n'
-        ']'
-    )
+def generate_recipes_fanout(ingredients, preferences, fresh_call=False, count=5,
+                            per_call=None, deadline=None):
+    """
+    Split one batch into several small concurrent GPT calls (per_call recipes
+    each) and merge results as they complete. Returns whatever is ready when
+    the deadline (seconds) passes, with duplicate titles removed.
+    """
+    per_call = per_call or FANOUT_RECIPES_PER_CALL
+    deadline = FANOUT_DEADLINE if deadline is None else deadline
+    calls = math.ceil(count / per_call)
+
+    futures = {
+        GENERATION_POOL.submit(
+            generate_recipes_with_gpt, ingredients, preferences,
+            fresh_call=fresh_call, count=min(per_call, count - i * per_call),
+        )
+        for i in range(calls)
+    }
+
+    recipes = []
+    seen_titles = set()
+    stop_at = time.monotonic() + deadline
+    pending = futures
+    while pending and len(recipes) < count:
+        remaining = stop_at - time.monotonic()
+        if remaining <= 0:
+            break
+        done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                batch = future.result()
+            except Exception as e:
+                log.warning("Fan-out recipe call failed: %s", e)
+                continue
+            for recipe in batch:
+                title_key = ' '.join(str(recipe.get('title', '')).lower().split())
+                if title_key in seen_titles:
+                    continue
+                seen_titles.add(title_key)
+                recipes.append(recipe)
+
+    for future in pending:
+        # Calls already running can't be interrupted; they just get ignored
+        future.cancel()
+
+    log.debug("Fan-out merged %d recipe(s), %d call(s) missed the deadline", len(recipes), len(pending))
+    return recipes[:count]
+
+
+def build_chat_messages(history):
+    """
+    Build the ChatCompletion messages for a ConversationHistory.
+    Returns (messages, template, prompt_tokens).
+    """
+    template = get_prompt('chat')
+    messages = history.to_messages(template.system)
+    prompt_tokens = count_message_tokens(messages)
+    template.check_budget(prompt_tokens)
+    return messages, template, prompt_tokens
 
-    example_user_2 = "I want new recipes."
-    example_assistant_2 = (
-        '[\n'
-        '  {\n'
-        '    "title": "Creamy Mushroom Pasta",\n'
-        '    "ingredients": ["200g pasta", "1 cup mushrooms", "1/2 cup cream"],\n'
-        '    "macros": "Calories: 450, Fat: 20g, Protein: 15g, Carbs: 55g",\n'
-        '    "instructions": "1. Cook pasta until al dente, then drain. 2. Sauté mushrooms in a pan until softened. 3. Add cream and simmer for 2-3 minutes. 4. Toss pasta with the sauce, mixing well. 5. Serve hot, optionally garnished with parsley or cheese. etc.",\n'
-        '    "servings": 2\n'
-        '  }\n'
-        ']'
-    )
 
-    final_user_prompt = (
-        f"I have these ingredients: {', '.join(ingredients)}. "
-        f"My preferences are: {preferences}. "
-        "Generate exactly 5 recipe ideas in valid JSON array form. \n"
-        "Make sure each recipe has a title, ingredients, macros, instructions, everything scaled to 2 servings.\n"
-        "No extra text, no extra keys.\n"
-    )
+def call_gpt_chat(history):
+    """
+    Uses the LLM client (OpenAI ChatCompletion by default) to continue the conversation
+    based on the history. Returns GPT's reply as text.
+    """
+    messages, template, prompt_tokens = build_chat_messages(history)
+    with template.timed(prompt_tokens):
+        return LLM.complete(messages, max_tokens=template.max_tokens, temperature=template.temperature,
+                            label=template.name)
 
-    if fresh_call:
-        final_user_prompt += "Please ensure these are brand-new recipe ideas."
-
-    messages = [
-        {"role": "system", "content": system_instructions},
-        {"role": "user", "content": example_user_1},
-        {"role": "assistant", "content": example_assistant_1},
-        {"role": "user", "content": example_user_2},
-        {"role": "assistant", "content": example_assistant_2},
-        {"role": "user", "content": final_user_prompt},
-    ]
 
-    # Debug
-    print("[DEBUG] Final prompt messages for ChatCompletion:")
-    for i, msg in enumerate(messages):
-        print(f"[{i}] role={msg['role']}, content={msg['content'][:60]}...")
+def stream_gpt_chat(history):
+    """
+    Same as call_gpt_chat, but yields the reply token by token as GPT
+    produces it.
+    """
+    messages, template, prompt_tokens = build_chat_messages(history)
+    with template.timed(prompt_tokens):
+        yield from LLM.stream(messages, max_tokens=template.max_tokens, temperature=template.temperature,
+                              label=template.name)
 
+
+def lookup_chat_reply(history, question):
+    """
+    Cached reply to a context-independent question about the pinned
+    recipe, or None.
+    """
+    if CHAT_CACHE is None:
+        return None
+    return CHAT_CACHE.get(question, history.pinned)
+
+
+def remember_chat_reply(history, question, reply):
+    """
+    Cache a fresh reply, but only if it was generated from the pinned recipe
+    and this question alone: with earlier turns (or their summary) in the
+    prompt, the reply may depend on them and must not be shared with other
+    sessions.
+    """
+    if CHAT_CACHE is None or history.summary or len(history.turns) != 1:
+        return
+    prompt_tokens = get_prompt('chat').prefix_tokens + history.total_tokens()
+    CHAT_CACHE.put(question, history.pinned, reply, prompt_tokens=prompt_tokens)
+
+
+def send_asset(asset, cache_control):
+    """
+    Response for a prebuilt Asset: 304 if the client's ETag matches,
+    otherwise the best precompressed body it accepts.
+    """
+    encoding, body, etag = asset.variant(request.headers.get('Accept-Encoding', ''))
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype=asset.mimetype)
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+
+def sse_event(event, data):
+    """
+    Format one Server-Sent Event with a JSON payload.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def generate_recipes_with_gpt(ingredients, preferences, fresh_call=False, count=5, validate=True):
+    """
+    Generates `count` recipes (5 by default) using GPT. The few-shot prompt
+    comes from the 'recipes' template of the configured prompt variant.
+
+    The completion is streamed and parsed incrementally, so every complete
+    recipe is kept even if the reply is fenced, followed by extra text or
+    cut off at max_tokens.
+
+    If any preference is set and validate is True, the recipes go through
+    VALIDATION_PIPELINE before being returned.
+    """
+    recipes = []
+    parser = RecipeStreamParser()
     try:
-        response = openai.chat.completions.create(
-            model='gpt-3.5-turbo',
-            messages=messages,
-            max_tokens=1000,
-            temperature=0.7,
+        template = get_prompt('recipes')
+        messages, prompt_tokens = template.render(
+            ingredients=', '.join(ingredients),
+            preferences=format_preferences(preferences),
+            count=count,
+            fresh=" Please ensure these are brand-new recipe ideas." if fresh_call else "",
         )
-        response_text = response.choices[0].message.content.strip()
-        print("[DEBUG] Raw GPT response:")
-        print(response_text)
-
-        recipes = json.loads(response_text)
-        if isinstance(recipes, list):
-            # Self-Consistency Check
-            if any(preferences.values()):
-                print(preferences)
-                print("[DEBUG] Self-consistency check.")
-                verified_recipes = validate_recipes_with_gpt(recipes, preferences)
-                return verified_recipes
-            else:
-                return recipes  # Return as-is if no preferences exist
-        
+        log.debug("Generating %d recipe(s) with the %s prompt (~%d tokens)", count, template.variant, prompt_tokens)
+        with template.timed(prompt_tokens):
+            stream = LLM.stream(messages, max_tokens=template.max_tokens, temperature=template.temperature,
+                                label=template.name)
+            for recipe in iter_recipes(stream, parser):
+                recipes.append(recipe)
     except Exception as e:
-        print("[DEBUG] Error generating recipes with GPT:", e)
+        # Keep whatever recipes were complete before the failure
+        log.warning("Error generating recipes with GPT: %s", e)
+    finally:
+        record_parse(parser, 'recipes')
+
+    log.debug("Parsed %d recipe(s) from GPT response", len(recipes))
+    if not recipes:
+        return []
+
+    # Self-Consistency Check
+    if validate and any(preferences.values()):
+        verified_recipes, report = VALIDATION_PIPELINE.run(
+            recipes,
+            preferences,
+            regenerate=lambda n, prefs, avoid: regenerate_recipes(ingredients, prefs, n, avoid),
+        )
+        if report['regenerate_calls']:
+            VALIDATION_RETRIES.inc(report['regenerate_calls'])
+        log.debug("Validation report: %s", report)
+        return verified_recipes
 
-    return []
+    return recipes  # Return as-is if no preferences exist
 
 
-def validate_recipes_with_gpt(recipes, preferences):
+def generate_strict_recipes_with_gpt(ingredients, preferences, count=3):
     """
-    Takes the generated recipes and validates them against user preferences
-    by re-feeding them into GPT to confirm compliance.
+    Recipes that use ONLY the given ingredients (plus pantry staples like
+    salt, pepper, oil and water).
 
-    - If all recipes are valid, return them as-is.
-    - If any recipe is invalid, regenerate new ones.
-    - Preserve the original JSON structure.
+    The local RECIPE_INDEX is searched first; GPT is only called when the
+    corpus has no matching recipe. GPT's answers are checked with the same
+    coverage rules, so nothing with extra ingredients slips through.
     """
-    system_instructions = (
-        "You are an AI assistant verifying that the following recipes strictly adhere "
-        "to the user's dietary preferences. If any recipe includes an ingredient that violates "
-        "the preferences, mark it as 'is_valid': false.\n"
-        "Return the same JSON structure but add an 'is_valid' key (true/false) for each recipe."
-        "DO NOT add any extra text or explanations—ONLY return the JSON array."
-    )
+    def complies(recipe):
+        return not any(preferences.values()) or classify_recipe(recipe, preferences)[0] == 'pass'
 
-    validation_prompt = (
-        f"The user has these dietary preferences: {preferences}. "
-        "Check the following recipes and mark whether they comply.\n"
-        f"Recipes: {json.dumps(recipes, indent=2)}"
-    )
+    matches = RECIPE_INDEX.search(ingredients, max_missing=0, limit=count, accept=complies)
+    if matches:
+        log.debug("Strict recipes served from the local index (%d match(es))", len(matches))
+        return [recipe for recipe, _, _ in matches]
+
+    recipes = []
+    parser = RecipeStreamParser()
+    try:
+        template = get_prompt('strict_recipes')
+        messages, prompt_tokens = template.render(
+            ingredients=', '.join(ingredients),
+            preferences=format_preferences(preferences),
+            count=count,
+        )
+        with template.timed(prompt_tokens):
+            stream = LLM.stream(messages, max_tokens=template.max_tokens, temperature=template.temperature,
+                                label=template.name)
+            for recipe in iter_recipes(stream, parser):
+                if missing_ingredients(recipe, ingredients) == 0 and complies(recipe):
+                    recipes.append(recipe)
+    except Exception as e:
+        log.warning("Error generating strict recipes with GPT: %s", e)
+    finally:
+        record_parse(parser, 'strict_recipes')
+    return recipes
 
-    print("[DEBUG] Validation Prompt:", validation_prompt)
 
-    messages = [
-        {"role": "system", "content": system_instructions},
-        {"role": "user", "content": validation_prompt},
+def validate_recipes_with_gpt(recipes, preferences):
+    """
+    Asks GPT whether each recipe complies with the user's preferences.
+    Only used for recipes the local rules in validation.py can't decide.
+
+    Returns one True/False flag per recipe. If GPT fails or returns
+    something unusable, every recipe is treated as valid.
+    """
+    # Titles and ingredients are all GPT needs to check compliance
+    compact = [
+        {"title": r.get("title", ""), "ingredients": r.get("ingredients", [])}
+        for r in recipes
     ]
 
+    response_text = ""
     try:
-        response = openai.chat.completions.create(
-            model='gpt-3.5-turbo',
-            messages=messages,
-            max_tokens=1000,
-            temperature=0.5,
+        template = get_prompt('validate')
+        max_tokens = 20 + 5 * len(recipes)
+        messages, prompt_tokens = template.render(
+            max_tokens=max_tokens,
+            preferences=format_preferences(preferences),
+            recipes=compact_json(compact),
         )
-        response_text = response.choices[0].message.content.strip()
-
-        if not response_text:
-            print("[ERROR] GPT returned an empty response for validation.")
-            return recipes  # Return original recipes if validation fails
+        with template.timed(prompt_tokens):
+            response_text = LLM.complete(messages, max_tokens=max_tokens, temperature=template.temperature,
+                                         label=template.name)
+        log.debug("GPT validation response: %s", response_text)
+
+        with LLM_PARSE_SECONDS.time(call='validate'):
+            flags = json.loads(strip_code_fences(response_text))
+        if not isinstance(flags, list) or len(flags) != len(recipes):
+            log.warning("GPT validation response doesn't match the recipes.")
+            JSON_PARSE_FAILURES.inc(call='validate')
+            return [True] * len(recipes)
+
+        return [
+            bool(f.get("is_valid", True)) if isinstance(f, dict) else f is not False
+            for f in flags
+        ]
 
-        print("[DEBUG] GPT Validation Response:", response_text)
+    except json.JSONDecodeError as e:
+        log.warning("JSON parsing error in GPT validation response: %s", e)
+        log.debug("Raw GPT response: %s", response_text)
+        JSON_PARSE_FAILURES.inc(call='validate')
+        return [True] * len(recipes)
 
-        validated_recipes = json.loads(response_text)
+    except Exception as e:
+        log.warning("Error validating recipes with GPT: %s", e)
+        return [True] * len(recipes)
 
-        if not isinstance(validated_recipes, list):
-            print("[ERROR] GPT response is not a valid JSON array.")
-            return recipes  # Return original recipes if JSON is malformed
 
-        # Check if all recipes are valid
-        all_valid = all(r.get("is_valid", True) for r in validated_recipes)
+def regenerate_recipes(ingredients, preferences, count, avoid_titles):
+    """
+    Generate replacements for recipes that failed validation. The new
+    recipes are validated by the pipeline that asked for them.
+    """
+    log.debug("Regenerating %d recipe(s), avoiding: %s", count, avoid_titles)
+    recipes = generate_recipes_with_gpt(
+        ingredients, preferences, fresh_call=True, count=count, validate=False
+    )
+    avoid = {t.strip().lower() for t in avoid_titles}
+    return [r for r in recipes if r.get('title', '').strip().lower() not in avoid]
 
-        if all_valid:
-            print("[DEBUG] All recipes are valid. Returning as-is.")
-            # Remove 'is_valid' field before returning, to keep original format
-            for recipe in validated_recipes:
-                recipe.pop("is_valid", None)
-            return validated_recipes
 
-        # If some recipes are invalid, regenerate new ones
-        print("[DEBUG] Some recipes were invalid, regenerating new ones...")
-        return generate_recipes_with_gpt([], preferences, fresh_call=True)
+def observe_llm_call(call):
+    """
+    LLM client observer: per-call outcome, queue/network time and token counts.
+    """
+    if call.error is None:
+        outcome = 'ok'
+    elif isinstance(call.error, GeneratorExit):
+        outcome = 'cancelled'
+    else:
+        outcome = 'error'
+    LLM_CALLS.inc(call=call.label, outcome=outcome)
+    if call.attempts > 1:
+        LLM_RETRIES.inc(call.attempts - 1, call=call.label)
+    LLM_QUEUE_SECONDS.observe(call.queue_seconds, call=call.label)
+    LLM_NETWORK_SECONDS.observe(call.network_seconds, call=call.label)
+    LLM_PROMPT_TOKENS.inc(count_message_tokens(call.messages), call=call.label)
+    LLM_COMPLETION_TOKENS.inc(math.ceil(call.completion_chars / 4), call=call.label)
+    log.debug("LLM %s call %s: queue=%.3fs network=%.3fs attempts=%d",
+              call.label, outcome, call.queue_seconds, call.network_seconds, call.attempts)
+
+
+def record_parse(parser, call):
+    """
+    Record a RecipeStreamParser's parse time and rejected objects.
+    """
+    LLM_PARSE_SECONDS.observe(parser.seconds, call=call)
+    if parser.rejected:
+        JSON_PARSE_FAILURES.inc(parser.rejected, call=call)
 
-    except json.JSONDecodeError as e:
-        print("[ERROR] JSON parsing error:", e)
-        print("[DEBUG] Raw GPT response:", response_text)
-        return recipes  # Return original recipes if JSON decoding fails
 
-    except Exception as e:
-        print("[DEBUG] Error validating recipes with GPT:", e)
-        return recipes  # Return original recipes on error
+def store_stats():
+    """
+    (name, stats) for every sized component, for the store gauges.
+    """
+    stats = [
+        ('recipes', RECIPES_STORE.stats()),
+        ('conversations', CONVERSATION_STORE.stats()),
+        ('recipe_cache', RECIPE_CACHE.stats()),
+        ('recipe_index', {'entries': RECIPE_INDEX.stats()['docs']}),
+        ('pantry_index', PANTRY_INDEX.stats()),
+    ]
+    if MEAL_PLAN_STATUS_STORE is not None:
+        stats.append(('meal_plans', MEAL_PLAN_STATUS_STORE.stats()))
+    return stats
 
 
+def store_evictions():
+    """
+    (store, reason, count) for every store that evicts. Stores counting a
+    single total (LRU past their size limit) report it as reason "entries".
+    """
+    evictions = []
+    for name, stats in store_stats():
+        counts = stats.get('evictions')
+        if isinstance(counts, dict):
+            evictions.extend((name, reason, count) for reason, count in counts.items())
+        elif counts is not None:
+            evictions.append((name, 'entries', counts))
+    return evictions
 
 
 def generate_recipe_details_msg(recipe_info):
@@ -511,39 +1375,19 @@ def generate_recipe_details_msg(recipe_info):
 
 def scale_ingredient(ingredient_line, scale_factor):
     """
-    Naive approach: if the ingredient line starts with a number, multiply it.
-    e.g., "2 cups flour" => "4 cups flour" if scale_factor=2.
+    Scale one ingredient line, e.g. "2 cups flour" => "4 cups flour" and
+    "1/2 cup cream" => "1 cup cream" if scale_factor=2.
+    Handles fractions, unicode fractions and ranges; see quantities.py.
     """
-    pattern = r'^(\d+(\.\d+)?)\s+(.*)'
-    match = re.match(pattern, ingredient_line.strip())
-    if not match:
-        return ingredient_line
-
-    original_amount = float(match.group(1))
-    scaled_amount = round(original_amount * scale_factor, 2)
-    rest = match.group(3)
-    return f"{scaled_amount} {rest}"
+    return Ingredient.parse(ingredient_line).scale(scale_factor)
 
 
 def scale_macros(macros_line, scale_factor):
     """
-    Naive approach: If macros_line has patterns like "Calories: 100",
+    If macros_line has patterns like "Calories: 100",
     multiply the numeric values by scale_factor.
     """
-    parts = macros_line.split(',')
-    scaled_parts = []
-    for p in parts:
-        p = p.strip()
-        match = re.match(r'(.*?):\s*(\d+(\.\d+)?)(.*)', p)
-        if match:
-            label = match.group(1)
-            val = float(match.group(2))
-            unit = match.group(4)
-            scaled_val = round(val * scale_factor, 2)
-            scaled_parts.append(f"{label}: {scaled_val}{unit}")
-        else:
-            scaled_parts.append(p)
-    return ", ".join(scaled_parts)
+    return MacroVector.parse(macros_line).scale(scale_factor)
 
 
 if __name__ == '__main__':
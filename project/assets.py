@@ -0,0 +1,146 @@
+"""
+Build-once static asset pipeline and strong ETags.
+
+At startup every file under static/ is read once and given a content-hashed
+name (css/styles.css => css/styles.3f2a9c1b7e.css). Text assets are
+precompressed with gzip, and with brotli when the optional `brotli` package
+is installed. A hashed URL never changes content, so it can be served with
+`Cache-Control: immutable`; a deploy that changes a file changes its URL.
+
+Each encoding of an asset is a different representation, so it gets its own
+strong ETag ("<hash>", "<hash>.gzip", "<hash>.br").
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+COMPRESSIBLE = ('.css', '.js', '.html', '.svg', '.json', '.txt', '.map')
+
+
+def content_hash(body, length=32):
+    return hashlib.sha256(body).hexdigest()[:length]
+
+
+def parse_accept_encoding(header):
+    """
+    "gzip, br;q=0.8, *;q=0" => {'gzip': 1.0, 'br': 0.8, '*': 0.0}
+    """
+    accepted = {}
+    for part in (header or '').split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name] = quality
+    return accepted
+
+
+def choose_encoding(header, available):
+    """
+    First of `available` (in server preference order) the client accepts,
+    or None for the uncompressed body.
+    """
+    accepted = parse_accept_encoding(header)
+    for encoding in available:
+        if accepted.get(encoding, accepted.get('*', 0.0)) > 0:
+            return encoding
+    return None
+
+
+def compress(body, min_size=512, min_saving=0.1):
+    """
+    Compressed variants of body, keeping only those that save at least
+    min_saving of its size. Brotli is preferred over gzip when present.
+    """
+    if len(body) < min_size:
+        return {}
+    variants = {}
+    if brotli is not None:
+        variants['br'] = brotli.compress(body, quality=11)
+    # mtime=0 so the same input always gives the same bytes (and ETag)
+    variants['gzip'] = gzip.compress(body, compresslevel=9, mtime=0)
+    limit = len(body) * (1 - min_saving)
+    return {encoding: data for encoding, data in variants.items() if len(data) <= limit}
+
+
+class Asset:
+    __slots__ = ('path', 'hashed_path', 'mimetype', 'digest', 'bodies', 'encodings')
+
+    def __init__(self, path, body, mimetype=None, compressible=True):
+        self.path = path
+        self.digest = content_hash(body)
+        root, ext = os.path.splitext(path)
+        self.hashed_path = f"{root}.{self.digest[:10]}{ext}"
+        self.mimetype = mimetype or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.bodies = {None: body}
+        if compressible:
+            self.bodies.update(compress(body))
+        # Server preference order for choose_encoding()
+        self.encodings = [encoding for encoding in ('br', 'gzip') if encoding in self.bodies]
+
+    def variant(self, accept_encoding):
+        """
+        (encoding, body, etag) for the client's Accept-Encoding header.
+        """
+        encoding = choose_encoding(accept_encoding, self.encodings)
+        etag = self.digest if encoding is None else f"{self.digest}.{encoding}"
+        return encoding, self.bodies[encoding], etag
+
+    def size(self):
+        return sum(len(body) for body in self.bodies.values())
+
+
+class AssetPipeline:
+    """
+    In-memory, content-hashed copy of a static directory. url() maps a
+    logical path ("js/scripts.js") to its hashed URL; get() looks an asset
+    up by hashed path.
+    """
+
+    def __init__(self, static_dir, url_prefix='/assets'):
+        self.static_dir = static_dir
+        self.url_prefix = url_prefix.rstrip('/')
+        self._by_path = {}
+        self._by_hashed = {}
+
+    def build(self):
+        by_path = {}
+        for dirpath, _, filenames in os.walk(self.static_dir):
+            for filename in sorted(filenames):
+                full_path = os.path.join(dirpath, filename)
+                path = os.path.relpath(full_path, self.static_dir).replace(os.sep, '/')
+                with open(full_path, 'rb') as f:
+                    body = f.read()
+                by_path[path] = Asset(path, body, compressible=path.lower().endswith(COMPRESSIBLE))
+        self._by_path = by_path
+        self._by_hashed = {asset.hashed_path: asset for asset in by_path.values()}
+        return self
+
+    def url(self, path):
+        asset = self._by_path.get(path)
+        return f"{self.url_prefix}/{asset.hashed_path}" if asset is not None else None
+
+    def get(self, hashed_path):
+        return self._by_hashed.get(hashed_path)
+
+    def stats(self):
+        return {
+            'assets': len(self._by_path),
+            'bytes': sum(asset.size() for asset in self._by_path.values()),
+            'compressed': sum(1 for asset in self._by_path.values() if asset.encodings),
+            'brotli': brotli is not None,
+        }
@@ -0,0 +1,354 @@
+"""
+Benchmark and load-test suite for ChefBot, runnable without an OpenAI key.
+
+The app is imported with the fake LLM backend (configurable latency,
+jitter and failure rate), then virtual users drive the real Flask routes
+through the test client:
+
+    /get_recipes -> /see_more -> /chatbot CHOOSE_RECIPE_.. -> /chatbot chat
+    -> /chatbot "i want new recipes"
+
+Reports throughput, p50/p95/p99 latency per step and RSS growth, plus
+micro-benchmarks of the scaling and formatting helpers. Results can be
+saved as JSON and compared against an earlier run:
+
+    python bench.py --users 16 --iterations 20 --json bench.json
+    python bench.py --only micro --compare bench.json
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import resource
+import sys
+import threading
+import time
+import timeit
+from concurrent.futures import ThreadPoolExecutor
+
+PANTRY = [
+    "chicken", "rice", "garlic", "onion", "tomato", "pasta", "cheese", "egg", "spinach",
+    "mushroom", "potato", "carrot", "beef", "tofu", "lentils", "bell pepper", "zucchini",
+    "chickpeas", "salmon", "broccoli", "coconut milk", "ginger", "lemon", "yogurt", "beans",
+]
+PREFERENCES = ["vegetarian", "vegan", "glutenfree", "dairyfree", "nutfree"]
+CHAT_QUESTIONS = [
+    "Can I make this ahead of time?",
+    "What can I use instead of garlic?",
+    "How do I store the leftovers?",
+    "Is this spicy?",
+    "What side dish goes well with it?",
+]
+
+# Regressions beyond this fraction are flagged by --compare
+REGRESSION_THRESHOLD = 0.10
+
+# ----------------------------------------------------------------
+# HELPERS
+# ----------------------------------------------------------------
+
+
+def rss_bytes():
+    """
+    Current resident set size; falls back to peak RSS where /proc is missing.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def percentile(sorted_values, pct):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(samples, elapsed):
+    """
+    Latency summary (ms) for a list of seconds.
+    """
+    values = sorted(samples)
+    return {
+        "requests": len(values),
+        "throughput_rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(sum(values) / len(values) * 1000, 2) if values else 0.0,
+        "p50_ms": round(percentile(values, 50) * 1000, 2),
+        "p95_ms": round(percentile(values, 95) * 1000, 2),
+        "p99_ms": round(percentile(values, 99) * 1000, 2),
+        "max_ms": round(values[-1] * 1000, 2) if values else 0.0,
+    }
+
+
+def configure_environment(args):
+    """
+    Point the app at the fake LLM backend. Must run before `import app`.
+    """
+    os.environ["CHEFBOT_LLM_BACKEND"] = "fake"
+    os.environ["CHEFBOT_FAKE_LATENCY"] = str(args.latency)
+    os.environ["CHEFBOT_FAKE_JITTER"] = str(args.jitter)
+    os.environ["CHEFBOT_FAKE_FAILURE_RATE"] = str(args.failure_rate)
+    os.environ["CHEFBOT_FAKE_SEED"] = str(args.seed)
+    os.environ["CHEFBOT_PREFETCH"] = "1" if args.prefetch else "0"
+    # Virtual users act far faster than people, so the per-session rate
+    # limits would throttle them; admission control is opt-in here
+    os.environ["CHEFBOT_ADMISSION"] = "1" if args.admission else "0"
+    # Every virtual user shares one IP: keep the per-IP buckets off even if
+    # the calling shell trusts a proxy
+    os.environ["CHEFBOT_TRUST_PROXY"] = "0"
+    os.environ.setdefault("CHEFBOT_LOG_LEVEL", "WARNING")
+
+# ----------------------------------------------------------------
+# LOAD TEST
+# ----------------------------------------------------------------
+
+
+class VirtualUser:
+    """
+    One browser session walking through the main flow with its own cookie jar.
+    """
+
+    def __init__(self, app, rng, pantry_pool, record):
+        self.client = app.test_client()
+        self.rng = rng
+        self.pantry_pool = pantry_pool
+        self.record = record
+
+    def post(self, step, path, payload):
+        started = time.perf_counter()
+        response = self.client.post(path, json=payload)
+        elapsed = time.perf_counter() - started
+        self.record(step, elapsed, response.status_code)
+        return response
+
+    def run_once(self):
+        ingredients, preferences = self.pantry_pool[self.rng.randrange(len(self.pantry_pool))]
+
+        response = self.post("get_recipes", "/get_recipes",
+                             {"ingredients": ingredients, "preferences": preferences})
+        recipes = (response.get_json() or {}).get("recipes") or []
+        if not recipes:
+            return
+        recipe_id = recipes[self.rng.randrange(len(recipes))]["id"]
+
+        self.post("see_more", "/see_more", {"recipe_id": recipe_id})
+        servings = self.rng.choice([1, 2, 4, 6])
+        self.post("chatbot:choose_recipe", "/chatbot",
+                  {"message": f"CHOOSE_RECIPE_{recipe_id}__SERVINGS_{servings}",
+                   "ingredients": ingredients, "preferences": preferences})
+        self.post("chatbot:chat", "/chatbot",
+                  {"message": self.rng.choice(CHAT_QUESTIONS),
+                   "ingredients": ingredients, "preferences": preferences})
+        self.post("chatbot:new_recipes", "/chatbot",
+                  {"message": "I want new recipes",
+                   "ingredients": ingredients, "preferences": preferences})
+
+
+def make_pantries(rng, count):
+    pantries = []
+    for _ in range(count):
+        ingredients = rng.sample(PANTRY, rng.randint(3, 6))
+        preferences = {key: rng.random() < 0.15 for key in PREFERENCES}
+        pantries.append((ingredients, preferences))
+    return pantries
+
+
+def run_load(app_module, args):
+    flask_app = app_module.app
+    rng = random.Random(args.seed)
+    pantry_pool = make_pantries(rng, args.pantries)
+
+    samples = {}
+    errors = {}
+    lock = threading.Lock()
+
+    def record(step, elapsed, status):
+        with lock:
+            samples.setdefault(step, []).append(elapsed)
+            if status >= 400:
+                errors[step] = errors.get(step, 0) + 1
+
+    def user_loop(user_index):
+        user = VirtualUser(flask_app, random.Random(args.seed * 1000 + user_index), pantry_pool, record)
+        for _ in range(args.iterations):
+            user.run_once()
+
+    # Warm up imports, caches of compiled regexes, etc. outside the measurement
+    VirtualUser(flask_app, random.Random(-1), pantry_pool[:1], lambda *a: None).run_once()
+
+    rss_before = rss_bytes()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.users) as pool:
+        list(pool.map(user_loop, range(args.users)))
+    elapsed = time.perf_counter() - started
+    rss_after = rss_bytes()
+    prefetch = app_module.PREFETCHER.stats() if app_module.PREFETCHER is not None else None
+
+    all_samples = [s for values in samples.values() for s in values]
+    return {
+        "config": {
+            "users": args.users,
+            "iterations": args.iterations,
+            "pantries": args.pantries,
+            "latency": args.latency,
+            "jitter": args.jitter,
+            "failure_rate": args.failure_rate,
+            "seed": args.seed,
+            "prefetch": args.prefetch,
+            "admission": args.admission,
+        },
+        "elapsed_s": round(elapsed, 3),
+        "total": dict(summarize(all_samples, elapsed), errors=sum(errors.values())),
+        "steps": {
+            step: dict(summarize(values, elapsed), errors=errors.get(step, 0))
+            for step, values in sorted(samples.items())
+        },
+        "prefetch": prefetch,
+        "rss": {
+            "before_bytes": rss_before,
+            "after_bytes": rss_after,
+            "growth_bytes": rss_after - rss_before,
+        },
+    }
+
+# ----------------------------------------------------------------
+# MICRO-BENCHMARKS
+# ----------------------------------------------------------------
+
+MICRO_INGREDIENTS = [
+    "2 cups flour", "1/2 cup cream", "1 1/2 tbsp olive oil", "3 cloves garlic, minced",
+    "200g pasta", "1-2 tsp chili flakes", "salt to taste", "1 lb chicken breast",
+]
+MICRO_MACROS = "Calories: 450, Fat: 20g, Protein: 15g, Carbs: 55g"
+MICRO_RECIPE = {
+    "title": "Creamy Mushroom Pasta",
+    "ingredients": MICRO_INGREDIENTS,
+    "macros": MICRO_MACROS,
+    "instructions": "1. Cook pasta. 2. Saute mushrooms. 3. Add cream. 4. Toss and serve.",
+    "servings": 2,
+}
+
+
+def time_per_call(fn, number, repeat):
+    """
+    Best-of-repeat time per call, in microseconds.
+    """
+    best = min(timeit.repeat(fn, number=number, repeat=repeat))
+    return round(best / number * 1e6, 3)
+
+
+def run_micro(app_module, number=2000, repeat=5):
+    lines = MICRO_INGREDIENTS
+    return {
+        "scale_ingredient_us": time_per_call(
+            lambda: [app_module.scale_ingredient(line, 1.5) for line in lines], number, repeat),
+        "scale_macros_us": time_per_call(
+            lambda: app_module.scale_macros(MICRO_MACROS, 1.5), number, repeat),
+        "generate_recipe_details_msg_us": time_per_call(
+            lambda: app_module.generate_recipe_details_msg(MICRO_RECIPE), number, repeat),
+    }
+
+# ----------------------------------------------------------------
+# REPORTING
+# ----------------------------------------------------------------
+
+
+def compare(current, baseline):
+    """
+    Lines describing changes vs. a baseline result; regressions are marked.
+    """
+    lines = []
+
+    def check(name, new, old, higher_is_better=False):
+        if not old:
+            return
+        change = (new - old) / old
+        worse = change < -REGRESSION_THRESHOLD if higher_is_better else change > REGRESSION_THRESHOLD
+        lines.append(f"  {name}: {old} -> {new} ({change:+.1%}){'  REGRESSION' if worse else ''}")
+
+    for key, value in (current.get("micro") or {}).items():
+        check(f"micro.{key}", value, (baseline.get("micro") or {}).get(key))
+    load, old_load = current.get("load"), baseline.get("load")
+    if load and old_load:
+        check("load.throughput_rps", load["total"]["throughput_rps"],
+              old_load["total"]["throughput_rps"], higher_is_better=True)
+        for step, stats in load["steps"].items():
+            old_stats = old_load["steps"].get(step)
+            if old_stats:
+                check(f"load.{step}.p95_ms", stats["p95_ms"], old_stats["p95_ms"])
+    return lines
+
+
+def print_report(result):
+    load = result.get("load")
+    if load:
+        print(f"Load: {load['config']['users']} users x {load['config']['iterations']} iterations "
+              f"in {load['elapsed_s']}s")
+        print(f"  {'step':<24}{'reqs':>7}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+        for step, stats in list(load["steps"].items()) + [("total", load["total"])]:
+            print(f"  {step:<24}{stats['requests']:>7}{stats['throughput_rps']:>9}"
+                  f"{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}{stats['errors']:>8}")
+        print(f"  RSS growth: {load['rss']['growth_bytes'] / 1024 / 1024:.1f} MiB "
+              f"({load['rss']['after_bytes'] / 1024 / 1024:.1f} MiB total)")
+    micro = result.get("micro")
+    if micro:
+        print("Micro-benchmarks (us per call, best of 5):")
+        for name, value in micro.items():
+            print(f"  {name:<34}{value:>10}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="ChefBot benchmark and load test (fake LLM backend).")
+    parser.add_argument("--only", choices=("load", "micro"), help="run only one part")
+    parser.add_argument("--users", type=int, default=8, help="concurrent virtual users")
+    parser.add_argument("--iterations", type=int, default=10, help="flows per virtual user")
+    parser.add_argument("--pantries", type=int, default=50, help="distinct pantries users pick from")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake LLM latency per call (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random fake LLM latency (s)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of failing LLM calls")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--prefetch", action="store_true", help="enable speculative recipe prefetch")
+    parser.add_argument("--admission", action="store_true", help="enable rate limiting and load shedding")
+    parser.add_argument("--json", help="write results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to compare against")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_environment(args)
+    import app as app_module
+
+    result = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    if args.only in (None, "load"):
+        result["load"] = run_load(app_module, args)
+    if args.only in (None, "micro"):
+        result["micro"] = run_micro(app_module)
+
+    print_report(result)
+    if args.compare:
+        with open(args.compare) as f:
+            lines = compare(result, json.load(f))
+        print(f"Compared with {args.compare}:")
+        print("\n".join(lines) if lines else "  nothing comparable")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+    return result
+
+
+if __name__ == "__main__":
+    main()
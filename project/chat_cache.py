@@ -0,0 +1,157 @@
+"""
+Reply cache for repeated chat questions.
+
+Many chat turns are the same FAQ ("how long do I cook the chicken?")
+about the same popular recipe. Replies are cached by the normalized
+question plus a fingerprint of the pinned CHOSEN_RECIPE_DETAILS block,
+so an answer is only reused for the exact same recipe and servings.
+Sessions without a pinned recipe are never cached: there is nothing to
+scope their answers to.
+
+Only questions that stand on their own are cached: is_context_independent()
+is a cheap rule-based check that rejects follow-ups referring to earlier
+turns ("what about the second one?", "and then?", "you said ...").
+"""
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from conversation import estimate_tokens
+
+_CONTRACTIONS = {
+    "what's": "what is", "how's": "how is", "where's": "where is", "it's": "it is",
+    "can't": "cannot", "don't": "do not", "doesn't": "does not", "isn't": "is not",
+    "i'm": "i am", "should've": "should have", "won't": "will not",
+}
+_FILLER = {"please", "pls", "hey", "hi", "hello", "chefbot", "um"}
+_PUNCT_RE = re.compile(r"[^\w\s']")
+
+# Phrases that point back at earlier turns rather than the pinned recipe
+_FOLLOW_UP_RE = re.compile(
+    r"\b(you said|you mentioned|you suggested|earlier|previous(ly)?|before that|last (answer|one|reply)"
+    r"|above|that one|this one|the other|other one|(first|second|third|fourth|fifth|last) one"
+    r"|instead|what about|how about|and then|again|another|more of|else|same|those|these|them"
+    r"|option|alternative|your answer|that answer|next|now)\b"
+)
+_LEADING_CONJUNCTION_RE = re.compile(r"^(and|but|or|so|then|also|ok|okay)\b")
+
+MIN_WORDS = 3
+MAX_WORDS = 25
+
+
+def normalize_question(text):
+    """
+    "Hey, what's the next step??" => "what is the next step"
+    """
+    words = []
+    for word in _PUNCT_RE.sub(" ", str(text).lower()).split():
+        word = _CONTRACTIONS.get(word, word).strip("'")
+        words.extend(w for w in word.split() if w and w not in _FILLER)
+    return " ".join(words)
+
+
+def is_context_independent(question):
+    """
+    True if the question can be answered from the pinned recipe alone,
+    without the earlier conversation turns. Only meaningful with a pinned
+    recipe (a bare "it" refers to it); the cache never looks up without one.
+    """
+    normalized = normalize_question(question)
+    words = normalized.split()
+    if not MIN_WORDS <= len(words) <= MAX_WORDS:
+        return False
+    if _LEADING_CONJUNCTION_RE.search(normalized) or _FOLLOW_UP_RE.search(normalized):
+        return False
+    return True
+
+
+def recipe_fingerprint(pinned):
+    if not pinned:
+        return "none"
+    return hashlib.sha1(pinned.encode("utf-8")).hexdigest()
+
+
+class ChatReplyCache:
+    """
+    LRU + TTL cache of chat replies. Each entry remembers the prompt
+    tokens its original call used, so hits can report tokens saved.
+    """
+
+    def __init__(self, max_entries=5000, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> (reply, expires_at, prompt_tokens, completion_tokens)
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+        self.saved_prompt_tokens = 0
+        self.saved_completion_tokens = 0
+
+    @staticmethod
+    def make_key(question, pinned):
+        return recipe_fingerprint(pinned) + ":" + normalize_question(question)
+
+    def get(self, question, pinned=None):
+        """
+        Cached reply for a context-independent question about a pinned
+        recipe, or None. Questions that depend on earlier turns, or come
+        without a pinned recipe, are counted as bypassed.
+        """
+        if not pinned or not is_context_independent(question):
+            with self._lock:
+                self.bypassed += 1
+            return None
+
+        key = self.make_key(question, pinned)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= now:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.saved_prompt_tokens += entry[2]
+            self.saved_completion_tokens += entry[3]
+            return entry[0]
+
+    def put(self, question, pinned, reply, prompt_tokens=0):
+        """
+        Remember a reply; ignored without a pinned recipe or for questions
+        that depend on earlier turns. The caller must only pass replies
+        generated from the pinned recipe and the question alone.
+        """
+        if not reply or not pinned or not is_context_independent(question):
+            return
+        key = self.make_key(question, pinned)
+        with self._lock:
+            self._entries[key] = (reply, time.time() + self.ttl, prompt_tokens, estimate_tokens(reply))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "saved_prompt_tokens": self.saved_prompt_tokens,
+                "saved_completion_tokens": self.saved_completion_tokens,
+            }
@@ -0,0 +1,137 @@
+"""
+Structured, token-budgeted conversation history for /chatbot.
+
+Each session keeps a ring buffer of role/content turns plus the pinned
+CHOSEN_RECIPE_DETAILS block. When the history goes over its token budget
+the oldest turns are folded into a short summary instead of being resent
+in full on every call.
+"""
+from collections import deque
+
+
+def estimate_tokens(text):
+    """
+    Cheap token estimate (~4 characters per token for English text).
+    """
+    return (len(text) + 3) // 4
+
+
+class ConversationHistory:
+    """
+    Per-session chat history. Token counts are computed once per turn, so
+    adding a turn and windowing are O(1) amortized.
+    """
+
+    def __init__(self, max_turns=20, token_budget=2000, summary_chars=600):
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        self.summary_chars = summary_chars
+        self.turns = deque()  # (role, content, tokens)
+        self.pinned = None
+        self.summary = ""
+        self._turn_tokens = 0
+
+    # ----------------------------------------------------------------
+    # UPDATES
+    # ----------------------------------------------------------------
+
+    def add(self, role, content):
+        """
+        Append a "user" or "assistant" turn, then trim to the budget.
+        """
+        tokens = estimate_tokens(content)
+        self.turns.append((role, content, tokens))
+        self._turn_tokens += tokens
+        self._trim()
+
+    def pin_recipe(self, details):
+        """
+        Pin the chosen recipe details so they are always sent, whatever
+        happens to older turns.
+        """
+        self.pinned = details
+        self._trim()
+
+    def clear(self):
+        self.turns.clear()
+        self.pinned = None
+        self.summary = ""
+        self._turn_tokens = 0
+
+    def total_tokens(self):
+        pinned = estimate_tokens(self.pinned) if self.pinned else 0
+        return pinned + estimate_tokens(self.summary) + self._turn_tokens
+
+    def _trim(self):
+        # Always keep the latest turn, even if it alone is over budget
+        while len(self.turns) > 1 and (
+            len(self.turns) > self.max_turns or self.total_tokens() > self.token_budget
+        ):
+            role, content, tokens = self.turns.popleft()
+            self._turn_tokens -= tokens
+            self._summarize(role, content)
+
+    def _summarize(self, role, content):
+        # Keep only the gist of what the user asked; answers can be re-derived
+        if role != "user":
+            return
+        snippet = " ".join(content.split())[:80]
+        summary = f"{self.summary} {snippet};".strip()
+        if len(summary) > self.summary_chars:
+            summary = summary[-self.summary_chars:]
+        self.summary = summary
+
+    # ----------------------------------------------------------------
+    # OUTPUT
+    # ----------------------------------------------------------------
+
+    def to_messages(self, system_instructions):
+        """
+        ChatCompletion messages: system prompt, pinned recipe, summary of
+        dropped turns, then the remaining turns with their own roles.
+        """
+        messages = [{"role": "system", "content": system_instructions}]
+        if self.pinned:
+            messages.append({"role": "system", "content": f"CHOSEN_RECIPE_DETAILS:\n{self.pinned}"})
+        if self.summary:
+            messages.append({"role": "system", "content": f"Earlier the user asked about: {self.summary}"})
+        for role, content, _ in self.turns:
+            messages.append({"role": role, "content": content})
+        return messages
+
+    def render_context(self):
+        """
+        The legacy context string returned to the client in the 'context' field.
+        """
+        parts = []
+        if self.pinned:
+            parts.append(f"\nCHOSEN_RECIPE_DETAILS:\n{self.pinned}\n")
+        for role, content, _ in self.turns:
+            if role == "user":
+                parts.append(f"\nUser: {content}\n")
+            else:
+                parts.append(f"Assistant: {content}\n")
+        return "".join(parts)
+
+    # ----------------------------------------------------------------
+    # SERIALIZATION (for CONVERSATION_STORE)
+    # ----------------------------------------------------------------
+
+    def to_dict(self):
+        return {
+            "pinned": self.pinned,
+            "summary": self.summary,
+            "turns": [[role, content, tokens] for role, content, tokens in self.turns],
+        }
+
+    @classmethod
+    def from_dict(cls, data, **limits):
+        history = cls(**limits)
+        if not data:
+            return history
+        history.pinned = data.get("pinned")
+        history.summary = data.get("summary", "")
+        for role, content, tokens in data.get("turns", []):
+            history.turns.append((role, content, tokens))
+            history._turn_tokens += tokens
+        return history
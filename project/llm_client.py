@@ -0,0 +1,406 @@
+"""
+LLM client layer.
+
+Every GPT call in the app goes through an LLMClient, which adds a
+concurrency limit and jittered retries on top of a swappable backend:
+
+- OpenAIBackend: Chat Completions over a pooled keep-alive HTTP session
+- FakeBackend: deterministic offline stand-in with configurable latency,
+  for load tests and local development without network access
+"""
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from validation import classify_recipe
+
+OPENAI_CHAT_URL = "https://api.openai.com/v1/chat/completions"
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """
+    Raised when a completion fails. `retryable` tells LLMClient whether
+    trying again might help; `retry_after` is the server's hint in seconds.
+    """
+
+    def __init__(self, message, retryable=False, retry_after=None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+# ----------------------------------------------------------------
+# BACKENDS
+# ----------------------------------------------------------------
+
+
+class OpenAIBackend:
+    """
+    OpenAI Chat Completions over a requests.Session, so connections are
+    pooled and kept alive between calls.
+    """
+
+    def __init__(self, api_key, pool_size=32, connect_timeout=5.0, read_timeout=60.0,
+                 url=OPENAI_CHAT_URL):
+        self.url = url
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+        })
+
+    def _post(self, payload, stream=False):
+        try:
+            response = self.session.post(self.url, json=payload, timeout=self.timeout, stream=stream)
+        except (requests.Timeout, requests.ConnectionError) as e:
+            raise LLMError(f"OpenAI request failed: {e}", retryable=True) from e
+
+        if response.status_code != 200:
+            retry_after = response.headers.get("Retry-After")
+            try:
+                retry_after = float(retry_after) if retry_after else None
+            except ValueError:
+                retry_after = None
+            raise LLMError(
+                f"OpenAI returned HTTP {response.status_code}: {response.text[:200]}",
+                retryable=response.status_code in RETRYABLE_STATUS,
+                retry_after=retry_after,
+            )
+        return response
+
+    def complete(self, messages, model, max_tokens, temperature):
+        payload = {
+            "model": model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+        }
+        data = self._post(payload).json()
+        return data["choices"][0]["message"]["content"]
+
+    def stream(self, messages, model, max_tokens, temperature):
+        payload = {
+            "model": model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "stream": True,
+        }
+        response = self._post(payload, stream=True)
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data: "):
+                    continue
+                data = line[len("data: "):]
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or []
+                token = choices[0].get("delta", {}).get("content") if choices else None
+                if token:
+                    yield token
+        except requests.RequestException as e:
+            raise LLMError(f"OpenAI stream interrupted: {e}", retryable=True) from e
+        finally:
+            response.close()
+
+
+class FakeBackend:
+    """
+    Deterministic offline stand-in for OpenAI. Recognizes the app's recipe,
+    validation and chat prompts and replays canned responses for them.
+    The same prompt always gets the same answer. Like a real model, it
+    leaves out pantry ingredients the requested preferences rule out.
+
+    responses: optional dict overriding the canned text per kind
+    ("recipes", "validation", "chat"); recipe text may use {count}.
+    failure_rate: fraction of calls that fail with a retryable LLMError,
+    drawn from a seeded sequence so runs are reproducible.
+    """
+
+    def __init__(self, latency=0.05, jitter=0.0, stream_chunk_latency=0.0, responses=None, seed=0,
+                 failure_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.stream_chunk_latency = stream_chunk_latency
+        self.responses = responses or {}
+        self.seed = seed
+        self.failure_rate = failure_rate
+        self._failures = random.Random(seed)
+        self._failures_lock = threading.Lock()
+
+    def _maybe_fail(self):
+        if not self.failure_rate:
+            return
+        with self._failures_lock:
+            failed = self._failures.random() < self.failure_rate
+        if failed:
+            raise LLMError("Fake backend failure", retryable=True)
+
+    def _rng(self, messages):
+        digest = hashlib.sha1(
+            (str(self.seed) + json.dumps(messages, sort_keys=True)).encode("utf-8")
+        ).hexdigest()
+        return random.Random(int(digest[:16], 16))
+
+    def _sleep(self, rng):
+        delay = self.latency + (rng.uniform(0, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            time.sleep(delay)
+
+    @staticmethod
+    def _kind(messages):
+        system = messages[0]["content"] if messages else ""
+        last = messages[-1]["content"] if messages else ""
+        if "verifying" in system:
+            return "validation"
+        if "recipe ideas in valid JSON" in last:
+            return "recipes"
+        return "chat"
+
+    def _recipes(self, messages, rng):
+        last = messages[-1]["content"]
+        count_match = re.search(r"exactly (\d+) recipe", last)
+        count = int(count_match.group(1)) if count_match else 5
+        if "recipes" in self.responses:
+            return self.responses["recipes"].replace("{count}", str(count))
+
+        ings_match = re.search(r"ingredients: (.*?)\. My preferences", last)
+        ingredients = [i.strip() for i in ings_match.group(1).split(",")] if ings_match else []
+        prefs_match = re.search(r"My preferences are: (.*?)\. Generate", last)
+        preferences = {
+            p.strip(): True for p in prefs_match.group(1).split(",") if p.strip() != "none"
+        } if prefs_match else {}
+        ingredients = [
+            i for i in ingredients
+            if i and classify_recipe({"ingredients": [i]}, preferences)[0] != "fail"
+        ] or ["tomato", "onion", "rice"]
+        styles = ["Skillet", "Bake", "Stir-Fry", "Soup", "Salad", "Bowl", "Stew", "Wrap"]
+        recipes = []
+        for i in range(count):
+            main = ingredients[rng.randrange(len(ingredients))].title()
+            style = styles[rng.randrange(len(styles))]
+            recipes.append({
+                "title": f"{main} {style} #{rng.randrange(1000)}",
+                "ingredients": [f"{rng.choice(['1', '2', '1/2', '200g'])} {ing}" for ing in ingredients],
+                "macros": (
+                    f"Calories: {rng.randrange(200, 700)}, Fat: {rng.randrange(5, 30)}g, "
+                    f"Protein: {rng.randrange(5, 40)}g, Carbs: {rng.randrange(10, 80)}g"
+                ),
+                "instructions": f"1. Prep the {', '.join(ingredients)}. 2. Cook {style.lower()}-style. 3. Serve.",
+                "servings": 2,
+            })
+        return json.dumps(recipes)
+
+    def _validation(self, messages):
+        if "validation" in self.responses:
+            return self.responses["validation"]
+        match = re.search(r"Recipes: (\[.*\])", messages[-1]["content"], re.S)
+        count = len(json.loads(match.group(1))) if match else 1
+        return json.dumps([True] * count)
+
+    def _chat(self, messages, rng):
+        if "chat" in self.responses:
+            return self.responses["chat"]
+        replies = [
+            "Cook it over medium heat for about 6-8 minutes per side.",
+            "Next, add the remaining ingredients and simmer for 10 minutes.",
+            "You can swap that for any similar ingredient you have on hand.",
+        ]
+        return replies[rng.randrange(len(replies))]
+
+    def _text(self, messages, rng):
+        kind = self._kind(messages)
+        if kind == "recipes":
+            return self._recipes(messages, rng)
+        if kind == "validation":
+            return self._validation(messages)
+        return self._chat(messages, rng)
+
+    def complete(self, messages, model, max_tokens, temperature):
+        rng = self._rng(messages)
+        self._sleep(rng)
+        self._maybe_fail()
+        return self._text(messages, rng)
+
+    def stream(self, messages, model, max_tokens, temperature):
+        rng = self._rng(messages)
+        self._sleep(rng)
+        self._maybe_fail()
+        for token in re.findall(r"\S+\s*", self._text(messages, rng)):
+            if self.stream_chunk_latency:
+                time.sleep(self.stream_chunk_latency)
+            yield token
+
+# ----------------------------------------------------------------
+# CLIENT
+# ----------------------------------------------------------------
+
+
+class LLMCall:
+    """
+    Timing record for one complete()/stream() call, across all attempts:
+    queue_seconds waiting for a concurrency slot, network_seconds waiting
+    on the backend (for streams, only the time spent producing tokens).
+    """
+    __slots__ = ("label", "messages", "queue_seconds", "network_seconds", "attempts",
+                 "completion_chars", "error")
+
+    def __init__(self, label, messages):
+        self.label = label
+        self.messages = messages
+        self.queue_seconds = 0.0
+        self.network_seconds = 0.0
+        self.attempts = 0
+        self.completion_chars = 0
+        self.error = None
+
+
+class LLMClient:
+    """
+    Backend wrapper with a concurrency limit and jittered exponential
+    backoff on retryable errors.
+
+    observer(call), if given, receives an LLMCall after every call,
+    successful or not.
+    """
+
+    def __init__(self, backend, model="gpt-3.5-turbo", max_concurrency=16, max_retries=2,
+                 backoff_base=0.5, backoff_max=8.0, acquire_timeout=30.0, observer=None):
+        self.backend = backend
+        self.model = model
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.acquire_timeout = acquire_timeout
+        self.observer = observer
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+    def _acquire(self, call):
+        started = time.perf_counter()
+        acquired = self._slots.acquire(timeout=self.acquire_timeout)
+        call.queue_seconds += time.perf_counter() - started
+        if not acquired:
+            raise LLMError("Too many concurrent LLM calls", retryable=False)
+        call.attempts += 1
+
+    def _observe(self, call):
+        if self.observer is not None:
+            try:
+                self.observer(call)
+            except Exception:
+                pass
+
+    def _backoff(self, attempt, error):
+        if error.retry_after is not None:
+            delay = error.retry_after
+        else:
+            # "Full jitter": uniform in [0, base * 2^attempt]
+            delay = random.uniform(0, self.backoff_base * (2 ** attempt))
+        time.sleep(min(delay, self.backoff_max))
+
+    def complete(self, messages, max_tokens=300, temperature=0.7, model=None, label="chat"):
+        """
+        Return the completion text for messages. label names the kind of
+        call for the observer (e.g. "recipes", "validate", "chat").
+        """
+        call = LLMCall(label, messages)
+        try:
+            text = self._complete(call, messages, max_tokens, temperature, model)
+            call.completion_chars = len(text)
+            return text
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            self._observe(call)
+
+    def _complete(self, call, messages, max_tokens, temperature, model):
+        attempt = 0
+        while True:
+            self._acquire(call)
+            started = time.perf_counter()
+            try:
+                text = self.backend.complete(messages, model or self.model, max_tokens, temperature)
+                return (text or "").strip()
+            except LLMError as e:
+                if not e.retryable or attempt >= self.max_retries:
+                    raise
+                error = e
+            finally:
+                call.network_seconds += time.perf_counter() - started
+                self._slots.release()
+            self._backoff(attempt, error)
+            attempt += 1
+
+    def stream(self, messages, max_tokens=300, temperature=0.7, model=None, label="chat"):
+        """
+        Yield completion tokens as they arrive. Retries only happen before
+        the first token, so callers never see a reply twice.
+        """
+        call = LLMCall(label, messages)
+        try:
+            for token in self._stream(call, messages, max_tokens, temperature, model):
+                call.completion_chars += len(token)
+                yield token
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            self._observe(call)
+
+    def _stream(self, call, messages, max_tokens, temperature, model):
+        attempt = 0
+        while True:
+            self._acquire(call)
+            started = False
+            try:
+                tokens = iter(self.backend.stream(messages, model or self.model, max_tokens, temperature))
+                while True:
+                    # Time only the backend, not the consumer's work between tokens
+                    waited = time.perf_counter()
+                    try:
+                        token = next(tokens)
+                    except StopIteration:
+                        return
+                    finally:
+                        call.network_seconds += time.perf_counter() - waited
+                    started = True
+                    yield token
+            except LLMError as e:
+                if started or not e.retryable or attempt >= self.max_retries:
+                    raise
+                error = e
+            finally:
+                self._slots.release()
+            self._backoff(attempt, error)
+            attempt += 1
+
+
+def create_llm_client(backend="openai", api_key=None, **options):
+    """
+    Build an LLMClient from config values.
+    backend: "openai" (needs api_key) or "fake" (offline stand-in).
+    """
+    client_options = {
+        key: options.pop(key)
+        for key in ("model", "max_concurrency", "max_retries", "backoff_base", "backoff_max",
+                    "acquire_timeout", "observer")
+        if key in options
+    }
+    if backend == "fake":
+        return LLMClient(FakeBackend(**options), **client_options)
+    if backend == "openai":
+        if not api_key:
+            raise ValueError("No OpenAI API key found. Please set OPENAI_API_KEY in your .env.")
+        return LLMClient(OpenAIBackend(api_key, **options), **client_options)
+    raise ValueError(f"Unknown LLM backend: {backend}")
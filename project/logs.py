@@ -0,0 +1,53 @@
+"""
+Leveled, non-blocking logging.
+
+Request threads only put records on an in-memory queue (QueueHandler);
+a single background QueueListener thread formats them and writes to
+stderr, so slow terminal or pipe I/O never stalls a request.
+"""
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(process)d] %(name)s: %(message)s"
+
+_listener = None
+
+
+def _start_listener(log_queue, handler):
+    global _listener
+    _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+
+
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
+
+
+def setup_logging(name="chefbot", level="INFO"):
+    """
+    Return the `name` logger, routed through a queue to stderr.
+    Safe to call more than once; only the first call installs handlers.
+    """
+    logger = logging.getLogger(name)
+    if _listener is not None:
+        return logger
+
+    log_queue = queue.SimpleQueue()
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    logger.setLevel(str(level).upper())
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.propagate = False
+
+    _start_listener(log_queue, handler)
+    atexit.register(_stop_listener)
+    if hasattr(os, "register_at_fork"):
+        # Threads don't survive fork (e.g. gunicorn --preload); restart the listener in the child
+        os.register_at_fork(after_in_child=lambda: _start_listener(log_queue, handler))
+    return logger
@@ -0,0 +1,219 @@
+"""
+Bulk meal-planning batches.
+
+A batch is a list of (ingredients, preferences, count) jobs run on a
+bounded worker pool. Results are kept per batch in completion order so
+they can be streamed as they finish or polled later by batch ID.
+Finished batches are kept for `ttl` seconds.
+
+Batches live in the memory of the worker that runs them. Give the runner
+a shared status_store (e.g. a stores.SQLiteStore) to let any worker
+answer polls; without one, polls must reach the worker that took the batch.
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class BatchRejected(Exception):
+    """
+    Raised by submit() when a batch is invalid or the runner is full.
+    `status` is the HTTP status to answer with.
+    """
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class Batch:
+    __slots__ = ('id', 'total', 'created', 'finished_at', 'results', 'failed', 'cond')
+
+    def __init__(self, total):
+        self.id = uuid.uuid4().hex[:12]
+        self.total = total
+        self.created = time.time()
+        self.finished_at = None
+        self.results = []   # per-job results, in completion order
+        self.failed = 0
+        self.cond = threading.Condition()
+
+    @property
+    def done(self):
+        return len(self.results) >= self.total
+
+    def summary(self):
+        return {
+            'batch_id': self.id,
+            'total': self.total,
+            'completed': len(self.results),
+            'failed': self.failed,
+            'done': self.done,
+        }
+
+
+class BatchRunner:
+    """
+    run_job(job) does the work for one normalized job dict and returns a
+    JSON-able result; exceptions become per-job errors.
+
+    max_pending bounds jobs queued or running across all batches, so a
+    burst of large batches is rejected instead of queueing without limit.
+
+    status_store, if given, gets each batch's summary under its ID and
+    each result under "<id>/<n>" (n in completion order), so lookup()
+    works from any worker that shares the store.
+    """
+
+    def __init__(self, run_job, max_workers=4, max_jobs_per_batch=500, max_pending=2000,
+                 max_count=10, ttl=3600.0, max_batches=1000, status_store=None):
+        self.run_job = run_job
+        self.status_store = status_store
+        self.max_jobs_per_batch = max_jobs_per_batch
+        self.max_pending = max_pending
+        self.max_count = max_count
+        self.ttl = ttl
+        self.max_batches = max_batches
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='meal-plan')
+        self._lock = threading.Lock()
+        self._batches = OrderedDict()
+        self._pending = 0
+        self.counters = {'batches': 0, 'jobs': 0, 'failed': 0, 'rejected': 0, 'publish_errors': 0}
+
+    def normalize_job(self, job, default_count=5):
+        """
+        Validate one job, returning {'ingredients', 'preferences', 'count'}.
+        """
+        if not isinstance(job, dict):
+            raise BatchRejected("Each job must be an object.")
+        ingredients = job.get('ingredients')
+        if not isinstance(ingredients, list) or not [i for i in ingredients if str(i).strip()]:
+            raise BatchRejected("Each job needs a non-empty 'ingredients' list.")
+        preferences = job.get('preferences') or {}
+        if not isinstance(preferences, dict):
+            raise BatchRejected("'preferences' must be an object.")
+        try:
+            count = int(job.get('count', default_count))
+        except (TypeError, ValueError):
+            raise BatchRejected("'count' must be a number.")
+        if not 1 <= count <= self.max_count:
+            raise BatchRejected(f"'count' must be between 1 and {self.max_count}.")
+        return {
+            'ingredients': [str(i).strip() for i in ingredients if str(i).strip()],
+            'preferences': preferences,
+            'count': count,
+        }
+
+    def submit(self, jobs):
+        """
+        Validate and schedule a batch. Returns the Batch.
+        """
+        if not isinstance(jobs, list) or not jobs:
+            raise BatchRejected("Please provide a non-empty 'jobs' list.")
+        if len(jobs) > self.max_jobs_per_batch:
+            raise BatchRejected(f"A batch can have at most {self.max_jobs_per_batch} jobs.", status=413)
+        jobs = [self.normalize_job(job) for job in jobs]
+
+        with self._lock:
+            self._expire()
+            if self._pending + len(jobs) > self.max_pending or len(self._batches) >= self.max_batches:
+                self.counters['rejected'] += 1
+                raise BatchRejected("Too many meal-plan jobs in progress, try again later.", status=503)
+            batch = Batch(len(jobs))
+            self._batches[batch.id] = batch
+            self._pending += len(jobs)
+            self.counters['batches'] += 1
+            self.counters['jobs'] += len(jobs)
+
+        if self.status_store is not None:
+            with batch.cond:
+                self._publish(batch, [])
+        for index, job in enumerate(jobs):
+            self._pool.submit(self._run, batch, index, job)
+        return batch
+
+    def _run(self, batch, index, job):
+        started = time.monotonic()
+        try:
+            result = {'job': index, 'status': 'ok', **self.run_job(job)}
+        except Exception as e:
+            result = {'job': index, 'status': 'error', 'error': str(e)}
+        result['elapsed_ms'] = round((time.monotonic() - started) * 1000, 1)
+
+        with self._lock:
+            self._pending -= 1
+            if result['status'] == 'error':
+                self.counters['failed'] += 1
+        with batch.cond:
+            if result['status'] == 'error':
+                batch.failed += 1
+            batch.results.append(result)
+            if batch.done:
+                batch.finished_at = time.time()
+            if self.status_store is not None:
+                self._publish(batch, [(f"{batch.id}/{len(batch.results) - 1}", result)])
+            batch.cond.notify_all()
+
+    def _publish(self, batch, items):
+        # Called under batch.cond, so summaries are written in order. The
+        # result goes in the same flush as the summary that counts it.
+        try:
+            self.status_store.set_many(items + [(batch.id, batch.summary())], ttl=self.ttl)
+            self.status_store.flush()
+        except Exception:
+            # Polls from this worker still work; only other workers miss out
+            with self._lock:
+                self.counters['publish_errors'] += 1
+
+    def _expire(self):
+        now = time.time()
+        for batch_id in list(self._batches):
+            batch = self._batches[batch_id]
+            if batch.finished_at is not None and now - batch.finished_at > self.ttl:
+                del self._batches[batch_id]
+
+    def get(self, batch_id):
+        with self._lock:
+            return self._batches.get(batch_id)
+
+    def iter_results(self, batch, timeout=None):
+        """
+        Yield the batch's job results as they finish, until all are done
+        or no result arrives within timeout seconds.
+        """
+        cursor = 0
+        while True:
+            with batch.cond:
+                if cursor >= len(batch.results) and not batch.done:
+                    batch.cond.wait(timeout)
+                new = batch.results[cursor:]
+            if not new:
+                return
+            cursor += len(new)
+            yield from new
+
+    def status(self, batch, since=0):
+        """
+        Batch progress plus the results from index `since` on, for polling.
+        """
+        with batch.cond:
+            return dict(batch.summary(), results=batch.results[since:], next=len(batch.results))
+
+    def lookup(self, batch_id, since=0):
+        """
+        Status of a batch (as status() returns it) from the status_store,
+        for batches run by another worker. None if unknown or expired.
+        """
+        if self.status_store is None:
+            return None
+        summary = self.status_store.get(batch_id)
+        if summary is None:
+            return None
+        results = [self.status_store.get(f"{batch_id}/{n}") for n in range(since, summary['completed'])]
+        return dict(summary, results=[r for r in results if r is not None], next=summary['completed'])
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, pending=self._pending, batches_kept=len(self._batches))
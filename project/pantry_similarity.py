@@ -0,0 +1,171 @@
+"""
+Near-duplicate pantry matching with MinHash + LSH.
+
+Exact-key caching misses pantries that differ by an ingredient or two
+("chicken, rice, garlic, onion" vs. the same plus "salt"). This index maps
+each generated pantry to its recipe cache key; a new pantry whose Jaccard
+similarity to a stored one passes the threshold (with the same
+preferences) reuses that cached batch instead of calling GPT.
+
+Entries hold only the ingredient set, the cache key and one packed 64-bit
+key per band (in an array('Q')); each bucket is a small list of cache keys.
+Entries are evicted least recently used past max_entries, so memory stays
+bounded.
+"""
+import random
+import threading
+import zlib
+from array import array
+from collections import OrderedDict
+
+from recipe_cache import normalize_ingredients, normalize_preferences
+
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_MASK64 = (1 << 64) - 1
+
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class PantrySimilarityIndex:
+    """
+    MinHash signatures (num_perm hashes) split into LSH bands. Pantries that
+    share any band bucket are candidates; candidates are then scored by
+    exact Jaccard similarity on their ingredient sets.
+    """
+
+    def __init__(self, threshold=0.75, num_perm=64, bands=16, max_entries=100000, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.max_entries = max_entries
+        rng = random.Random(seed)
+        self._perms = [
+            (rng.randrange(1, _PRIME), rng.randrange(0, _PRIME)) for _ in range(num_perm)
+        ]
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # cache_key -> (ingredient set, prefs key, array('Q') of bucket keys)
+        self._buckets = {}             # bucket key -> list of cache keys
+        self.lookups = 0
+        self.hits = 0
+        self.evictions = 0
+        self._score_total = 0.0
+
+    def signature(self, ingredients):
+        hashes = [zlib.crc32(i.encode("utf-8")) for i in ingredients]
+        return [
+            min(((a * h + b) % _PRIME) & _MAX_HASH for h in hashes) if hashes else 0
+            for a, b in self._perms
+        ]
+
+    def _bucket_keys(self, ingredients, prefs_key):
+        # One int per band, mixing the preferences, the band number and its rows
+        sig = self.signature(ingredients)
+        rows = self.rows
+        return array("Q", (
+            hash((prefs_key, band, *sig[band * rows:(band + 1) * rows])) & _MASK64
+            for band in range(self.bands)
+        ))
+
+    @staticmethod
+    def _normalize(ingredients, preferences):
+        return frozenset(normalize_ingredients(ingredients)), ",".join(normalize_preferences(preferences))
+
+    def add(self, ingredients, preferences, cache_key):
+        """
+        Remember that cache_key holds the recipes generated for this pantry.
+        """
+        ingredient_set, prefs_key = self._normalize(ingredients, preferences)
+        if not ingredient_set:
+            return
+        bucket_keys = self._bucket_keys(ingredient_set, prefs_key)
+        with self._lock:
+            if cache_key in self._entries:
+                self._entries.move_to_end(cache_key)
+                return
+            self._entries[cache_key] = (ingredient_set, prefs_key, bucket_keys)
+            for bucket in bucket_keys:
+                members = self._buckets.get(bucket)
+                if members is None:
+                    self._buckets[bucket] = [cache_key]
+                elif cache_key not in members:
+                    members.append(cache_key)
+            while len(self._entries) > self.max_entries:
+                self._evict_oldest()
+
+    def _evict_oldest(self):
+        cache_key, (_, _, bucket_keys) = self._entries.popitem(last=False)
+        for bucket in bucket_keys:
+            members = self._buckets.get(bucket)
+            if members is not None and cache_key in members:
+                members.remove(cache_key)
+                if not members:
+                    del self._buckets[bucket]
+        self.evictions += 1
+
+    def lookup(self, ingredients, preferences, threshold=None):
+        """
+        Find the most similar stored pantry with the same preferences.
+        Returns (cache_key, similarity), or (None, best_similarity_seen)
+        when nothing passes the threshold.
+        """
+        threshold = self.threshold if threshold is None else threshold
+        ingredient_set, prefs_key = self._normalize(ingredients, preferences)
+        if not ingredient_set:
+            return None, 0.0
+        bucket_keys = self._bucket_keys(ingredient_set, prefs_key)
+
+        with self._lock:
+            self.lookups += 1
+            candidates = set()
+            for bucket in bucket_keys:
+                members = self._buckets.get(bucket)
+                if members is not None:
+                    candidates.update(members)
+
+            best_key, best_score = None, 0.0
+            for cache_key in candidates:
+                stored_set, stored_prefs, _ = self._entries[cache_key]
+                # Band keys are hashes; never reuse across preference sets
+                if stored_prefs != prefs_key:
+                    continue
+                score = jaccard(ingredient_set, stored_set)
+                if score > best_score:
+                    best_key, best_score = cache_key, score
+
+            if best_key is None or best_score < threshold:
+                return None, best_score
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            self._score_total += best_score
+            return best_key, best_score
+
+    def discard(self, cache_key):
+        """
+        Forget a pantry, e.g. because its cached recipes expired.
+        """
+        with self._lock:
+            if cache_key not in self._entries:
+                return
+            self._entries.move_to_end(cache_key, last=False)
+            self._evict_oldest()
+            self.evictions -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "buckets": len(self._buckets),
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / self.lookups) if self.lookups else 0.0,
+                "avg_similarity": (self._score_total / self.hits) if self.hits else 0.0,
+            }
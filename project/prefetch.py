@@ -0,0 +1,170 @@
+"""
+Speculative prefetch of the next fresh recipe batch per session.
+
+After a session is shown a batch, the next "I want new recipes" batch for
+the same pantry is generated in a small background pool, so that request
+can be answered from memory. Each session holds at most one prefetched
+batch, tied to the (ingredients, preferences) it was made for; a batch
+for a different pantry is cancelled and replaced.
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from recipe_cache import make_cache_key
+
+
+class _Slot:
+    __slots__ = ('fingerprint', 'preferences', 'future', 'created')
+
+    def __init__(self, fingerprint, preferences, future):
+        self.fingerprint = fingerprint
+        self.preferences = preferences
+        self.future = future
+        self.created = time.monotonic()
+
+
+class RecipePrefetcher:
+    """
+    generate(ingredients, preferences) produces a fresh batch.
+
+    max_in_flight caps prefetches queued or running across all sessions;
+    per_session_limit caps how many prefetches a session may trigger
+    without using one; ttl (seconds) expires unused batches.
+    """
+
+    def __init__(self, generate, max_workers=4, max_in_flight=8, per_session_limit=2,
+                 ttl=600.0, max_sessions=10000, wait_timeout=60.0):
+        self.generate = generate
+        self.max_in_flight = max_in_flight
+        self.per_session_limit = per_session_limit
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.wait_timeout = wait_timeout
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='recipe-prefetch')
+        # Re-entrant: future callbacks can run synchronously under the lock
+        self._lock = threading.RLock()
+        self._slots = OrderedDict()   # session_id -> _Slot
+        self._unused = OrderedDict()  # session_id -> prefetches since the last hit
+        self._in_flight = 0
+        self.counters = {
+            'scheduled': 0,
+            'hits': 0,           # served a ready batch
+            'joined': 0,         # served a batch that was still being generated
+            'misses': 0,
+            'cancelled': 0,      # replaced because the pantry changed
+            'expired': 0,
+            'failed': 0,
+            'skipped_global': 0,
+            'skipped_session': 0,
+        }
+
+    @staticmethod
+    def fingerprint(ingredients, preferences):
+        return make_cache_key(ingredients, preferences, fresh_call=True)
+
+    def schedule(self, session_id, ingredients, preferences):
+        """
+        Start prefetching the next batch for this session, unless one for
+        the same pantry is already pending or ready. Returns True if a
+        prefetch was started.
+        """
+        fingerprint = self.fingerprint(ingredients, preferences)
+        with self._lock:
+            slot = self._slots.get(session_id)
+            if slot is not None:
+                if slot.fingerprint == fingerprint and not self._expired(slot):
+                    self._slots.move_to_end(session_id)
+                    return False
+                self._drop(session_id, 'cancelled' if slot.fingerprint != fingerprint else 'expired')
+
+            if self._unused.get(session_id, 0) >= self.per_session_limit:
+                self.counters['skipped_session'] += 1
+                return False
+            if self._in_flight >= self.max_in_flight:
+                self.counters['skipped_global'] += 1
+                return False
+
+            self._in_flight += 1
+            self.counters['scheduled'] += 1
+            self._unused[session_id] = self._unused.pop(session_id, 0) + 1
+            future = self._pool.submit(self.generate, ingredients, preferences)
+            future.add_done_callback(self._on_done)
+            self._slots[session_id] = _Slot(fingerprint, preferences, future)
+            while len(self._slots) > self.max_sessions:
+                self._drop(next(iter(self._slots)), 'expired')
+            while len(self._unused) > self.max_sessions:
+                self._unused.popitem(last=False)
+        return True
+
+    def _on_done(self, future):
+        with self._lock:
+            self._in_flight -= 1
+
+    def _expired(self, slot):
+        return slot.future.done() and time.monotonic() - slot.created > self.ttl
+
+    def _drop(self, session_id, reason):
+        slot = self._slots.pop(session_id, None)
+        if slot is not None:
+            slot.future.cancel()
+            self.counters[reason] += 1
+
+    def take(self, session_id, ingredients, preferences):
+        """
+        Return the prefetched batch for this session and pantry, waiting
+        for it if it is still being generated, or None on a miss.
+        """
+        fingerprint = self.fingerprint(ingredients, preferences)
+        with self._lock:
+            slot = self._slots.get(session_id)
+            if slot is None or slot.fingerprint != fingerprint or self._expired(slot):
+                if slot is not None:
+                    self._drop(session_id, 'cancelled' if slot.fingerprint != fingerprint else 'expired')
+                self.counters['misses'] += 1
+                return None
+            del self._slots[session_id]
+            ready = slot.future.done()
+
+        try:
+            recipes = slot.future.result(timeout=self.wait_timeout)
+        except Exception:
+            with self._lock:
+                self.counters['failed'] += 1
+                self.counters['misses'] += 1
+            return None
+
+        with self._lock:
+            if not recipes:
+                self.counters['misses'] += 1
+                return None
+            self.counters['hits' if ready else 'joined'] += 1
+            self._unused.pop(session_id, None)
+        return recipes
+
+    def preferences(self, session_id):
+        """
+        The preferences this session's pending batch was scheduled with,
+        or None, for requests that don't resend them.
+        """
+        with self._lock:
+            slot = self._slots.get(session_id)
+            return slot.preferences if slot is not None else None
+
+    def cancel(self, session_id):
+        with self._lock:
+            self._drop(session_id, 'cancelled')
+
+    def stats(self):
+        with self._lock:
+            served = self.counters['hits'] + self.counters['joined']
+            lookups = served + self.counters['misses']
+            return dict(
+                self.counters,
+                in_flight=self._in_flight,
+                sessions=len(self._slots),
+                hit_rate=(served / lookups) if lookups else 0.0,
+                # Share of generated batches that were actually served
+                use_rate=(served / self.counters['scheduled']) if self.counters['scheduled'] else 0.0,
+            )
@@ -0,0 +1,281 @@
+"""
+Prompt template registry.
+
+Every GPT prompt is built once at import: the fixed prefix (system
+instructions + few-shot examples) is assembled into ready-made message
+dicts and its token count is computed up front, so a call only formats
+the final user message. Templates come in variants ("full" by default,
+"compact" opt-in) selected with CHEFBOT_PROMPT_VARIANT, and each template
+keeps call / token / latency counters so variants can be compared
+(exported on /metrics).
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from conversation import estimate_tokens
+
+# Prompt + completion tokens allowed per call (the model's context window)
+TOKEN_BUDGET = int(os.getenv('CHEFBOT_PROMPT_TOKEN_BUDGET', '4096'))
+
+# Per-message overhead of the chat format (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+class PromptBudgetError(ValueError):
+    """
+    Raised when a rendered prompt plus its max_tokens would not fit the
+    token budget.
+    """
+
+
+def compact_json(value):
+    """
+    JSON without indentation or spaces after separators.
+    """
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False)
+
+
+def format_preferences(preferences):
+    """
+    {"vegan": True, "glutenfree": False} => "vegan"; nothing enabled => "none".
+    """
+    enabled = [key for key, value in (preferences or {}).items() if value]
+    return ", ".join(enabled) if enabled else "none"
+
+
+def count_message_tokens(messages):
+    return sum(estimate_tokens(m['content']) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+class PromptTemplate:
+    """
+    A fixed message prefix plus a user message format string.
+    The prefix dicts are shared between calls and must not be mutated.
+    """
+
+    def __init__(self, name, variant, system, user, examples=(), max_tokens=300, temperature=0.7):
+        self.name = name
+        self.variant = variant
+        self.system = system
+        self.user = user
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+
+        prefix = [{"role": "system", "content": system}]
+        for example_user, example_assistant in examples:
+            prefix.append({"role": "user", "content": example_user})
+            prefix.append({"role": "assistant", "content": example_assistant})
+        self.prefix = tuple(prefix)
+        self.prefix_tokens = count_message_tokens(self.prefix)
+
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.seconds = 0.0
+
+    def render(self, max_tokens=None, budget=None, **fields):
+        """
+        Return (messages, prompt_tokens) for one call, raising
+        PromptBudgetError if it wouldn't fit the token budget.
+        """
+        content = self.user.format(**fields)
+        messages = list(self.prefix)
+        messages.append({"role": "user", "content": content})
+        prompt_tokens = self.prefix_tokens + estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+        self.check_budget(prompt_tokens, max_tokens, budget)
+        return messages, prompt_tokens
+
+    def check_budget(self, prompt_tokens, max_tokens=None, budget=None):
+        max_tokens = self.max_tokens if max_tokens is None else max_tokens
+        budget = TOKEN_BUDGET if budget is None else budget
+        if prompt_tokens + max_tokens > budget:
+            raise PromptBudgetError(
+                f"Prompt '{self.name}' ({self.variant}) needs {prompt_tokens} + {max_tokens} tokens, "
+                f"budget is {budget}"
+            )
+
+    @contextmanager
+    def timed(self, prompt_tokens):
+        """
+        Record one call's prompt tokens and wall time: `with template.timed(n): ...`
+        """
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.calls += 1
+                self.prompt_tokens += prompt_tokens
+                self.seconds += time.monotonic() - started
+
+    def stats(self):
+        with self._lock:
+            return {
+                "prefix_tokens": self.prefix_tokens,
+                "calls": self.calls,
+                "prompt_tokens": self.prompt_tokens,
+                "seconds": self.seconds,
+                "avg_prompt_tokens": (self.prompt_tokens / self.calls) if self.calls else 0.0,
+                "avg_latency_ms": (self.seconds * 1000 / self.calls) if self.calls else 0.0,
+            }
+
+# ----------------------------------------------------------------
+# TEMPLATES
+# ----------------------------------------------------------------
+
+_RECIPE_KEYS = "title, ingredients, macros, instructions, servings"
+
+_FULL_RECIPES_SYSTEM = (
+    "You are ChefBot, a helpful and knowledgeable cooking assistant. "
+    "Your goal is to generate high-quality, creative, and well-balanced recipes based on user input. "
+    "Follow these steps before providing the final JSON response:\n\n"
+
+    "1 **Analyze Ingredients:** Carefully review the given ingredients and think about their compatibility. "
+    "Consider common cooking techniques that work well for these ingredients.\n\n"
+
+    "2 **Select a Recipe Style:** Decide if the recipe should be a salad, soup, main dish, or side dish. "
+    "Choose based on ingredient suitability and cooking methods.\n\n"
+
+    "3 **Ensure Nutritional Balance:** Make sure the recipe includes a balance of proteins, carbs, and healthy fats. "
+    "If an ingredient list lacks a key macronutrient, suggest minor improvements.\n\n"
+
+    "4 **Check Flavor Pairings:** Consider how the ingredients will taste together. "
+    "Use herbs, spices, and seasoning to enhance flavors without overpowering the dish.\n\n"
+
+    "5 **Generate a Step-by-Step Cooking Process:** Provide clear, structured cooking instructions. "
+    "Ensure that steps follow a logical order and are easy to follow.\n\n"
+
+    "6 **Format the Response as JSON:** Provide ONLY valid JSON with the following keys: "
+    "'title', 'ingredients', 'macros', 'instructions', and 'servings'. "
+    "DO NOT include explanations, comments, or extra text outside of the JSON response.\n"
+)
+
+_COMPACT_RECIPES_SYSTEM = (
+    "You are ChefBot, a cooking assistant. Create creative, well-balanced recipes "
+    "(protein, carbs, healthy fats) with compatible flavors and clear, ordered steps. "
+    f"Reply with ONLY a JSON array of objects with keys: {_RECIPE_KEYS}. No other text."
+)
+
+_EXAMPLE_RECIPES = [
+    {
+        "title": "Cheesy Tomato & Onion Bake",
+        "ingredients": ["2 tomatoes", "1 onion", "1 cup cheese"],
+        "macros": "Calories: 300, Fat: 15g, Protein: 12g, Carbs: 28g",
+        "instructions": "1. Preheat oven to 200°C. 2. Slice tomatoes and onions. 3. Layer slices in a baking dish, sprinkling cheese between layers. 4. Bake for 20 minutes until cheese is melted and golden.",
+        "servings": 2,
+    },
+    {
+        "title": "Creamy Mushroom Pasta",
+        "ingredients": ["200g pasta", "1 cup mushrooms", "1/2 cup cream"],
+        "macros": "Calories: 450, Fat: 20g, Protein: 15g, Carbs: 55g",
+        "instructions": "1. Cook pasta until al dente, then drain. 2. Sauté mushrooms in a pan until softened. 3. Add cream and simmer for 2-3 minutes. 4. Toss pasta with the sauce, mixing well. 5. Serve hot, optionally garnished with parsley or cheese.",
+        "servings": 2,
+    },
+]
+
+_RECIPES_USER = (
+    "I have these ingredients: {ingredients}. "
+    "My preferences are: {preferences}. "
+    "Generate exactly {count} recipe ideas in valid JSON array form, "
+    "each with title, ingredients, macros, instructions, everything scaled to 2 servings. "
+    "No extra text, no extra keys.{fresh}"
+)
+
+_STRICT_SYSTEM = (
+    "You are ChefBot, a helpful cooking assistant. "
+    f"Provide ONLY valid JSON with keys: {_RECIPE_KEYS}. "
+    "No extra text outside JSON."
+)
+
+_STRICT_USER = (
+    "Using ONLY these ingredients: {ingredients} "
+    "(plus salt, pepper, oil and water), "
+    "generate exactly {count} recipe ideas in valid JSON array form. "
+    "My preferences are: {preferences}. "
+    "Do not add any other ingredient. Everything scaled to 2 servings."
+)
+
+_VALIDATE_SYSTEM = (
+    "You are an AI assistant verifying that the following recipes strictly adhere "
+    "to the user's dietary preferences. If any recipe includes an ingredient that violates "
+    "the preferences, mark it as false.\n"
+    "Return ONLY a JSON array of true/false values, one per recipe, in the same order. "
+    "DO NOT add any extra text or explanations."
+)
+
+_COMPACT_VALIDATE_SYSTEM = (
+    "You are verifying recipes against dietary preferences. "
+    "Reply with ONLY a JSON array of true/false, one per recipe in order; "
+    "false if any ingredient violates the preferences."
+)
+
+_VALIDATE_USER = (
+    "The user has these dietary preferences: {preferences}. "
+    "Check the following recipes and mark whether they comply.\n"
+    "Recipes: {recipes}"
+)
+
+_CHAT_SYSTEM = (
+    "You are ChefBot, a helpful cooking assistant. "
+    "Generate or discuss recipes based on user questions. "
+    "If CHOSEN_RECIPE_DETAILS is in the context, you can reference it. "
+    "Use JSON or structured text where relevant."
+)
+
+_NEW_RECIPES = "I want new recipes."
+
+
+def _build_registry():
+    full_examples = [
+        (_NEW_RECIPES, json.dumps([recipe], indent=2, ensure_ascii=False))
+        for recipe in _EXAMPLE_RECIPES
+    ]
+    compact_examples = [(_NEW_RECIPES, compact_json(_EXAMPLE_RECIPES[:1]))]
+
+    variants = {
+        "full": {
+            "recipes": PromptTemplate("recipes", "full", _FULL_RECIPES_SYSTEM, _RECIPES_USER,
+                                      full_examples, max_tokens=1000),
+            "validate": PromptTemplate("validate", "full", _VALIDATE_SYSTEM, _VALIDATE_USER,
+                                       temperature=0),
+        },
+        "compact": {
+            "recipes": PromptTemplate("recipes", "compact", _COMPACT_RECIPES_SYSTEM, _RECIPES_USER,
+                                      compact_examples, max_tokens=1000),
+            "validate": PromptTemplate("validate", "compact", _COMPACT_VALIDATE_SYSTEM, _VALIDATE_USER,
+                                       temperature=0),
+        },
+    }
+    # Already short; shared by both variants
+    for variant, templates in variants.items():
+        templates["strict_recipes"] = PromptTemplate("strict_recipes", variant, _STRICT_SYSTEM,
+                                                     _STRICT_USER, max_tokens=1000)
+        templates["chat"] = PromptTemplate("chat", variant, _CHAT_SYSTEM, "{question}")
+    return variants
+
+
+PROMPTS = _build_registry()
+
+PROMPT_VARIANT = os.getenv('CHEFBOT_PROMPT_VARIANT', 'full')
+if PROMPT_VARIANT not in PROMPTS:
+    raise ValueError(f"Unknown CHEFBOT_PROMPT_VARIANT {PROMPT_VARIANT!r}, expected one of {sorted(PROMPTS)}")
+
+
+def get_prompt(name, variant=None):
+    """
+    The template called `name` in the given (or configured) variant.
+    """
+    return PROMPTS[variant or PROMPT_VARIANT][name]
+
+
+def prompt_stats():
+    """
+    {variant: {template name: stats}} for comparing variants.
+    """
+    return {
+        variant: {name: template.stats() for name, template in templates.items()}
+        for variant, templates in PROMPTS.items()
+    }
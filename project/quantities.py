@@ -0,0 +1,265 @@
+"""
+Structured ingredient quantities and macros for serving-size scaling.
+
+Ingredient lines and macro strings are parsed once into small immutable
+records (quantity, unit, name / a numeric macro vector). Scaling is then
+a multiply from the original values plus unit normalization, so scaling
+the same recipe again never compounds.
+"""
+import re
+from fractions import Fraction
+
+# ----------------------------------------------------------------
+# UNITS
+# ----------------------------------------------------------------
+
+# alias -> canonical unit
+UNIT_ALIASES = {
+    "tsp": "tsp", "tsps": "tsp", "teaspoon": "tsp", "teaspoons": "tsp",
+    "tbsp": "tbsp", "tbsps": "tbsp", "tbs": "tbsp", "tablespoon": "tbsp", "tablespoons": "tbsp",
+    "cup": "cup", "cups": "cup",
+    "ml": "ml", "milliliter": "ml", "milliliters": "ml", "millilitre": "ml", "millilitres": "ml",
+    "l": "l", "liter": "l", "liters": "l", "litre": "l", "litres": "l",
+    "g": "g", "gram": "g", "grams": "g", "gr": "g",
+    "kg": "kg", "kilogram": "kg", "kilograms": "kg",
+    "oz": "oz", "ounce": "oz", "ounces": "oz",
+    "lb": "lb", "lbs": "lb", "pound": "lb", "pounds": "lb",
+}
+
+# canonical unit -> (family, size in the family's base unit)
+UNIT_FAMILIES = {
+    "tsp": ("us_volume", 1), "tbsp": ("us_volume", 3), "cup": ("us_volume", 48),
+    "ml": ("metric_volume", 1), "l": ("metric_volume", 1000),
+    "g": ("metric_mass", 1), "kg": ("metric_mass", 1000),
+    "oz": ("us_mass", 1), "lb": ("us_mass", 16),
+}
+
+# family -> [(unit, keep_at, promote_at)], largest unit first. An amount
+# stays in its unit while it is >= keep_at (in base units) and moves to a
+# different unit once it is >= that unit's promote_at.
+UNIT_LADDERS = {
+    "us_volume": [("cup", 12, 48), ("tbsp", 3, 3), ("tsp", 0, 0)],
+    "metric_volume": [("l", 100, 1000), ("ml", 0, 0)],
+    "metric_mass": [("kg", 100, 1000), ("g", 0, 0)],
+    "us_mass": [("lb", 4, 16), ("oz", 0, 0)],
+}
+
+UNIT_PLURALS = {"cup": "cups", "lb": "lbs"}
+
+# Units shown as fractions (cooks measure 3/4 cup, not 0.75 cup)
+FRACTION_UNITS = {"tsp", "tbsp", "cup", None}
+
+UNICODE_FRACTIONS = {
+    "½": "1/2", "⅓": "1/3", "⅔": "2/3", "¼": "1/4", "¾": "3/4",
+    "⅕": "1/5", "⅖": "2/5", "⅗": "3/5", "⅘": "4/5", "⅙": "1/6",
+    "⅚": "5/6", "⅛": "1/8", "⅜": "3/8", "⅝": "5/8", "⅞": "7/8",
+}
+_UNICODE_RE = re.compile("(\\d*)\\s*([" + "".join(UNICODE_FRACTIONS) + "])")
+
+_NUMBER = r"\d+\s+\d+/\d+|\d+/\d+|\d+(?:\.\d+)?"
+_QUANTITY_RE = re.compile(
+    rf"^(?P<low>{_NUMBER})(?:\s*(?:-|–|to)\s*(?P<high>{_NUMBER}))?\s*(?P<rest>.*)$"
+)
+_UNIT_RE = re.compile(r"^(?P<unit>[a-zA-Z]+)\.?(?=\s|$)\s*(?P<name>.*)$")
+
+
+def _expand_unicode_fractions(text):
+    # "1½" -> "1 1/2", "½" -> "1/2"
+    def repl(match):
+        whole, frac = match.group(1), UNICODE_FRACTIONS[match.group(2)]
+        return f"{whole} {frac}" if whole else frac
+    return _UNICODE_RE.sub(repl, text)
+
+
+def parse_number(text):
+    """
+    "2" -> 2, "1.5" -> 1.5, "1/2" -> 0.5, "1 1/2" -> 1.5
+    """
+    total = 0.0
+    for part in text.split():
+        if "/" in part:
+            num, den = part.split("/")
+            total += int(num) / int(den) if int(den) else 0
+        else:
+            total += float(part)
+    return total
+
+
+def format_amount(value, unit=None):
+    """
+    Human-friendly amount: common fractions for cups/spoons/counts
+    ("1 1/2", "3/4"), otherwise at most 2 decimals ("2.5", "300").
+    """
+    if unit in FRACTION_UNITS:
+        frac = Fraction(value).limit_denominator(8)
+        if abs(float(frac) - value) < 0.02 and frac.denominator in (1, 2, 3, 4, 8):
+            whole, rem = divmod(frac.numerator, frac.denominator)
+            if rem == 0:
+                return str(whole)
+            return f"{whole} {rem}/{frac.denominator}" if whole else f"{rem}/{frac.denominator}"
+    return format_decimal(value)
+
+
+def format_decimal(value):
+    """
+    At most 2 decimals, without trailing zeros: 22.5 -> "22.5", 300.0 -> "300".
+    """
+    rounded = round(value, 2)
+    if rounded == int(rounded):
+        return str(int(rounded))
+    return f"{rounded:.2f}".rstrip("0").rstrip(".")
+
+
+def normalize_unit(amount, unit):
+    """
+    Move an amount to the most readable unit in its family,
+    e.g. 6 tsp -> 2 tbsp, 1500 g -> 1.5 kg, 0.125 cup -> 2 tbsp.
+    """
+    if unit not in UNIT_FAMILIES:
+        return amount, unit
+    family, size = UNIT_FAMILIES[unit]
+    base = amount * size
+    for candidate, keep_at, promote_at in UNIT_LADDERS[family]:
+        if base >= (keep_at if candidate == unit else promote_at):
+            return base / UNIT_FAMILIES[candidate][1], candidate
+    return amount, unit
+
+# ----------------------------------------------------------------
+# INGREDIENTS
+# ----------------------------------------------------------------
+
+
+class Ingredient:
+    """
+    One parsed ingredient line. quantity is None when the line has no
+    leading amount (e.g. "salt to taste"); quantity_max is set for ranges.
+    """
+    __slots__ = ("raw", "quantity", "quantity_max", "unit", "name")
+
+    def __init__(self, raw, quantity=None, quantity_max=None, unit=None, name=""):
+        self.raw = raw
+        self.quantity = quantity
+        self.quantity_max = quantity_max
+        self.unit = unit
+        self.name = name
+
+    @classmethod
+    def parse(cls, line):
+        raw = str(line)
+        text = _expand_unicode_fractions(raw.strip())
+        match = _QUANTITY_RE.match(text)
+        if not match:
+            return cls(raw, name=raw.strip())
+
+        low = parse_number(match.group("low"))
+        high = parse_number(match.group("high")) if match.group("high") else None
+        rest = match.group("rest")
+
+        unit = None
+        unit_match = _UNIT_RE.match(rest)
+        if unit_match and unit_match.group("unit").lower() in UNIT_ALIASES:
+            unit = UNIT_ALIASES[unit_match.group("unit").lower()]
+            rest = unit_match.group("name")
+
+        return cls(raw, low, high, unit, rest.strip())
+
+    def scale(self, factor):
+        """
+        Return the ingredient line scaled by factor, from the original amount.
+        """
+        if self.quantity is None or factor == 1:
+            return self.raw
+
+        amount, unit = normalize_unit(self.quantity * factor, self.unit)
+        text = format_amount(amount, unit)
+        if self.quantity_max is not None:
+            # Keep both ends of a range in the same unit
+            high = self.quantity_max * factor
+            if unit != self.unit:
+                high = high * UNIT_FAMILIES[self.unit][1] / UNIT_FAMILIES[unit][1]
+            text += "-" + format_amount(high, unit)
+            amount = high
+
+        parts = [text]
+        if unit:
+            parts.append(UNIT_PLURALS[unit] if amount > 1 and unit in UNIT_PLURALS else unit)
+        if self.name:
+            parts.append(self.name)
+        return " ".join(parts)
+
+# ----------------------------------------------------------------
+# MACROS
+# ----------------------------------------------------------------
+
+_MACRO_RE = re.compile(r"^(?P<label>.*?):\s*(?P<value>\d+(?:\.\d+)?)(?P<unit>.*)$")
+
+
+class MacroVector:
+    """
+    Parsed macros string, e.g. "Calories: 300, Fat: 15g". Numeric values
+    are kept as one tuple so scaling is a single pass over floats; parts
+    without a number are carried through unchanged.
+    """
+    __slots__ = ("parts", "values")
+
+    def __init__(self, parts, values):
+        self.parts = parts    # (label, unit) for numeric parts, or raw text
+        self.values = values  # numeric values, in order of numeric parts
+
+    @classmethod
+    def parse(cls, macros_line):
+        parts, values = [], []
+        for part in str(macros_line).split(","):
+            part = part.strip()
+            match = _MACRO_RE.match(part)
+            if match:
+                parts.append((match.group("label"), match.group("unit")))
+                values.append(float(match.group("value")))
+            else:
+                parts.append(part)
+        return cls(tuple(parts), tuple(values))
+
+    def scale(self, factor):
+        scaled = iter([round(v * factor, 2) for v in self.values])
+        out = []
+        for part in self.parts:
+            if isinstance(part, tuple):
+                label, unit = part
+                # Macros are nutrition figures, never fractions
+                out.append(f"{label}: {format_decimal(next(scaled))}{unit}")
+            else:
+                out.append(part)
+        return ", ".join(out)
+
+# ----------------------------------------------------------------
+# RECIPES
+# ----------------------------------------------------------------
+
+
+class RecipeScaler:
+    """
+    A recipe's ingredients and macros, parsed once. scale_to(servings)
+    always starts from the original recipe, so it is idempotent.
+    """
+    __slots__ = ("recipe", "servings", "ingredients", "macros")
+
+    def __init__(self, recipe):
+        self.recipe = dict(recipe)
+        self.servings = recipe.get("servings", 2) or 2
+        self.ingredients = tuple(Ingredient.parse(i) for i in recipe.get("ingredients", []))
+        self.macros = MacroVector.parse(recipe["macros"]) if "macros" in recipe else None
+
+    def scale_to(self, servings):
+        """
+        Return a new recipe dict scaled to the given number of servings.
+        """
+        scaled = dict(self.recipe)
+        if servings == self.servings or self.servings <= 0:
+            return scaled
+
+        factor = servings / self.servings
+        scaled["ingredients"] = [i.scale(factor) for i in self.ingredients]
+        if self.macros is not None:
+            scaled["macros"] = self.macros.scale(factor)
+        scaled["servings"] = servings
+        return scaled
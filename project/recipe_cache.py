@@ -0,0 +1,317 @@
+"""
+Recipe generation cache.
+
+Sits in front of generate_recipes_with_gpt so that identical pantries
+(same ingredients, same preferences) are answered from a local lookup
+instead of a full GPT round trip.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+# ----------------------------------------------------------------
+# KEY NORMALIZATION
+# ----------------------------------------------------------------
+
+# Words that end in "s" but are not plurals
+_INVARIANT_WORDS = {
+    "asparagus", "bass", "citrus", "couscous", "grits", "hummus",
+    "molasses", "swiss", "octopus", "lemongrass", "watercress",
+}
+
+
+def singularize(word):
+    """
+    Very small English singularizer, good enough for pantry items.
+    e.g. "tomatoes" => "tomato", "berries" => "berry", "onions" => "onion".
+    """
+    if len(word) <= 3 or word in _INVARIANT_WORDS or word.endswith("ss"):
+        return word
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith("oes"):
+        return word[:-2]
+    if word.endswith(("ches", "shes", "xes", "zes")):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith("us"):
+        return word[:-1]
+    return word
+
+
+def normalize_ingredient(name):
+    """
+    Canonical form of a single ingredient name: lowercase, single spaces,
+    no punctuation and every word singularized.
+    e.g. "  Cherry   Tomatoes " => "cherry tomato"
+    """
+    words = re.findall(r"[a-z0-9]+", str(name).lower())
+    return " ".join(singularize(w) for w in words)
+
+
+def normalize_ingredients(ingredients):
+    """
+    Canonical, order-independent form of an ingredient list
+    (sorted, de-duplicated, empty entries dropped).
+    """
+    normalized = {normalize_ingredient(i) for i in ingredients or []}
+    normalized.discard("")
+    return sorted(normalized)
+
+
+def normalize_preferences(preferences):
+    """
+    Canonical form of the preferences dict. Only enabled preferences are
+    kept, so {"vegan": False} and {} map to the same key.
+    """
+    return sorted(
+        str(k).strip().lower()
+        for k, v in (preferences or {}).items()
+        if v
+    )
+
+
+def make_cache_key(ingredients, preferences, fresh_call=False):
+    """
+    Build a cache key that ignores ingredient order, case, whitespace
+    and plurals. Returns a hex digest.
+    """
+    payload = json.dumps(
+        [normalize_ingredients(ingredients), normalize_preferences(preferences), bool(fresh_call)],
+        separators=(",", ":"),
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+# ----------------------------------------------------------------
+# BACKENDS
+# ----------------------------------------------------------------
+
+
+class MemoryCacheBackend:
+    """
+    In-process LRU backend. Values are kept serialized so callers can
+    freely mutate what they get back.
+    """
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._data = OrderedDict()  # key -> (expires_at, payload)
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                self._data.move_to_end(key)
+            return item
+
+    def set(self, key, payload, expires_at):
+        with self._lock:
+            self._data[key] = (expires_at, payload)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def flush(self):
+        """
+        Nothing to commit for an in-process backend.
+        """
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteCacheBackend:
+    """
+    Local SQLite backend, shared by every gunicorn worker on the box.
+    LRU order is tracked with a last_access column. Hits only record the
+    access in memory; the touches are written in one transaction once
+    touch_batch of them pile up, touch_interval seconds pass, or before
+    the next eviction, so reads never take the write lock.
+    """
+
+    def __init__(self, path, max_entries=10000, touch_batch=64, touch_interval=5.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.touch_batch = touch_batch
+        self.touch_interval = touch_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._touches = {}   # key -> last access time, not yet written
+        self._last_flush = time.monotonic()
+        self.evictions = 0
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS recipe_cache ("
+            " key TEXT PRIMARY KEY,"
+            " payload TEXT NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS recipe_cache_lru ON recipe_cache (last_access)"
+        )
+        conn.commit()
+
+    def _conn(self):
+        # sqlite3 connections can't be shared across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT expires_at, payload FROM recipe_cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        with self._lock:
+            self._touches[key] = time.time()
+            due = (len(self._touches) >= self.touch_batch
+                   or time.monotonic() - self._last_flush >= self.touch_interval)
+        if due:
+            self.flush()
+        return row[0], row[1]
+
+    def flush(self):
+        """
+        Write the buffered LRU touches in one transaction.
+        """
+        with self._lock:
+            touches, self._touches = self._touches, {}
+            self._last_flush = time.monotonic()
+        if not touches:
+            return
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "UPDATE recipe_cache SET last_access = ? WHERE key = ?",
+                [(accessed, key) for key, accessed in touches.items()],
+            )
+
+    def set(self, key, payload, expires_at):
+        self.flush()
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO recipe_cache (key, payload, expires_at, last_access)"
+            " VALUES (?, ?, ?, ?)",
+            (key, payload, expires_at, time.time()),
+        )
+        count = conn.execute("SELECT COUNT(*) FROM recipe_cache").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            conn.execute(
+                "DELETE FROM recipe_cache WHERE key IN ("
+                " SELECT key FROM recipe_cache ORDER BY last_access LIMIT ?)",
+                (overflow,),
+            )
+            self.evictions += overflow
+        conn.commit()
+
+    def delete(self, key):
+        with self._lock:
+            self._touches.pop(key, None)
+        conn = self._conn()
+        conn.execute("DELETE FROM recipe_cache WHERE key = ?", (key,))
+        conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._touches.clear()
+        conn = self._conn()
+        conn.execute("DELETE FROM recipe_cache")
+        conn.commit()
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM recipe_cache").fetchone()[0]
+
+# ----------------------------------------------------------------
+# CACHE
+# ----------------------------------------------------------------
+
+
+class RecipeCache:
+    """
+    TTL cache for generated recipe batches on top of a pluggable backend.
+    Keeps hit/miss counters for this process.
+    """
+
+    def __init__(self, backend, ttl=3600):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    def get(self, key):
+        """
+        Return a fresh copy of the cached recipes for key, or None.
+        """
+        item = self.backend.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+
+        expires_at, payload = item
+        if expires_at < time.time():
+            self.backend.delete(key)
+            self.expired += 1
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return json.loads(payload)
+
+    def set(self, key, recipes):
+        payload = json.dumps(recipes, separators=(",", ":"))
+        self.backend.set(key, payload, time.time() + self.ttl)
+
+    def flush(self):
+        self.backend.flush()
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "evictions": self.backend.evictions,
+            "entries": len(self.backend),
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+        }
+
+
+def create_recipe_cache(backend="memory", path=None, ttl=3600, max_entries=1000):
+    """
+    Build a RecipeCache from config values.
+    backend: "memory" (per process) or "sqlite" (shared by all workers).
+    """
+    if backend == "sqlite":
+        path = path or os.path.join(tempfile.gettempdir(), "chefbot_recipe_cache.sqlite3")
+        return RecipeCache(SQLiteCacheBackend(path, max_entries), ttl)
+    if backend == "memory":
+        return RecipeCache(MemoryCacheBackend(max_entries), ttl)
+    raise ValueError(f"Unknown recipe cache backend: {backend}")
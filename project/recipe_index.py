@@ -0,0 +1,199 @@
+"""
+Local recipe corpus with an inverted ingredient index.
+
+Every stored recipe is indexed by the normalized words of its ingredient
+names, with compact integer postings. Queries find recipes that use only
+the given ingredients ("exact subset") or are missing at most k of them,
+so many strict-ingredient requests never need a GPT call.
+"""
+import json
+import re
+import threading
+from array import array
+from collections import Counter, deque
+
+from recipe_cache import normalize_ingredient
+from quantities import Ingredient
+
+# Always assumed to be in the pantry
+STAPLES = {"salt", "pepper", "black pepper", "oil", "olive oil", "vegetable oil", "water", "cooking spray"}
+
+# Words that describe an ingredient rather than name it
+_DESCRIPTORS = {
+    "fresh", "freshly", "chopped", "diced", "minced", "sliced", "large", "small", "medium",
+    "of", "to", "taste", "cooked", "uncooked", "boneless", "skinless", "grated", "shredded",
+    "optional", "for", "garnish", "and", "or", "whole", "finely", "roughly", "thinly", "peeled",
+    "cut", "into", "piece", "cubed", "crushed", "clove", "can", "slice", "pinch", "dash",
+    "handful", "bunch", "sprig", "stalk", "head", "a", "the", "some", "few", "ground",
+    "halved", "quartered", "drained", "rinsed", "divided", "plus", "more", "about",
+}
+_STAPLE_WORDS = {frozenset(s.split()) for s in STAPLES}
+
+
+def ingredient_words(line):
+    """
+    The normalized words naming an ingredient line,
+    e.g. "2 cloves garlic, minced" => frozenset({"garlic"}).
+    """
+    name = Ingredient.parse(line).name or str(line)
+    name = re.split(r"[,(]", name)[0]
+    words = normalize_ingredient(name).split()
+    return frozenset(w for w in words if w not in _DESCRIPTORS and not w.isdigit())
+
+
+def _is_staple(words):
+    return words in _STAPLE_WORDS
+
+
+def missing_ingredients(recipe, ingredients):
+    """
+    Number of the recipe's (non-staple) ingredients not covered by the
+    given ingredient list.
+    """
+    query = [w for w in (ingredient_words(i) for i in ingredients) if w]
+    needed = {
+        words for words in (ingredient_words(i) for i in recipe.get("ingredients", []))
+        if words and not _is_staple(words)
+    }
+    return sum(1 for words in needed if not any(q <= words for q in query))
+
+
+class RecipeIndex:
+    """
+    In-process recipe corpus. Each distinct ingredient (its word set) gets
+    an integer id; words map to the ingredient ids they appear in, and
+    ingredient ids map to sorted array('I') postings of doc ids. A query
+    then only counts postings: a doc's coverage is how many of its
+    ingredients the query covers, compared with its stored ingredient count.
+    Oldest docs are dropped past max_docs.
+    """
+
+    def __init__(self, max_docs=50000):
+        self.max_docs = max_docs
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._ingredient_ids = {}  # ingredient word set -> ingredient id
+        self._words = {}           # word -> array('I') of ingredient ids containing it
+        self._postings = []        # ingredient id -> array('I') of doc ids
+        self._docs = []            # doc id -> (ingredient count, recipe json, title key, ingredients) or None
+        self._by_title = {}        # normalized title -> doc id
+        self._order = deque()      # live doc ids, oldest first
+        self._live = 0
+
+    def __len__(self):
+        return self._live
+
+    def add(self, recipe):
+        """
+        Index one recipe. Recipes with a title already in the corpus are skipped.
+        Returns True if it was added.
+        """
+        title_key = " ".join(str(recipe.get("title", "")).lower().split())
+        ingredients = tuple(dict.fromkeys(
+            words for words in (ingredient_words(i) for i in recipe.get("ingredients", []))
+            if words and not _is_staple(words)
+        ))
+        if not title_key or not ingredients:
+            return False
+
+        payload = json.dumps(
+            {k: recipe.get(k) for k in ("title", "ingredients", "macros", "instructions", "servings")},
+            separators=(",", ":"),
+        )
+        with self._lock:
+            if title_key in self._by_title:
+                return False
+            self._insert(ingredients, payload, title_key)
+            if self._live > self.max_docs:
+                self._drop_oldest()
+        return True
+
+    def _insert(self, ingredients, payload, title_key):
+        doc_id = len(self._docs)
+        self._docs.append((len(ingredients), payload, title_key, ingredients))
+        self._by_title[title_key] = doc_id
+        self._order.append(doc_id)
+        self._live += 1
+        for words in ingredients:
+            ingredient_id = self._ingredient_ids.get(words)
+            if ingredient_id is None:
+                ingredient_id = self._ingredient_ids[words] = len(self._postings)
+                self._postings.append(array("I"))
+                for word in words:
+                    self._words.setdefault(word, array("I")).append(ingredient_id)
+            self._postings[ingredient_id].append(doc_id)
+
+    def _drop_oldest(self):
+        # Tombstone the oldest live doc; rebuild once half the ids are dead
+        doc_id = self._order.popleft()
+        self._by_title.pop(self._docs[doc_id][2], None)
+        self._docs[doc_id] = None
+        self._live -= 1
+        if self._live * 2 < len(self._docs):
+            docs = [d for d in self._docs if d is not None]
+            self._reset()
+            for _, payload, title_key, ingredients in docs:
+                self._insert(ingredients, payload, title_key)
+
+    def search(self, ingredients, max_missing=0, limit=5, accept=None):
+        """
+        Find recipes whose (non-staple) ingredients are all covered by the
+        query, or all but max_missing of them. A query ingredient covers a
+        recipe ingredient when all its words appear in it ("chicken" covers
+        "chicken breast").
+
+        accept(recipe), if given, filters matches (e.g. by preferences).
+        Returns a list of (recipe, missing_count, coverage) with the best
+        matches first.
+        """
+        query = [w for w in (ingredient_words(i) for i in ingredients) if w]
+        if not query:
+            return []
+
+        with self._lock:
+            # Ingredient ids covered by the query: all of a query item's words appear in them
+            covered_ids = set()
+            for words in query:
+                ids = [self._words.get(w) for w in words]
+                if any(i is None for i in ids):
+                    continue
+                ids.sort(key=len)
+                found = set(ids[0])
+                for i in ids[1:]:
+                    found.intersection_update(i)
+                covered_ids |= found
+
+            hits = Counter()
+            for ingredient_id in covered_ids:
+                hits.update(self._postings[ingredient_id])
+
+            matches = []
+            for doc_id, covered in hits.items():
+                doc = self._docs[doc_id]
+                if doc is None:
+                    continue
+                missing = doc[0] - covered
+                if missing <= max_missing:
+                    matches.append((missing, -covered / doc[0], doc_id, doc[1]))
+
+        matches.sort()
+        results = []
+        for missing, neg_coverage, _, payload in matches:
+            recipe = json.loads(payload)
+            if accept is not None and not accept(recipe):
+                continue
+            results.append((recipe, missing, -neg_coverage))
+            if len(results) >= limit:
+                break
+        return results
+
+    def stats(self):
+        with self._lock:
+            return {
+                "docs": self._live,
+                "words": len(self._words),
+                "ingredients": len(self._postings),
+                "postings": sum(len(p) for p in self._postings),
+            }
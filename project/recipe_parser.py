@@ -0,0 +1,173 @@
+"""
+Incremental, fault-tolerant parser for GPT recipe output.
+
+GPT is asked for a JSON array of recipes, but the reply may be wrapped in
+a markdown fence, followed by chatter, or cut off at max_tokens. Instead
+of an all-or-nothing json.loads, RecipeStreamParser consumes the reply
+chunk by chunk and hands back each recipe object as soon as its closing
+brace arrives. A truncated reply still yields every complete recipe
+before the cut.
+"""
+import json
+import re
+import time
+
+REQUIRED_KEYS = ('title', 'ingredients', 'macros', 'instructions')
+
+_FENCE_RE = re.compile(r"^\s*```[a-zA-Z]*\s*|\s*```\s*$")
+
+
+def strip_code_fences(text):
+    """
+    Remove a leading ```json / ``` fence and a trailing ``` fence.
+    """
+    return _FENCE_RE.sub("", text)
+
+
+def normalize_recipe(obj):
+    """
+    Check a parsed object against the recipe schema
+    (title/ingredients/macros/instructions/servings) and coerce near misses,
+    e.g. instructions given as a list or macros given as a dict.
+    Returns the cleaned recipe dict, or None if it can't be used.
+    """
+    if not isinstance(obj, dict):
+        return None
+    if any(key not in obj for key in REQUIRED_KEYS):
+        return None
+
+    title = obj['title']
+    ingredients = obj['ingredients']
+    if not isinstance(title, str) or not title.strip():
+        return None
+    if isinstance(ingredients, str):
+        ingredients = [i.strip() for i in ingredients.split(',') if i.strip()]
+    if not isinstance(ingredients, list) or not ingredients:
+        return None
+
+    macros = obj['macros']
+    if isinstance(macros, dict):
+        macros = ", ".join(f"{k}: {v}" for k, v in macros.items())
+
+    instructions = obj['instructions']
+    if isinstance(instructions, list):
+        instructions = " ".join(
+            f"{i}. {step}" for i, step in enumerate(instructions, start=1)
+        )
+
+    try:
+        servings = int(obj.get('servings', 2))
+    except (TypeError, ValueError):
+        servings = 2
+
+    return {
+        'title': title.strip(),
+        'ingredients': [str(i) for i in ingredients],
+        'macros': str(macros),
+        'instructions': str(instructions),
+        'servings': servings if servings > 0 else 2,
+    }
+
+
+class RecipeStreamParser:
+    """
+    Feed text chunks with feed(); each call returns the recipes completed
+    by that chunk. Only top-level objects (directly inside the array, or
+    bare objects) are emitted; anything outside them is ignored.
+
+    `seconds` accumulates the time spent inside feed().
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0          # next character to scan in _buffer
+        self._depth = 0        # current {} / [] nesting depth
+        self._obj_start = None
+        self._obj_depth = 0    # depth at which emitted objects open
+        self._in_string = False
+        self._escape = False
+        self._seen_open = False
+        self.parsed = 0
+        self.rejected = 0
+        self.seconds = 0.0
+
+    def feed(self, chunk):
+        started = time.perf_counter()
+        self._buffer += chunk
+        recipes = []
+        buf = self._buffer
+        i = self._pos
+
+        while i < len(buf):
+            ch = buf[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                if self._depth > 0:
+                    self._in_string = True
+            elif ch in '[{':
+                if not self._seen_open:
+                    # An outer array means recipes live one level down
+                    self._seen_open = True
+                    self._obj_depth = 1 if ch == '[' else 0
+                if ch == '{' and self._depth == self._obj_depth and self._obj_start is None:
+                    self._obj_start = i
+                self._depth += 1
+            elif ch in ']}':
+                if self._depth > 0:
+                    self._depth -= 1
+                if ch == '}' and self._depth == self._obj_depth and self._obj_start is not None:
+                    recipe = self._emit(buf[self._obj_start:i + 1])
+                    if recipe is not None:
+                        recipes.append(recipe)
+                    self._obj_start = None
+                    # Drop everything already consumed
+                    buf = buf[i + 1:]
+                    i = -1
+            i += 1
+
+        self._buffer = buf
+        self._pos = i
+        self.seconds += time.perf_counter() - started
+        return recipes
+
+    def _emit(self, text):
+        try:
+            obj = json.loads(text)
+        except json.JSONDecodeError:
+            self.rejected += 1
+            return None
+        recipe = normalize_recipe(obj)
+        if recipe is None:
+            self.rejected += 1
+        else:
+            self.parsed += 1
+        return recipe
+
+    def close(self):
+        """
+        Finish parsing. Returns True if the reply ended cleanly, False if
+        it was truncated mid-object (that partial object is discarded).
+        """
+        complete = self._obj_start is None and self._depth == 0
+        self._buffer = ""
+        self._pos = 0
+        return complete
+
+
+def iter_recipes(chunks, parser=None):
+    """
+    Yield recipes from an iterable of text chunks (e.g. a streamed
+    completion) as soon as each one is complete. Pass a parser to read
+    its counters afterwards.
+    """
+    parser = parser or RecipeStreamParser()
+    for chunk in chunks:
+        for recipe in parser.feed(chunk):
+            yield recipe
+    parser.close()
@@ -0,0 +1,150 @@
+"""
+Request coalescing ("singleflight") for expensive calls.
+
+Concurrent calls with the same key share one execution: the first caller
+runs the function, everyone else waits for its result (or its exception).
+Optionally, a lock file also serializes the same key across gunicorn
+workers, so a worker that waited can pick the result up from a shared
+cache instead of calling upstream again. Keys are hashed onto a fixed set
+of lock files (stripes), so the lock directory never grows.
+"""
+import hashlib
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: cross-worker coalescing is unavailable
+    fcntl = None
+
+
+class SingleFlightTimeout(TimeoutError):
+    """
+    Raised to a waiter whose per-key timeout ran out before the shared
+    call finished.
+    """
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls by key within this process, and across
+    processes when lock_dir is set (POSIX only). Two keys that share a
+    lock stripe are serialized across workers, but never coalesced.
+    """
+
+    def __init__(self, timeout=60.0, lock_dir=None, lock_stripes=256):
+        self.timeout = timeout
+        self.lock_stripes = lock_stripes
+        self.lock_dir = lock_dir if fcntl is not None else None
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.counters = {
+            'calls': 0,
+            'executions': 0,
+            'coalesced': 0,
+            'shared_hits': 0,
+            'timeouts': 0,
+            'errors': 0,
+        }
+
+    def do(self, key, fn, timeout=None, lookup=None):
+        """
+        Run fn() once for all concurrent callers with this key and return
+        its result to each of them. If fn raises, every waiter gets the
+        same exception.
+
+        lookup(), if given, is tried after acquiring the cross-worker lock;
+        a non-None result is returned without calling fn (another worker
+        already did the work).
+        """
+        timeout = self.timeout if timeout is None else timeout
+        with self._lock:
+            self.counters['calls'] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+                self.counters['coalesced'] += 1
+
+        if not leader:
+            if not call.done.wait(timeout):
+                with self._lock:
+                    self.counters['timeouts'] += 1
+                raise SingleFlightTimeout(f"Timed out waiting for in-flight call {key!r}")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._run_leader(key, fn, timeout, lookup)
+        except BaseException as e:
+            call.error = e
+            with self._lock:
+                self.counters['errors'] += 1
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result
+
+    def _run_leader(self, key, fn, timeout, lookup):
+        if not self.lock_dir:
+            with self._lock:
+                self.counters['executions'] += 1
+            return fn()
+
+        digest = hashlib.sha1(str(key).encode('utf-8')).digest()
+        stripe = int.from_bytes(digest[:4], 'big') % self.lock_stripes
+        path = os.path.join(self.lock_dir, f"stripe-{stripe:04d}.lock")
+        with open(path, 'a') as lock_file:
+            self._flock(lock_file, timeout)
+            try:
+                if lookup is not None:
+                    shared = lookup()
+                    if shared is not None:
+                        with self._lock:
+                            self.counters['shared_hits'] += 1
+                        return shared
+                with self._lock:
+                    self.counters['executions'] += 1
+                return fn()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _flock(self, lock_file, timeout):
+        # flock() has no timeout, so poll with a non-blocking lock
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    with self._lock:
+                        self.counters['timeouts'] += 1
+                    raise SingleFlightTimeout("Timed out waiting for another worker's call")
+                time.sleep(0.05)
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, in_flight=len(self._calls))
@@ -41,6 +41,8 @@ const ingredientCategories = {
   let conversationContext = '';
   // Combined list of all ingredients: badges + any typed in
   let allIngredients = [];
+  // Dietary preferences sent with the last /get_recipes request
+  let dietaryPreferences = {};
   // Current list of recipe stubs from /get_recipes
   let currentRecipes = [];
   
@@ -48,6 +50,9 @@ const ingredientCategories = {
   let modalOriginalRecipe = null;
   let modalCurrentServings = 2;
   let modalBaseServings = 2;
+
+  // "See more" replies by recipe ID, revalidated with their ETag
+  const seeMoreCache = new Map();
   
   /*****************************************
    * On DOM Loaded
@@ -138,7 +143,7 @@ const ingredientCategories = {
         return;
       }
   
-      const dietaryPreferences = {
+      dietaryPreferences = {
         vegan: document.getElementById('vegan').checked,
         glutenFree: document.getElementById('gluten-free').checked,
         dairyFree: document.getElementById('dairy-free').checked,
@@ -340,12 +345,29 @@ const ingredientCategories = {
    *****************************************/
   function seeMoreRecipe(recipeId) {
     showLoadingBubble();
+    const cached = seeMoreCache.get(recipeId);
+    const headers = { 'Content-Type': 'application/json' };
+    if (cached) {
+      headers['If-None-Match'] = cached.etag;
+    }
     fetch('/see_more', {
       method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
+      headers: headers,
       body: JSON.stringify({ recipe_id: recipeId })
     })
-    .then(res => res.json())
+    .then(res => {
+      // 304: our copy is still current
+      if (res.status === 304 && cached) {
+        return cached.data;
+      }
+      return res.json().then(data => {
+        const etag = res.headers.get('ETag');
+        if (res.ok && etag) {
+          seeMoreCache.set(recipeId, { etag: etag, data: data });
+        }
+        return data;
+      });
+    })
     .then(data => {
       removeLoadingBubble();
       if (data.error) {
@@ -527,7 +549,8 @@ const ingredientCategories = {
         body: JSON.stringify({
           message: 'I want new recipes',
           context: conversationContext,
-          ingredients: allIngredients
+          ingredients: allIngredients,
+          preferences: dietaryPreferences
         })
       })
       .then(res => res.json())
@@ -557,35 +580,105 @@ const ingredientCategories = {
     chatSuggestions.appendChild(btn1);
   }
   
-  /** Normal GPT conversation: user types => /chatbot => GPT reply */
+  /** Normal GPT conversation: user types => /chatbot_stream => GPT reply, token by token */
   function sendMessageToChatbot(message) {
     showLoadingBubble();
-    fetch('/chatbot', {
+    fetch('/chatbot_stream', {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
       body: JSON.stringify({
         message,
         context: conversationContext,
-        ingredients: allIngredients
+        ingredients: allIngredients,
+        preferences: dietaryPreferences
       })
     })
-    .then(res => res.json())
-    .then(data => {
-      removeLoadingBubble();
-      if (data.error) {
-        addAssistantMessage(data.error);
-        return;
-      }
-      if (data.reply) {
-        addAssistantMessage(data.reply);
-      }
-      if (data.context) {
-        conversationContext = data.context;
+    .then(res => {
+      const contentType = res.headers.get('Content-Type') || '';
+      if (!contentType.startsWith('text/event-stream')) {
+        // Special commands come back as regular /chatbot JSON
+        return res.json().then(handleChatbotReply);
       }
+      return readReplyStream(res);
     })
     .catch(err => {
       removeLoadingBubble();
       console.error(err);
     });
   }
-  
\ No newline at end of file
+
+  function handleChatbotReply(data) {
+    removeLoadingBubble();
+    if (data.error) {
+      addAssistantMessage(data.error);
+      return;
+    }
+    if (data.reply) {
+      addAssistantMessage(data.reply);
+    }
+    if (data.recipes) {
+      displayRecipesInChat(data.recipes);
+    }
+    if (data.context) {
+      conversationContext = data.context;
+    }
+  }
+
+  /** Render SSE "token" events into one bubble as they arrive */
+  function readReplyStream(res) {
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let bubble = null;
+    let replyText = '';
+
+    function handleEvent(rawEvent) {
+      let eventName = 'message';
+      let dataLine = '';
+      rawEvent.split('\n').forEach(line => {
+        if (line.startsWith('event: ')) eventName = line.slice(7);
+        if (line.startsWith('data: ')) dataLine += line.slice(6);
+      });
+      if (!dataLine) return;
+      const data = JSON.parse(dataLine);
+
+      if (eventName === 'token') {
+        if (!bubble) {
+          removeLoadingBubble();
+          addAssistantMessage('');
+          bubble = document.getElementById('chat-messages').lastElementChild;
+        }
+        replyText += data.token;
+        bubble.innerHTML = replyText.replace(/\n/g, '<br>');
+        const chatMessagesDiv = document.getElementById('chat-messages');
+        chatMessagesDiv.scrollTop = chatMessagesDiv.scrollHeight;
+      } else if (eventName === 'done' || eventName === 'error') {
+        removeLoadingBubble();
+        if (bubble) {
+          bubble.innerHTML = data.reply.replace(/\n/g, '<br>');
+        } else {
+          addAssistantMessage(data.reply);
+        }
+        if (data.context) {
+          conversationContext = data.context;
+        }
+      }
+    }
+
+    function pump() {
+      return reader.read().then(({ done, value }) => {
+        if (done) {
+          if (buffer.trim()) handleEvent(buffer);
+          removeLoadingBubble();
+          return;
+        }
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        events.forEach(handleEvent);
+        return pump();
+      });
+    }
+
+    return pump();
+  }
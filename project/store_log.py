@@ -0,0 +1,678 @@
+"""
+Append-only persistence for the in-memory stores.
+
+Every set/pop on a PersistentStore is appended to a log segment as a
+length-prefixed record (optionally zlib-compressed); reads that slide an
+entry's TTL are logged as small touch records when the store is flushed,
+so restored entries keep their sliding expiry. A background thread
+fsyncs the log on an interval and, once the log has grown enough, writes
+a compacted snapshot of the live entries and drops the older files.
+
+On startup the latest snapshot is memory-mapped and only its record
+headers are scanned; values stay serialized in the mapping until they are
+first read. The log segments after the snapshot are then replayed, so a
+restarted worker is serving warm without decoding every stored value.
+
+Every worker appends to the current segment, one write at a time under
+a shared append lock. Only the process holding the directory lock (the
+owner) syncs, snapshots and compacts; before writing, it merges the
+records other workers appended into its own store, so its snapshots keep
+them. The others keep retrying the directory lock in the background; the
+one that gets it replays what was written since its load, switches to
+owner and snapshots its own entries.
+
+Files in the directory, per generation N:
+    snapshot-N.dat   the live entries when log-N was started
+    log-N.dat        every change since
+    lock             held by the owner
+    append.lock      held for each append
+"""
+import atexit
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+from stores import Deferred, TOUCH
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+log = logging.getLogger('chefbot.store_log')
+
+LOG_MAGIC = b'CHEFLOG1'
+SNAPSHOT_MAGIC = b'CHEFSNP1'
+
+# stored length, raw length, crc32, flags, ttl, expires_at, key length
+# (a touch record has no payload and holds the time of the read in expires_at)
+HEADER = struct.Struct('<IIIBddH')
+OP_SET = 0x01
+OP_DELETE = 0x02
+OP_TOUCH = 0x04
+FLAG_COMPRESSED = 0x80
+
+_FILE_RE = re.compile(r'^(log|snapshot)-(\d{8})\.dat$')
+
+
+def encode_record(key, payload, ttl, expires_at, compress=False, compress_min=256):
+    """
+    One record: header, key, payload. payload None encodes a delete.
+    """
+    key_bytes = key.encode('utf-8')
+    flags = OP_DELETE if payload is None else OP_SET
+    payload = payload or b''
+    raw_len = len(payload)
+    if compress and raw_len >= compress_min:
+        packed = zlib.compress(payload, 6)
+        if len(packed) < raw_len:
+            payload = packed
+            flags |= FLAG_COMPRESSED
+    return encode_stored(key_bytes, payload, raw_len, flags, ttl, expires_at)
+
+
+def encode_touch(key, touched_at):
+    """
+    A record sliding key's TTL, as of a read at touched_at.
+    """
+    return encode_stored(key.encode('utf-8'), b'', 0, OP_TOUCH, 0.0, touched_at)
+
+
+def encode_stored(key_bytes, stored, raw_len, flags, ttl, expires_at):
+    crc = zlib.crc32(stored, zlib.crc32(key_bytes))
+    return HEADER.pack(len(stored), raw_len, crc, flags, ttl, expires_at, len(key_bytes)) + key_bytes + stored
+
+
+class LogValue(Deferred):
+    """
+    A value still sitting in a log or snapshot buffer.
+    """
+    __slots__ = ('buf', 'offset', 'length', 'raw_len', 'flags')
+
+    def __init__(self, buf, offset, length, raw_len, flags):
+        super().__init__(self._decode)
+        self.buf = buf
+        self.offset = offset
+        self.length = length
+        self.raw_len = raw_len
+        self.flags = flags
+
+    def stored(self):
+        return bytes(self.buf[self.offset:self.offset + self.length])
+
+    def raw(self):
+        data = self.stored()
+        return zlib.decompress(data) if self.flags & FLAG_COMPRESSED else data
+
+    def _decode(self):
+        return json.loads(self.raw())
+
+
+def scan_records(buf, start, verify=True):
+    """
+    Yield (key, value, size, ttl, expires_at, end) for each record in buf
+    from offset start. value is a LogValue, None for a delete or TOUCH for a
+    read (expires_at is then the time of the read). Stops at
+    the first truncated or (with verify) corrupt record, i.e. a torn tail.
+    """
+    offset = start
+    total = len(buf)
+    while offset + HEADER.size <= total:
+        stored_len, raw_len, crc, flags, ttl, expires_at, key_len = HEADER.unpack_from(buf, offset)
+        key_start = offset + HEADER.size
+        payload_start = key_start + key_len
+        end = payload_start + stored_len
+        if end > total or not flags & (OP_SET | OP_DELETE | OP_TOUCH):
+            return
+        if verify and zlib.crc32(buf[payload_start:end], zlib.crc32(buf[key_start:payload_start])) != crc:
+            return
+        key = bytes(buf[key_start:payload_start]).decode('utf-8')
+        if flags & OP_SET:
+            value = LogValue(buf, payload_start, stored_len, raw_len, flags)
+        else:
+            value = TOUCH if flags & OP_TOUCH else None
+        yield key, value, raw_len, ttl, expires_at, end
+        offset = end
+
+
+class StoreLog:
+    """
+    Snapshot + log segments for one store, in `directory`.
+
+    fsync: "always" (after every append), "interval" (every fsync_interval
+    seconds, in the background) or "never" (leave it to the OS).
+    A snapshot is taken when the current segment passes snapshot_bytes, or
+    after snapshot_interval seconds if anything was written.
+
+    Touches are buffered and written at most every touch_interval seconds,
+    one record per key with its latest read.
+
+    Only one process owns a directory. A process that can't take the lock
+    within lock_timeout restores from it "read-only": it still appends to
+    the owner's current segment, but doesn't sync or compact, and it
+    retries the lock every fsync_interval. Once it has it, the records
+    written since its load are passed to replay(records) and it becomes the
+    owner, beginning with a snapshot of source(). The owner passes records
+    appended by other processes to replay() as it finds them.
+    """
+
+    def __init__(self, directory, compress=False, fsync='interval', fsync_interval=1.0,
+                 snapshot_bytes=32 * 1024 * 1024, snapshot_interval=3600.0, lock_timeout=5.0,
+                 touch_interval=30.0):
+        if fsync not in ('always', 'interval', 'never'):
+            raise ValueError(f"Unknown fsync policy: {fsync}")
+        self.directory = directory
+        self.compress = compress
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.snapshot_bytes = snapshot_bytes
+        self.snapshot_interval = snapshot_interval
+        self.lock_timeout = lock_timeout
+        self.touch_interval = touch_interval
+        self.read_only = False
+        self.source = None         # () -> entries to snapshot, see PersistentStore
+        self.replay = None         # records -> None, applies the tail read when taking over the lock
+        self._lock = threading.Lock()
+        self._file = None
+        self._lock_file = None
+        self._append_lock_file = None
+        self._shared_file = None   # (generation, file) of the owner's segment, while read-only
+        self._touches = {}         # key -> latest read not yet logged
+        self._last_touches = time.monotonic()
+        self._last_warning = 0.0
+        self._closed = False
+        self._generation = 0
+        self._segment_bytes = 0
+        self._dirty = False
+        self._tail = (0, {})       # (snapshot generation, {log generation: offset read}) while read-only
+        self._last_snapshot = time.monotonic()
+        self._stop = threading.Event()
+        self._thread = None
+        self.counters = {'appended': 0, 'touches': 0, 'fsyncs': 0, 'snapshots': 0, 'restored': 0,
+                         'replayed': 0, 'torn_bytes': 0, 'dropped': 0, 'promotions': 0, 'merged': 0,
+                         'tmp_removed': 0}
+        self.restore_seconds = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, kind, generation):
+        return os.path.join(self.directory, f"{kind}-{generation:08d}.dat")
+
+    def _generations(self):
+        found = {'log': [], 'snapshot': []}
+        for name in os.listdir(self.directory):
+            match = _FILE_RE.match(name)
+            if match:
+                found[match.group(1)].append(int(match.group(2)))
+        return sorted(found['snapshot']), sorted(found['log'])
+
+    def _acquire_lock(self, timeout):
+        if fcntl is None:
+            return True
+        self._lock_file = open(os.path.join(self.directory, 'lock'), 'a')
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except OSError:
+                if time.monotonic() >= deadline:
+                    self._lock_file.close()
+                    self._lock_file = None
+                    return False
+                time.sleep(0.05)
+
+    @contextmanager
+    def _appending(self):
+        # Serializes appends (and the owner's segment switch) across processes
+        if fcntl is None:
+            yield
+            return
+        if self._append_lock_file is None:
+            self._append_lock_file = open(os.path.join(self.directory, 'append.lock'), 'a')
+        fcntl.flock(self._append_lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._append_lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _remove_tmp_files(self):
+        # Only the owner writes snapshots, so any temp file is left from a crash
+        for name in os.listdir(self.directory):
+            if name.endswith('.tmp'):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    continue
+                self.counters['tmp_removed'] += 1
+
+    # ---- startup ----
+
+    def _map(self, path, magic):
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size < len(magic):
+                return None
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if buf[:len(magic)] != magic:
+            buf.close()
+            return None
+        # Restored values keep the mapping alive until they are decoded or evicted
+        return buf
+
+    def load(self):
+        """
+        Open the directory: return the records to restore, oldest first, and
+        get ready to append (or to keep retrying the lock, if another
+        process holds it). Snapshot values stay in the memory mapping.
+        """
+        started = time.perf_counter()
+        self.read_only = not self._acquire_lock(self.lock_timeout)
+        records, base, offsets = self._read(repair=not self.read_only)
+
+        if self.read_only:
+            self._tail = (base, offsets)
+        else:
+            self._remove_tmp_files()
+            self._generation = max([base] + list(offsets))
+            with self._appending():
+                self._open_segment(self._generation)
+        self._thread = threading.Thread(target=self._run, name='store-log', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+        self.restore_seconds = time.perf_counter() - started
+        return records
+
+    def _read(self, since=None, repair=True):
+        """
+        (records, snapshot generation, {log generation: offset read}) for the
+        latest snapshot and the log segments after it. With `since` (the last
+        two from an earlier call), only records written after that point,
+        unless a newer snapshot has replaced it. repair truncates a torn tail.
+        """
+        snapshots, logs = self._generations()
+        base, offsets = since if since is not None else (0, {})
+        records = []
+
+        for generation in reversed(snapshots):
+            if since is not None and generation <= base:
+                break
+            buf = self._map(self._path('snapshot', generation), SNAPSHOT_MAGIC)
+            if buf is not None:
+                # Snapshots are written to a temp file and renamed, so they are complete
+                records.extend(record[:5] for record in scan_records(buf, len(SNAPSHOT_MAGIC), verify=False))
+                self.counters['restored'] += len(records)
+                base, offsets = generation, {}
+                break
+
+        for generation in logs:
+            if generation < base:
+                continue
+            path = self._path('log', generation)
+            with open(path, 'rb') as f:
+                data = f.read()
+            if data[:len(LOG_MAGIC)] != LOG_MAGIC:
+                continue
+            end = offsets.get(generation, len(LOG_MAGIC))
+            for record in scan_records(data, end):
+                records.append(record[:5])
+                end = record[5]
+                self.counters['replayed'] += 1
+            offsets[generation] = end
+            if end < len(data) and repair:
+                # Drop a torn record left by a crash mid-append
+                self.counters['torn_bytes'] += len(data) - end
+                with open(path, 'r+b') as f:
+                    f.truncate(end)
+        return records, base, offsets
+
+    def _take_over(self):
+        """
+        Called by the background thread of a read-only log: if the lock is
+        free now, replay what was written since load() and start appending.
+        """
+        if self.replay is None or self.source is None or not self._acquire_lock(0):
+            return False
+        self._remove_tmp_files()
+        with self._lock:
+            with self._appending():
+                # Everything written since load(), this worker's appends included
+                records, base, offsets = self._read(self._tail, repair=True)
+                self.replay(records)
+                self._close_shared()
+                self._generation = max([base] + list(offsets))
+                self._open_segment(self._generation)
+                self.read_only = False
+            # Compact right away; _rotate() merges anything appended meanwhile
+            generation, entries = self._rotate()
+            self.counters['promotions'] += 1
+        self._write_snapshot(generation, entries)
+        return True
+
+    def _open_segment(self, generation):
+        # Call under _appending(), so other processes see the magic first
+        path = self._path('log', generation)
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(LOG_MAGIC)
+            self._file.flush()
+        self._segment_bytes = self._file.tell()
+
+    def _merge(self):
+        """
+        Owner, under _appending(): pass records other processes appended to
+        the current segment to replay(), and cut off a torn one.
+        """
+        size = os.fstat(self._file.fileno()).st_size
+        if size <= self._segment_bytes:
+            return
+        with open(self._path('log', self._generation), 'rb') as f:
+            f.seek(self._segment_bytes)
+            data = f.read(size - self._segment_bytes)
+        end = 0
+        records = []
+        for record in scan_records(data, 0):
+            records.append(record[:5])
+            end = record[5]
+        if end < len(data):
+            # A worker died mid-append; later appends must not land behind it
+            self.counters['torn_bytes'] += len(data) - end
+            self._file.truncate(self._segment_bytes + end)
+        self._segment_bytes += end
+        self._dirty = True
+        if records and self.replay is not None:
+            self.replay(records)
+        self.counters['merged'] += len(records)
+
+    def _shared_segment(self):
+        """
+        Read-only, under _appending(): the owner's current segment, opened
+        for appending, or None if there is none.
+        """
+        logs = self._generations()[1]
+        if not logs:
+            return None
+        if self._shared_file is None or self._shared_file[0] != logs[-1]:
+            self._close_shared()
+            self._shared_file = (logs[-1], open(self._path('log', logs[-1]), 'ab'))
+        return self._shared_file[1]
+
+    def _close_shared(self):
+        if self._shared_file is not None:
+            self._shared_file[1].close()
+            self._shared_file = None
+
+    # ---- writes ----
+
+    def append(self, items, ttl):
+        """
+        Log (key, value) pairs; value None logs a delete.
+        """
+        items = list(items)
+        data_count = len(items)
+        expires_at = time.time() + ttl
+        data = b''.join(
+            encode_record(
+                key,
+                None if value is None else json.dumps(value, separators=(',', ':'), ensure_ascii=False).encode('utf-8'),
+                ttl, expires_at, compress=self.compress,
+            )
+            for key, value in items
+        )
+        self._write(data, 'appended', data_count)
+
+    def touch(self, items):
+        """
+        Buffer (key, read time) pairs for reads that slid an entry's TTL;
+        they are logged every touch_interval seconds.
+        """
+        with self._lock:
+            for key, touched_at in items:
+                if touched_at > self._touches.get(key, 0.0):
+                    self._touches[key] = touched_at
+
+    def _write_touches(self):
+        with self._lock:
+            touches, self._touches = self._touches, {}
+            self._last_touches = time.monotonic()
+        if touches:
+            self._write(b''.join(encode_touch(key, touched_at) for key, touched_at in touches.items()),
+                        'touches', len(touches))
+
+    def _write(self, data, counter, count):
+        with self._lock:
+            if self._closed:
+                return
+            try:
+                with self._appending():
+                    if self.read_only:
+                        f = self._shared_segment()
+                        if f is None:
+                            raise FileNotFoundError(f"No log segment in {self.directory}")
+                    else:
+                        f = self._file
+                        self._merge()
+                    f.write(data)
+                    # Unbuffered before the append lock is released
+                    f.flush()
+                    if not self.read_only:
+                        self._segment_bytes += len(data)
+                        self._dirty = True
+                    if self.fsync == 'always':
+                        os.fsync(f.fileno())
+                        self.counters['fsyncs'] += 1
+                        self._dirty = False
+            except OSError as e:
+                self.counters['dropped'] += count
+                self._close_shared()
+                if time.monotonic() - self._last_warning > 60:
+                    self._last_warning = time.monotonic()
+                    log.warning("Could not persist %d %s to %s, they will be lost on restart: %s",
+                                count, counter, self.directory, e)
+                return
+            self.counters[counter] += count
+
+    def _sync(self):
+        # Call with the lock held
+        self._file.flush()
+        if self.fsync != 'never':
+            os.fsync(self._file.fileno())
+            self.counters['fsyncs'] += 1
+        self._dirty = False
+
+    def _run(self):
+        while not self._stop.wait(self.fsync_interval):
+            if time.monotonic() - self._last_touches >= self.touch_interval:
+                self._write_touches()
+            if self.read_only:
+                self._take_over()
+                continue
+            with self._lock:
+                if self._file is None:
+                    continue
+                with self._appending():
+                    self._merge()
+                if self._dirty:
+                    self._sync()
+                due = self._segment_bytes > self.snapshot_bytes or (
+                    self._segment_bytes > len(LOG_MAGIC)
+                    and time.monotonic() - self._last_snapshot > self.snapshot_interval
+                )
+            if due and self.source is not None:
+                self.snapshot()
+
+    # ---- compaction ----
+
+    def snapshot(self):
+        """
+        Start a new log segment and write the live entries to a snapshot for
+        it, then delete the older snapshot and segments.
+        """
+        with self._lock:
+            if self._file is None:
+                return
+            generation, entries = self._rotate()
+        self._write_snapshot(generation, entries)
+
+    def _rotate(self):
+        # Call with the lock held: start the next segment, return (generation, live entries)
+        with self._appending():
+            if self._file is not None:
+                self._merge()
+                self._sync()
+                self._file.close()
+            self._generation += 1
+            self._open_segment(self._generation)
+        self._last_snapshot = time.monotonic()
+        # Changes made after this point go to the new segment
+        return self._generation, self.source()
+
+    def _write_snapshot(self, generation, entries):
+        tmp_path = self._path('snapshot', generation) + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(SNAPSHOT_MAGIC)
+            for key, value, ttl, expires_at in entries:
+                if isinstance(value, LogValue):
+                    # Copy the stored bytes over as they are, without decoding
+                    record = encode_stored(key.encode('utf-8'), value.stored(), value.raw_len, value.flags,
+                                           ttl, expires_at)
+                else:
+                    payload = json.dumps(value, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+                    record = encode_record(key, payload, ttl, expires_at, compress=self.compress)
+                f.write(record)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._path('snapshot', generation))
+        self._sync_directory()
+
+        snapshots, logs = self._generations()
+        for old in snapshots:
+            if old < generation:
+                os.remove(self._path('snapshot', old))
+        for old in logs:
+            if old < generation:
+                os.remove(self._path('log', old))
+        with self._lock:
+            self.counters['snapshots'] += 1
+
+    def _sync_directory(self):
+        if not hasattr(os, 'O_DIRECTORY'):
+            return
+        fd = os.open(self.directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            # Let a snapshot in progress finish
+            self._thread.join()
+        self._write_touches()
+        with self._lock:
+            self._closed = True
+            if self._file is not None:
+                self._sync()
+                self._file.close()
+                self._file = None
+            self._close_shared()
+            if self._append_lock_file is not None:
+                self._append_lock_file.close()
+                self._append_lock_file = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                self.counters,
+                generation=self._generation,
+                segment_bytes=self._segment_bytes,
+                read_only=self.read_only,
+                restore_seconds=round(self.restore_seconds, 4),
+            )
+
+
+class PersistentStore:
+    """
+    An in-memory store (RecipeStore or ConversationStore) whose changes are
+    written to a StoreLog, and which is restored from it when created.
+    Reads go straight to the in-memory store; the keys they touch are
+    logged on flush() so sliding TTLs survive a restart.
+    """
+
+    def __init__(self, store, log):
+        self.store = store
+        self.log = log
+        self._touch_lock = threading.Lock()
+        self._touches = {}   # key -> time of the last read since flush()
+        log.source = store.export
+        store.restore(log.load())
+        log.replay = store.restore
+
+    def get(self, key, default=None):
+        missing = object()
+        value = self.store.get(key, missing)
+        if value is missing:
+            return default
+        with self._touch_lock:
+            self._touches[key] = time.time()
+        return value
+
+    def flush(self):
+        with self._touch_lock:
+            touches, self._touches = self._touches, {}
+        self.log.touch(touches.items())
+        self.store.flush()
+
+    def set(self, key, value, ttl=None):
+        self.store.set(key, value, ttl)
+        self.log.append([(key, value)], self.store.ttl if ttl is None else ttl)
+
+    def set_many(self, items, ttl=None):
+        items = list(items)
+        self.store.set_many(items, ttl)
+        self.log.append(items, self.store.ttl if ttl is None else ttl)
+
+    def pop(self, key, default=None):
+        missing = object()
+        value = self.store.pop(key, missing)
+        if value is missing:
+            return default
+        self.log.append([(key, None)], 0)
+        return value
+
+    def clear(self):
+        keys = [key for key, _, _, _ in self.store.export()]
+        self.store.clear()
+        self.log.append([(key, None) for key in keys], 0)
+
+    def __getattr__(self, name):
+        # get_scaled, ...
+        return getattr(self.store, name)
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __getitem__(self, key):
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return key in self.store
+
+    def __len__(self):
+        return len(self.store)
+
+    def stats(self):
+        return dict(self.store.stats(), log=self.log.stats())
@@ -0,0 +1,662 @@
+"""
+Bounded in-memory stores for recipes and conversation contexts.
+
+Both stores behave like the plain dicts they replace (get, [], in, pop)
+but evict entries by TTL, entry count and byte budget, least recently
+used first, so a long-running worker keeps a flat memory profile.
+SQLiteStore offers the same interface on a database shared by workers;
+store_log.PersistentStore keeps an in-memory store durable on disk.
+"""
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from quantities import RecipeScaler
+
+# ----------------------------------------------------------------
+# RECORDS
+# ----------------------------------------------------------------
+
+
+class RecipeRecord:
+    """
+    Compact, slotted representation of one stored recipe.
+    """
+    __slots__ = ('id', 'title', 'ingredients', 'macros', 'instructions', 'servings')
+
+    def __init__(self, id, title, ingredients, macros, instructions, servings):
+        self.id = id
+        self.title = title
+        self.ingredients = ingredients
+        self.macros = macros
+        self.instructions = instructions
+        self.servings = servings
+
+    @classmethod
+    def from_dict(cls, recipe):
+        return cls(
+            id=recipe.get('id'),
+            title=recipe.get('title', 'Untitled Recipe'),
+            ingredients=tuple(recipe.get('ingredients', [])),
+            macros=recipe.get('macros', 'No macros data'),
+            instructions=recipe.get('instructions', 'No instructions'),
+            servings=recipe.get('servings', 2),
+        )
+
+    def to_dict(self):
+        """
+        Return a fresh dict, so callers can't mutate the stored record.
+        """
+        return {
+            'id': self.id,
+            'title': self.title,
+            'ingredients': list(self.ingredients),
+            'macros': self.macros,
+            'instructions': self.instructions,
+            'servings': self.servings,
+        }
+
+
+class _Entry:
+    __slots__ = ('value', 'size', 'ttl', 'expires_at')
+
+    def __init__(self, value, size, ttl, expires_at):
+        self.value = value
+        self.size = size
+        self.ttl = ttl
+        self.expires_at = expires_at
+
+
+class Deferred:
+    """
+    A restored value that is still serialized (e.g. in a memory-mapped
+    snapshot). load() decodes it; stores do so the first time it is read.
+    """
+    __slots__ = ('load',)
+
+    def __init__(self, load):
+        self.load = load
+
+
+# Restore record value meaning "this key was read at expires_at": slides its TTL
+TOUCH = object()
+
+
+def estimate_size(value):
+    """
+    Rough byte size of a JSON-compatible value.
+    """
+    if isinstance(value, str):
+        return len(value.encode('utf-8'))
+    return len(json.dumps(value, separators=(',', ':'), ensure_ascii=False).encode('utf-8'))
+
+# ----------------------------------------------------------------
+# BOUNDED STORE
+# ----------------------------------------------------------------
+
+
+class BoundedStore:
+    """
+    Thread-safe LRU mapping with per-entry (sliding) TTL, a max entry count
+    and a max byte budget.
+    """
+
+    def __init__(self, max_entries=10000, max_bytes=64 * 1024 * 1024, ttl=24 * 3600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = {'ttl': 0, 'entries': 0, 'bytes': 0}
+
+    # Subclasses override these to change how values are kept in memory
+    def _pack(self, value):
+        return value
+
+    def _unpack(self, packed):
+        return packed
+
+    def _size_of(self, value):
+        return estimate_size(value)
+
+    def _value(self, entry):
+        # Restored entries are decoded on first use (call with the lock held)
+        if isinstance(entry.value, Deferred):
+            entry.value = self._pack(entry.value.load())
+        return entry.value
+
+    def _remove(self, key, reason=None):
+        entry = self._data.pop(key)
+        self._bytes -= entry.size
+        if reason:
+            self.evictions[reason] += 1
+
+    def _evict(self, now):
+        # Expired entries sit at the LRU end when TTLs are uniform
+        while self._data:
+            key, entry = next(iter(self._data.items()))
+            if entry.expires_at > now:
+                break
+            self._remove(key, 'ttl')
+        while len(self._data) > self.max_entries:
+            self._remove(next(iter(self._data)), 'entries')
+        while self._bytes > self.max_bytes and len(self._data) > 1:
+            self._remove(next(iter(self._data)), 'bytes')
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        size = self._size_of(value)
+        now = time.time()
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = _Entry(self._pack(value), size, ttl, now + ttl)
+            self._bytes += size
+            self._evict(now)
+
+    def set_many(self, items, ttl=None):
+        """
+        Insert several (key, value) pairs under one lock, evicting once.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        packed = [(key, self._pack(value), self._size_of(value)) for key, value in items]
+        now = time.time()
+        with self._lock:
+            for key, value, size in packed:
+                if key in self._data:
+                    self._remove(key)
+                self._data[key] = _Entry(value, size, ttl, now + ttl)
+                self._bytes += size
+            self._evict(now)
+
+    def get(self, key, default=None):
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            if entry.expires_at <= now:
+                self._remove(key, 'ttl')
+                self.misses += 1
+                return default
+            entry.expires_at = now + entry.ttl
+            self._data.move_to_end(key)
+            self.hits += 1
+            return self._unpack(self._value(entry))
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            value = self._unpack(self._value(self._data[key]))
+            self._remove(key)
+            return value
+
+    def restore(self, records):
+        """
+        Bulk-load (key, value, size, ttl, expires_at) records, oldest first.
+        value may be a Deferred; None deletes the key; TOUCH replays a read
+        at time expires_at, sliding the entry's TTL. Expired records are skipped.
+        """
+        now = time.time()
+        touched = {}
+        for key, value, _, _, read_at in records:
+            if value is TOUCH:
+                touched[key] = max(read_at, touched.get(key, 0.0))
+        with self._lock:
+            for key, value, size, ttl, expires_at in records:
+                if value is TOUCH:
+                    continue
+                if key in touched:
+                    expires_at = max(expires_at, touched[key] + ttl)
+                if key in self._data:
+                    self._remove(key)
+                if value is None or expires_at <= now:
+                    continue
+                if not isinstance(value, Deferred):
+                    value = self._pack(value)
+                self._data[key] = _Entry(value, size, ttl, expires_at)
+                self._bytes += size
+            self._evict(now)
+
+    def export(self):
+        """
+        (key, value, ttl, expires_at) for every entry, least recently used
+        first. Values not yet decoded are returned as their Deferred.
+        """
+        with self._lock:
+            entries = [(key, entry.value, entry.ttl, entry.expires_at) for key, entry in self._data.items()]
+        return [
+            (key, value if isinstance(value, Deferred) else self._unpack(value), ttl, expires_at)
+            for key, value, ttl, expires_at in entries
+        ]
+
+    def flush(self):
+        """
+        Nothing to commit for an in-process store.
+        """
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __getitem__(self, key):
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        entry = self._data.get(key)
+        return entry is not None and entry.expires_at > time.time()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """
+        Size and eviction metrics for this store.
+        """
+        with self._lock:
+            return {
+                'entries': len(self._data),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': dict(self.evictions),
+            }
+
+
+class RecipeStore(BoundedStore):
+    """
+    Maps recipe_id -> recipe. Recipes go in and come out as dicts,
+    but are kept as slotted RecipeRecords.
+
+    Parsed scalers are built on the first get_scaled() and kept in a small
+    LRU of their own, so only recipes that are actually scaled pay for them.
+    """
+
+    def __init__(self, *args, scaler_cache_size=2048, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._scalers = OrderedDict()   # key -> (record, RecipeScaler)
+        self._scaler_cache_size = scaler_cache_size
+
+    def _pack(self, value):
+        return RecipeRecord.from_dict(value)
+
+    def _unpack(self, packed):
+        return packed.to_dict()
+
+    def _remove(self, key, reason=None):
+        super()._remove(key, reason)
+        self._scalers.pop(key, None)
+
+    def clear(self):
+        super().clear()
+        with self._lock:
+            self._scalers.clear()
+
+    def get_scaled(self, key, servings, default=None):
+        """
+        Return the recipe scaled to `servings`, always from the stored
+        original, so repeated scaling never compounds.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry.expires_at <= time.time():
+                return default
+            record = self._value(entry)
+            cached = self._scalers.get(key)
+            if cached is not None and cached[0] is record:
+                self._scalers.move_to_end(key)
+                scaler = cached[1]
+            else:
+                scaler = None
+        if scaler is None:
+            scaler = RecipeScaler(record.to_dict())
+            with self._lock:
+                entry = self._data.get(key)
+                # Skip caching if the recipe was replaced or removed meanwhile
+                if entry is not None and entry.value is record:
+                    self._scalers[key] = (record, scaler)
+                    while len(self._scalers) > self._scaler_cache_size:
+                        self._scalers.popitem(last=False)
+        return scaler.scale_to(servings)
+
+
+class ConversationStore(BoundedStore):
+    """
+    Maps session_id -> conversation context string.
+    """
+
+# ----------------------------------------------------------------
+# SHARED (CROSS-WORKER) STORE
+# ----------------------------------------------------------------
+
+
+class SQLiteStore:
+    """
+    Store with the same interface as BoundedStore, kept in a local SQLite
+    database (WAL mode) so every gunicorn worker on the box sees the same
+    recipes and conversations.
+
+    Writes and LRU touches are buffered and committed in one transaction
+    per batch (flush() is called at the end of each request), and recent
+    reads are served from a short-lived local cache.
+    """
+
+    def __init__(self, path, namespace, max_entries=10000, max_bytes=64 * 1024 * 1024,
+                 ttl=24 * 3600, batch_size=32, read_cache_ttl=1.0):
+        self.path = path
+        self.table = f"store_{namespace}"
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.batch_size = batch_size
+        self.read_cache_ttl = read_cache_ttl
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pending = {}       # key -> (payload, size, ttl) not yet committed
+        self._touches = {}       # key -> ttl for entries read since last flush
+        self._read_cache = OrderedDict()  # key -> (cached_at, payload)
+        self._read_cache_max = 1024
+        self.hits = 0
+        self.misses = 0
+        self.evictions = {'ttl': 0, 'entries': 0, 'bytes': 0}
+
+        conn = self._conn()
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            " key TEXT PRIMARY KEY,"
+            " payload TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " ttl REAL NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {self.table}_lru ON {self.table} (last_access)"
+        )
+        conn.commit()
+
+    def _conn(self):
+        # One connection per thread, and never reuse one inherited across fork()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _cache_put(self, key, payload):
+        if self.read_cache_ttl <= 0:
+            return
+        self._read_cache[key] = (time.time(), payload)
+        self._read_cache.move_to_end(key)
+        while len(self._read_cache) > self._read_cache_max:
+            self._read_cache.popitem(last=False)
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        payload = json.dumps(value, separators=(',', ':'), ensure_ascii=False)
+        with self._lock:
+            self._pending[key] = (payload, len(payload.encode('utf-8')), ttl)
+            self._touches.pop(key, None)
+            self._cache_put(key, payload)
+            should_flush = len(self._pending) >= self.batch_size
+        if should_flush:
+            self.flush()
+
+    def set_many(self, items, ttl=None):
+        """
+        Buffer several (key, value) pairs; they are committed together by
+        the next flush().
+        """
+        ttl = self.ttl if ttl is None else ttl
+        payloads = [
+            (key, json.dumps(value, separators=(',', ':'), ensure_ascii=False))
+            for key, value in items
+        ]
+        with self._lock:
+            for key, payload in payloads:
+                self._pending[key] = (payload, len(payload.encode('utf-8')), ttl)
+                self._touches.pop(key, None)
+                self._cache_put(key, payload)
+            should_flush = len(self._pending) >= self.batch_size
+        if should_flush:
+            self.flush()
+
+    def get(self, key, default=None):
+        payload = self._payload(key)
+        return default if payload is None else json.loads(payload)
+
+    def _payload(self, key):
+        # The live entry's JSON payload, or None if it is missing or expired
+        with self._lock:
+            if key in self._pending:
+                self.hits += 1
+                return self._pending[key][0]
+            cached = self._read_cache.get(key)
+            if cached is not None and time.time() - cached[0] < self.read_cache_ttl:
+                self.hits += 1
+                return cached[1]
+
+        row = self._conn().execute(
+            f"SELECT payload, ttl, expires_at FROM {self.table} WHERE key = ?", (key,)
+        ).fetchone()
+        with self._lock:
+            if row is None or row[2] <= time.time():
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._touches[key] = row[1]
+            self._cache_put(key, row[0])
+        return row[0]
+
+    def pop(self, key, default=None):
+        value = self.get(key, default)
+        with self._lock:
+            self._pending.pop(key, None)
+            self._touches.pop(key, None)
+            self._read_cache.pop(key, None)
+        conn = self._conn()
+        conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+        conn.commit()
+        return value
+
+    def flush(self):
+        """
+        Commit buffered writes and LRU touches in one transaction,
+        then enforce the TTL, entry and byte limits.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            touches, self._touches = self._touches, {}
+        if not pending and not touches:
+            return
+
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table}"
+                " (key, payload, size, ttl, expires_at, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                [(k, p, s, t, now + t, now) for k, (p, s, t) in pending.items()],
+            )
+            conn.executemany(
+                f"UPDATE {self.table} SET expires_at = ? + ttl, last_access = ? WHERE key = ?",
+                [(now, now, k) for k in touches],
+            )
+            if pending:
+                self._enforce_limits(conn, now)
+
+    def _enforce_limits(self, conn, now):
+        expired = conn.execute(
+            f"DELETE FROM {self.table} WHERE expires_at <= ?", (now,)
+        ).rowcount
+        self.evictions['ttl'] += expired
+
+        count, total = conn.execute(
+            f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table}"
+        ).fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN ("
+                f" SELECT key FROM {self.table} ORDER BY last_access LIMIT ?)",
+                (overflow,),
+            )
+            self.evictions['entries'] += overflow
+            total = conn.execute(
+                f"SELECT COALESCE(SUM(size), 0) FROM {self.table}"
+            ).fetchone()[0]
+
+        if total > self.max_bytes:
+            victims = []
+            for key, size in conn.execute(
+                f"SELECT key, size FROM {self.table} ORDER BY last_access"
+            ):
+                if total <= self.max_bytes:
+                    break
+                victims.append((key,))
+                total -= size
+            conn.executemany(f"DELETE FROM {self.table} WHERE key = ?", victims)
+            self.evictions['bytes'] += len(victims)
+
+    def clear(self):
+        with self._lock:
+            self._pending.clear()
+            self._touches.clear()
+            self._read_cache.clear()
+        conn = self._conn()
+        conn.execute(f"DELETE FROM {self.table}")
+        conn.commit()
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __getitem__(self, key):
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        missing = object()
+        return self.get(key, missing) is not missing
+
+    def __len__(self):
+        self.flush()
+        return self._conn().execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def stats(self):
+        self.flush()
+        count, total = self._conn().execute(
+            f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table}"
+        ).fetchone()
+        return {
+            'entries': count,
+            'bytes': total,
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': dict(self.evictions),
+        }
+
+
+class SQLiteRecipeStore(SQLiteStore):
+    """
+    Shared recipe store. Parsed scalers are kept in a small per-worker LRU,
+    so each worker parses a recipe at most once while it stays hot. Each
+    scaler remembers the payload it was built from and is only reused while
+    the stored row is still live and unchanged.
+    """
+
+    def __init__(self, *args, scaler_cache_size=2048, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._scalers = OrderedDict()   # key -> (payload, RecipeScaler)
+        self._scaler_cache_size = scaler_cache_size
+
+    def get_scaled(self, key, servings, default=None):
+        # Served from the read cache while hot, so this is usually no query
+        payload = self._payload(key)
+        with self._lock:
+            if payload is None:
+                self._scalers.pop(key, None)
+                return default
+            cached = self._scalers.get(key)
+            if cached is not None and cached[0] == payload:
+                self._scalers.move_to_end(key)
+                return cached[1].scale_to(servings)
+        scaler = RecipeScaler(json.loads(payload))
+        with self._lock:
+            self._scalers[key] = (payload, scaler)
+            while len(self._scalers) > self._scaler_cache_size:
+                self._scalers.popitem(last=False)
+        return scaler.scale_to(servings)
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._scalers.pop(key, None)
+        super().set(key, value, ttl)
+
+    def set_many(self, items, ttl=None):
+        items = list(items)
+        with self._lock:
+            for key, _ in items:
+                self._scalers.pop(key, None)
+        super().set_many(items, ttl)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            self._scalers.pop(key, None)
+        return super().pop(key, default)
+
+
+_MEMORY_STORES = {
+    'recipes': RecipeStore,
+    'conversations': ConversationStore,
+}
+
+
+def create_store(namespace, backend='memory', path=None, log_options=None, **limits):
+    """
+    Build the store for a namespace ("recipes" or "conversations").
+    backend: "memory" (per worker), "sqlite" (shared by all workers on the box)
+    or "log" (in memory, persisted to an append-only log under path so it
+    survives restarts; log_options are passed to StoreLog).
+    """
+    if backend == 'sqlite':
+        path = path or os.path.join(tempfile.gettempdir(), 'chefbot_state.sqlite3')
+        if namespace == 'recipes':
+            return SQLiteRecipeStore(path, namespace, **limits)
+        return SQLiteStore(path, namespace, **limits)
+    if backend in ('memory', 'log'):
+        limits.pop('batch_size', None)
+        limits.pop('read_cache_ttl', None)
+        store = _MEMORY_STORES[namespace](**limits)
+        if backend == 'memory':
+            return store
+        from store_log import StoreLog, PersistentStore
+        path = path or os.path.join(tempfile.gettempdir(), 'chefbot_state')
+        return PersistentStore(store, StoreLog(os.path.join(path, namespace), **(log_options or {})))
+    raise ValueError(f"Unknown state backend: {backend}")
@@ -0,0 +1,69 @@
+import threading
+import time
+
+import pytest
+
+from admission import AdmissionController, Overloaded, TokenBucketLimiter
+
+
+def test_token_bucket_allows_burst_then_reports_wait():
+    limiter = TokenBucketLimiter(rate=2.0, burst=2)
+    assert limiter.take('a') == 0.0
+    assert limiter.take('a') == 0.0
+    assert limiter.take('a') == pytest.approx(0.5, abs=0.05)
+    # Keys have their own buckets
+    assert limiter.take('b') == 0.0
+
+
+def test_token_bucket_drops_least_recently_used_keys():
+    limiter = TokenBucketLimiter(rate=1.0, burst=1, max_keys=2)
+    for key in ('a', 'b', 'c'):
+        limiter.take(key)
+    assert len(limiter) == 2
+    assert limiter.take('a') == 0.0  # forgotten, so it starts full again
+
+
+def test_controller_admits_up_to_capacity_and_sheds_on_timeout():
+    controller = AdmissionController(max_active=1, max_llm=1, max_queue=4, queue_timeout=0.05)
+    assert controller.acquire() == 0.0
+    with pytest.raises(Overloaded) as e:
+        controller.acquire()
+    assert e.value.reason == 'queue_timeout' and e.value.retry_after >= 1
+    controller.release()
+    assert controller.acquire() == 0.0
+    controller.release()
+    assert controller.active == 0
+
+
+def test_llm_slots_do_not_block_cheap_requests():
+    controller = AdmissionController(max_active=3, max_llm=1, queue_timeout=0.05)
+    controller.acquire(llm=True)
+    with pytest.raises(Overloaded):
+        controller.acquire(llm=True)
+    assert controller.acquire(llm=False) == 0.0
+
+
+def test_full_queue_evicts_a_less_important_waiter():
+    controller = AdmissionController(max_active=1, max_queue=1, queue_timeout=2)
+    controller.acquire()
+    errors = []
+
+    def low_priority():
+        try:
+            controller.acquire(priority=5)
+        except Overloaded as e:
+            errors.append(e.reason)
+
+    waiter = threading.Thread(target=low_priority)
+    waiter.start()
+    while not controller._queue:
+        time.sleep(0.001)
+
+    granted = []
+    urgent = threading.Thread(target=lambda: granted.append(controller.acquire(priority=0)))
+    urgent.start()
+    waiter.join(1)
+    assert errors == ['evicted']
+    controller.release()
+    urgent.join(1)
+    assert granted and controller.counters['evicted'] == 1
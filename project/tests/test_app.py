@@ -0,0 +1,257 @@
+"""
+End-to-end route tests through Flask's test client, against the offline
+fake LLM backend. Skipped when the web dependencies are not installed.
+"""
+import json
+import os
+
+import pytest
+
+pytest.importorskip('flask')
+pytest.importorskip('dotenv')
+pytest.importorskip('requests')
+
+os.environ.setdefault('CHEFBOT_LLM_BACKEND', 'fake')
+os.environ.setdefault('CHEFBOT_FAKE_LATENCY', '0')
+os.environ.setdefault('CHEFBOT_ADMISSION', '0')
+
+import app as chefbot  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    chefbot.app.config['TESTING'] = True
+    with chefbot.app.test_client() as client:
+        yield client
+
+
+def parse_sse(body):
+    events = []
+    for block in body.strip().split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in block.splitlines())
+        events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+
+def test_chatbot_stream_sends_tokens_then_done(client):
+    response = client.post('/chatbot_stream', json={'message': 'How do I keep rice from sticking?'})
+    assert response.mimetype == 'text/event-stream'
+    events = parse_sse(response.get_data(as_text=True))
+    assert events[-1][0] == 'done'
+    tokens = [data['token'] for event, data in events if event == 'token']
+    assert tokens
+    assert ''.join(tokens).strip() == events[-1][1]['reply']
+
+
+def test_chatbot_stream_falls_back_to_json_for_commands(client):
+    response = client.post('/chatbot_stream', json={'message': ''})
+    assert response.mimetype == 'application/json'
+
+
+def test_fanout_merges_batches_and_drops_duplicate_titles(monkeypatch):
+    def fake_generate(ingredients, preferences, fresh_call=False, count=5, **kwargs):
+        return [{'title': 'Same Dish'}] + [{'title': f'Dish {count}-{i}'} for i in range(count - 1)]
+
+    monkeypatch.setattr(chefbot, 'generate_recipes_with_gpt', fake_generate)
+    recipes = chefbot.generate_recipes_fanout(['rice'], {}, count=4, per_call=2, deadline=5)
+    titles = [r['title'] for r in recipes]
+    assert titles.count('Same Dish') == 1
+    assert len(titles) == len(set(titles)) == 2
+
+
+def test_fanout_returns_what_is_ready_at_the_deadline(monkeypatch):
+    import time
+
+    def fake_generate(ingredients, preferences, fresh_call=False, count=5, **kwargs):
+        if count == 1:
+            time.sleep(1)
+        return [{'title': f'Dish {count}-{i}-{time.monotonic()}'} for i in range(count)]
+
+    monkeypatch.setattr(chefbot, 'generate_recipes_with_gpt', fake_generate)
+    started = time.monotonic()
+    recipes = chefbot.generate_recipes_fanout(['rice'], {}, count=3, per_call=2, deadline=0.3)
+    assert time.monotonic() - started < 0.9
+    assert len(recipes) == 2
+
+
+def test_scale_helpers():
+    assert chefbot.scale_ingredient('1/2 cup cream', 2) == '1 cup cream'
+    assert chefbot.scale_macros('Calories: 467, Fat: 12g, Protein: 35g', 0.5) == \
+        'Calories: 233.5, Fat: 6g, Protein: 17.5g'
+    assert chefbot.scale_macros('Calories: 300, Fat: 15g', 1.5) == 'Calories: 450, Fat: 22.5g'
+
+
+def test_singleflight_timeout_waiters_do_not_generate(client, monkeypatch):
+    cached = {}
+
+    def timed_out(key, fn, **kwargs):
+        if key in cached:
+            # The leader finished just after the waiter gave up
+            chefbot.RECIPE_CACHE.set(key, cached[key])
+        raise chefbot.SingleFlightTimeout(key)
+
+    def generate(*args, **kwargs):
+        raise AssertionError("a waiter must not call the generator")
+
+    monkeypatch.setattr(chefbot.GENERATION_FLIGHTS, 'do', timed_out)
+    monkeypatch.setattr(chefbot, 'generate_recipes', generate)
+    pantry = {'ingredients': ['zucchini', 'feta', 'mint'], 'preferences': {}}
+    response = client.post('/get_recipes', json=pantry)
+    assert response.status_code == 429 and int(response.headers['Retry-After']) >= 1
+
+    key = chefbot.make_cache_key(pantry['ingredients'], {}, False)
+    cached[key] = [{'title': 'Zucchini Fritters', 'ingredients': ['zucchini', 'feta', 'mint']}]
+    response = client.post('/get_recipes', json=pantry)
+    assert response.status_code == 200
+    assert response.get_json()['match']['source'] == 'exact'
+
+
+def test_metrics_export_prompt_stats(client):
+    body = client.get('/metrics').get_data(as_text=True)
+    assert f'chefbot_prompt_variant{{variant="{chefbot.PROMPT_VARIANT}"}} 1' in body
+    assert 'chefbot_prompt_calls_total{variant="compact",prompt="recipes"}' in body
+    assert '# TYPE chefbot_prompt_tokens_total counter' in body
+
+
+def test_new_recipes_uses_the_prefetched_batch(client, monkeypatch):
+    from prefetch import RecipePrefetcher
+
+    prefetcher = RecipePrefetcher(lambda ingredients, preferences: [{
+        'title': 'Prefetched Bowl', 'ingredients': ['rice'], 'macros': '', 'instructions': 'Cook.'}])
+    monkeypatch.setattr(chefbot, 'PREFETCHER', prefetcher)
+    payload = {'ingredients': ['rice', 'tofu'], 'preferences': {'vegan': True}}
+    assert client.post('/get_recipes', json=payload).status_code == 200
+
+    response = client.post('/chatbot', json=dict(payload, message='I want new recipes'))
+    assert [r['title'] for r in response.get_json()['recipes']] == ['Prefetched Bowl']
+
+    # A page that doesn't resend preferences still matches the scheduled batch
+    response = client.post('/chatbot', json={'message': 'I want new recipes', 'ingredients': ['rice', 'tofu']})
+    assert [r['title'] for r in response.get_json()['recipes']] == ['Prefetched Bowl']
+    assert prefetcher.stats()['misses'] == 0
+
+
+def test_meal_plan_streams_ndjson_and_can_be_polled(client):
+    response = client.post('/meal_plan', json={'jobs': [
+        {'ingredients': ['rice', 'beans'], 'count': 2},
+        {'ingredients': ['pasta', 'tomato'], 'count': 1},
+    ]})
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    header, results, summary = lines[0], lines[1:-1], lines[-1]
+    assert header['total'] == 2 and header['status_url'].endswith(header['batch_id'])
+    assert sorted(r['job'] for r in results) == [0, 1]
+    assert all(r['status'] == 'ok' for r in results)
+    assert summary['done'] and summary['completed'] == 2
+
+    polled = client.get(header['status_url']).get_json()
+    assert polled['done'] and len(polled['results']) == 2
+    missing = client.get('/meal_plan/unknown')
+    assert missing.status_code == 404
+    if chefbot.MEAL_PLAN_STATUS_STORE is None:
+        assert 'routed' in missing.get_json()['error']
+
+
+def test_meal_plan_rejects_bad_jobs(client):
+    response = client.post('/meal_plan', json={'jobs': [{'ingredients': []}], 'stream': False})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('trust_proxy, expected', [(False, [404, 404]), (True, [404, 429])])
+def test_ip_bucket_only_applies_behind_a_trusted_proxy(monkeypatch, trust_proxy, expected):
+    from admission import TokenBucketLimiter
+
+    monkeypatch.setattr(chefbot, 'ADMISSION_ENABLED', True)
+    monkeypatch.setattr(chefbot, 'TRUST_PROXY', trust_proxy)
+    monkeypatch.setitem(chefbot.IP_LIMITERS, '/see_more', TokenBucketLimiter(rate=0.001, burst=1))
+    statuses = []
+    for _ in range(2):
+        # A new client per request: a new session from the same address
+        with chefbot.app.test_client() as client:
+            statuses.append(client.post('/see_more', json={'recipe_id': 'missing'}).status_code)
+    assert statuses == expected
+
+
+def test_chat_cache_only_shares_replies_built_from_the_pinned_recipe():
+    chefbot.CHAT_CACHE.clear()
+    with chefbot.app.test_client() as owner:
+        recipe_id = owner.post('/get_recipes', json={'ingredients': ['chicken', 'garlic']}).get_json()['recipes'][0]['id']
+        choose = {'message': f'CHOOSE_RECIPE_{recipe_id}__SERVINGS_2'}
+
+        owner.post('/chatbot', json=choose)
+        first = owner.post('/chatbot', json={'message': 'How long should I rest the meat?'}).get_json()
+        assert not first['cached']
+        # This prompt includes the previous turns, so its reply is not shared
+        later = owner.post('/chatbot', json={'message': 'Can I freeze the leftovers safely?'}).get_json()
+        assert not later['cached']
+
+    with chefbot.app.test_client() as other:
+        other.post('/chatbot', json=choose)
+        reply = other.post('/chatbot', json={'message': 'How long should I rest the meat?'}).get_json()
+        assert reply['cached'] and reply['reply'] == first['reply']
+        reply = other.post('/chatbot', json={'message': 'Can I freeze the leftovers safely?'}).get_json()
+        assert not reply['cached']
+
+    # Without a pinned recipe nothing is cached across sessions
+    for _ in range(2):
+        with chefbot.app.test_client() as client:
+            reply = client.post('/chatbot', json={'message': 'How do I keep rice from sticking?'}).get_json()
+            assert not reply['cached']
+
+
+def test_hashed_assets_are_immutable_and_revalidate(client):
+    url = chefbot.ASSETS.url('js/scripts.js')
+    response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'immutable' in response.headers['Cache-Control']
+    assert response.headers['Vary'] == 'Accept-Encoding'
+
+    etag = response.headers['ETag']
+    response = client.get(url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert response.status_code == 304 and response.data == b''
+    assert client.get('/assets/js/scripts.0000000000.js').status_code == 404
+
+
+def test_index_page_links_hashed_assets_and_revalidates(client):
+    response = client.get('/')
+    assert chefbot.ASSETS.url('js/scripts.js') in response.get_data(as_text=True)
+    assert response.headers['Cache-Control'] == 'no-cache'
+    response = client.get('/', headers={'If-None-Match': response.headers['ETag']})
+    assert response.status_code == 304
+
+
+def test_see_more_etag_revalidation(client):
+    recipe_id = client.post('/get_recipes', json={'ingredients': ['lentils', 'carrot']}).get_json()['recipes'][0]['id']
+    response = client.post('/see_more', json={'recipe_id': recipe_id})
+    assert response.status_code == 200 and response.get_json()['info']['title']
+    response = client.post('/see_more', json={'recipe_id': recipe_id},
+                           headers={'If-None-Match': response.headers['ETag']})
+    assert response.status_code == 304
+
+
+def test_metrics_export_store_evictions(client):
+    body = client.get('/metrics').get_data(as_text=True)
+    assert '# TYPE chefbot_store_evictions_total counter' in body
+    for reason in ('ttl', 'entries', 'bytes'):
+        assert f'chefbot_store_evictions_total{{store="recipes",reason="{reason}"}}' in body
+    assert 'chefbot_store_evictions_total{store="pantry_index",reason="entries"}' in body
+
+
+def test_vegan_pantry_with_meat_still_gets_recipes(client):
+    response = client.post('/get_recipes', json={'ingredients': ['chicken', 'rice'],
+                                                 'preferences': {'vegan': True}})
+    assert response.status_code == 200
+    assert all('Chicken' not in recipe['title'] for recipe in response.get_json()['recipes'])
+
+
+def test_metrics_export_validation_stages(client):
+    client.post('/get_recipes', json={'ingredients': ['tofu', 'rice'], 'preferences': {'vegan': True}})
+    body = client.get('/metrics').get_data(as_text=True)
+    assert '# TYPE chefbot_validation_stage_seconds summary' in body
+    for stage in ('local', 'model', 'regenerate'):
+        assert f'chefbot_validation_stage_seconds_sum{{stage="{stage}"}}' in body
+        assert f'chefbot_validation_stage_seconds_count{{stage="{stage}"}}' in body
+    assert 'chefbot_validation_recipes_total{verdict="passed"}' in body
+    runs = [l for l in body.splitlines() if l.startswith('chefbot_validation_runs_total ')]
+    assert runs and float(runs[0].split()[1]) >= 1
@@ -0,0 +1,52 @@
+import gzip
+import os
+
+from assets import Asset, AssetPipeline, choose_encoding, compress, parse_accept_encoding
+
+
+def test_parse_accept_encoding():
+    assert parse_accept_encoding("gzip, br;q=0.8, *;q=0") == {"gzip": 1.0, "br": 0.8, "*": 0.0}
+    assert parse_accept_encoding("gzip;q=bad") == {"gzip": 0.0}
+    assert parse_accept_encoding(None) == {}
+
+
+def test_choose_encoding_follows_server_preference():
+    assert choose_encoding("gzip, br", ["br", "gzip"]) == "br"
+    assert choose_encoding("gzip, br;q=0", ["br", "gzip"]) == "gzip"
+    assert choose_encoding("*", ["gzip"]) == "gzip"
+    assert choose_encoding("identity", ["br", "gzip"]) is None
+
+
+def test_compress_skips_small_and_incompressible_bodies():
+    assert compress(b"x" * 100) == {}
+    assert compress(os.urandom(2048)) == {}
+    variants = compress(b"body { color: red; }\n" * 100)
+    assert gzip.decompress(variants["gzip"]) == b"body { color: red; }\n" * 100
+    # Deterministic, so the ETag is stable across workers and deploys
+    assert compress(b"body { color: red; }\n" * 100) == variants
+
+
+def test_asset_variants_get_their_own_etags():
+    asset = Asset("css/site.css", b"body { margin: 0; }\n" * 100)
+    assert asset.hashed_path == f"css/site.{asset.digest[:10]}.css"
+    assert asset.mimetype == "text/css"
+
+    encoding, body, etag = asset.variant("gzip")
+    assert encoding == "gzip" and etag == f"{asset.digest}.gzip"
+    assert gzip.decompress(body) == asset.bodies[None]
+    assert asset.variant("")[2] == asset.digest
+
+
+def test_pipeline_maps_logical_paths_to_hashed_urls(tmp_path):
+    (tmp_path / "js").mkdir()
+    (tmp_path / "js" / "app.js").write_text("console.log('hi');\n" * 50)
+    (tmp_path / "logo.png").write_bytes(b"\x89PNG" + bytes(600))
+    pipeline = AssetPipeline(str(tmp_path), url_prefix="/assets/").build()
+
+    url = pipeline.url("js/app.js")
+    assert url.startswith("/assets/js/app.") and url.endswith(".js")
+    assert pipeline.get(url[len("/assets/"):]).path == "js/app.js"
+    assert pipeline.url("missing.js") is None
+    # Binary files are served as-is
+    assert pipeline.get(pipeline.url("logo.png")[len("/assets/"):]).encodings == []
+    assert pipeline.stats()["assets"] == 2
@@ -0,0 +1,57 @@
+import os
+
+import pytest
+
+import bench
+
+
+def test_percentile_is_nearest_rank():
+    values = list(range(1, 101))
+    assert bench.percentile(values, 50) == 50
+    assert bench.percentile(values, 99) == 99
+    assert bench.percentile([], 95) == 0.0
+    assert bench.percentile([7], 99) == 7
+
+
+def test_summarize_reports_milliseconds():
+    summary = bench.summarize([0.01, 0.02, 0.03, 0.04], elapsed=2.0)
+    assert summary["requests"] == 4
+    assert summary["throughput_rps"] == 2.0
+    assert summary["p50_ms"] == 20.0
+    assert summary["max_ms"] == 40.0
+
+
+def test_compare_flags_regressions_only_past_threshold():
+    baseline = {"micro": {"a_us": 10.0, "b_us": 10.0}}
+    current = {"micro": {"a_us": 10.5, "b_us": 12.0}}
+    lines = bench.compare(current, baseline)
+    assert "REGRESSION" not in lines[0]
+    assert "REGRESSION" in lines[1]
+
+
+def test_load_smoke_run():
+    pytest.importorskip('flask')
+    pytest.importorskip('dotenv')
+    pytest.importorskip('requests')
+    os.environ.setdefault('CHEFBOT_LLM_BACKEND', 'fake')
+    os.environ.setdefault('CHEFBOT_FAKE_LATENCY', '0')
+    os.environ.setdefault('CHEFBOT_ADMISSION', '0')
+    import app as chefbot
+
+    args = bench.parse_args(["--users", "2", "--iterations", "1", "--pantries", "3", "--latency", "0"])
+    result = bench.run_load(chefbot, args)
+    assert result["total"]["requests"] > 0
+    assert result["total"]["errors"] == 0
+    assert "get_recipes" in result["steps"]
+    micro = bench.run_micro(chefbot, number=5, repeat=1)
+    assert set(micro) == {"scale_ingredient_us", "scale_macros_us", "generate_recipe_details_msg_us"}
+
+
+def test_configure_environment_keeps_ip_buckets_off(monkeypatch):
+    for name in ("CHEFBOT_LLM_BACKEND", "CHEFBOT_FAKE_LATENCY", "CHEFBOT_FAKE_JITTER", "CHEFBOT_FAKE_FAILURE_RATE",
+                 "CHEFBOT_FAKE_SEED", "CHEFBOT_PREFETCH", "CHEFBOT_ADMISSION", "CHEFBOT_LOG_LEVEL"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("CHEFBOT_TRUST_PROXY", "1")
+    bench.configure_environment(bench.parse_args(["--admission"]))
+    assert os.environ["CHEFBOT_TRUST_PROXY"] == "0"
+    assert os.environ["CHEFBOT_ADMISSION"] == "1"
@@ -0,0 +1,58 @@
+import time
+
+from chat_cache import ChatReplyCache, is_context_independent, normalize_question
+
+PINNED = "CHOSEN_RECIPE_DETAILS: Garlic Chicken, 2 servings"
+
+
+def test_normalize_question():
+    assert normalize_question("Hey, what's the next step??") == "what is the next step"
+    assert normalize_question("How LONG do I bake it") == "how long do i bake it"
+
+
+def test_follow_ups_are_not_context_independent():
+    assert is_context_independent("How long do I bake the chicken?")
+    assert not is_context_independent("What about the second one?")
+    assert not is_context_independent("and then what do I do")
+    assert not is_context_independent("why?")
+    # The cache only runs with a pinned recipe, so "it" is that recipe
+    assert is_context_independent("How long do I bake it?")
+
+
+def test_hits_only_for_the_same_pinned_recipe():
+    cache = ChatReplyCache()
+    cache.put("How long do I bake the chicken?", PINNED, "25 minutes.", prompt_tokens=100)
+    assert cache.get("how long do i bake the chicken", PINNED) == "25 minutes."
+    assert cache.get("How long do I bake the chicken?", PINNED + " (4 servings)") is None
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+    assert stats["saved_prompt_tokens"] == 100 and stats["saved_completion_tokens"] > 0
+
+
+def test_nothing_is_cached_without_a_pinned_recipe():
+    cache = ChatReplyCache()
+    cache.put("How do I keep rice from sticking?", None, "Rinse it first.")
+    assert cache.stats()["entries"] == 0
+    assert cache.get("How do I keep rice from sticking?", None) is None
+    assert cache.stats()["bypassed"] == 1
+
+
+def test_follow_ups_are_bypassed():
+    cache = ChatReplyCache()
+    cache.put("What about the other one?", PINNED, "It takes longer.")
+    assert cache.get("What about the other one?", PINNED) is None
+    stats = cache.stats()
+    assert stats["entries"] == 0 and stats["bypassed"] == 1
+
+
+def test_ttl_and_lru_eviction(monkeypatch):
+    cache = ChatReplyCache(max_entries=2, ttl=10)
+    for n in range(3):
+        cache.put(f"How long does step {n} take?", PINNED, f"{n} minutes.")
+    assert cache.get("How long does step 0 take?", PINNED) is None
+    assert cache.stats()["evictions"] == 1
+
+    now = time.time()
+    monkeypatch.setattr("chat_cache.time.time", lambda: now + 11)
+    assert cache.get("How long does step 2 take?", PINNED) is None
+    assert cache.stats()["entries"] == 1
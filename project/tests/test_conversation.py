@@ -0,0 +1,43 @@
+from conversation import ConversationHistory, estimate_tokens
+
+
+def test_turns_are_trimmed_to_max_turns_and_summarized():
+    history = ConversationHistory(max_turns=4, token_budget=10000)
+    for i in range(3):
+        history.add('user', f'question {i}')
+        history.add('assistant', f'answer {i}')
+    assert len(history.turns) == 4
+    assert history.turns[0][1] == 'question 1'
+    assert history.summary == 'question 0;'
+
+
+def test_token_budget_keeps_latest_turn():
+    history = ConversationHistory(token_budget=10)
+    history.add('user', 'x' * 200)
+    assert len(history.turns) == 1
+    history.add('user', 'short')
+    assert [turn[1] for turn in history.turns] == ['short']
+    assert history.total_tokens() <= 10 + estimate_tokens(history.summary)
+
+
+def test_pinned_recipe_survives_trimming_and_leads_messages():
+    history = ConversationHistory(max_turns=2)
+    history.pin_recipe('Pancakes: 2 cups flour')
+    for i in range(5):
+        history.add('user', f'q{i}')
+    messages = history.to_messages('You are ChefBot.')
+    assert messages[0] == {'role': 'system', 'content': 'You are ChefBot.'}
+    assert 'Pancakes' in messages[1]['content']
+    assert messages[-1] == {'role': 'user', 'content': 'q4'}
+    assert 'CHOSEN_RECIPE_DETAILS' in history.render_context()
+
+
+def test_round_trip_through_dict():
+    history = ConversationHistory()
+    history.pin_recipe('Soup')
+    history.add('user', 'hello there')
+    history.add('assistant', 'hi!')
+    restored = ConversationHistory.from_dict(history.to_dict())
+    assert restored.to_messages('s') == history.to_messages('s')
+    assert restored.total_tokens() == history.total_tokens()
+    assert ConversationHistory.from_dict(None).turns == type(history.turns)()
@@ -0,0 +1,78 @@
+import json
+
+import pytest
+
+pytest.importorskip('requests')
+
+from llm_client import FakeBackend, LLMClient, LLMError, create_llm_client  # noqa: E402
+
+
+class FlakyBackend:
+    def __init__(self, failures, retryable=True, tokens=('a ', 'b')):
+        self.failures = failures
+        self.retryable = retryable
+        self.tokens = tokens
+        self.calls = 0
+
+    def complete(self, messages, model, max_tokens, temperature):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise LLMError('busy', retryable=self.retryable, retry_after=0)
+        return '  done  '
+
+    def stream(self, messages, model, max_tokens, temperature):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise LLMError('busy', retryable=self.retryable, retry_after=0)
+        yield from self.tokens
+
+
+MESSAGES = [{'role': 'user', 'content': 'hi'}]
+
+
+def test_retries_retryable_errors_and_reports_the_call():
+    calls = []
+    client = LLMClient(FlakyBackend(failures=2), max_retries=2, observer=calls.append)
+    assert client.complete(MESSAGES, label='chat') == 'done'
+    assert calls[0].attempts == 3 and calls[0].error is None
+
+
+def test_gives_up_after_max_retries_and_on_fatal_errors():
+    with pytest.raises(LLMError):
+        LLMClient(FlakyBackend(failures=3), max_retries=2).complete(MESSAGES)
+    backend = FlakyBackend(failures=1, retryable=False)
+    with pytest.raises(LLMError):
+        LLMClient(backend, max_retries=2).complete(MESSAGES)
+    assert backend.calls == 1
+
+
+def test_stream_retries_before_first_token_and_releases_slots():
+    client = LLMClient(FlakyBackend(failures=1), max_concurrency=1, max_retries=1)
+    assert list(client.stream(MESSAGES)) == ['a ', 'b']
+    # The single slot was released, so another call doesn't block
+    assert list(client.stream(MESSAGES)) == ['a ', 'b']
+
+
+def test_fake_backend_is_deterministic_and_recognizes_recipe_prompts():
+    client = create_llm_client('fake', latency=0)
+    prompt = [{'role': 'user', 'content': (
+        'I have these ingredients: rice, egg. My preferences are: none. '
+        'Generate exactly 3 recipe ideas in valid JSON array form')}]
+    first = client.complete(prompt, label='recipes')
+    assert first == client.complete(prompt, label='recipes')
+    recipes = json.loads(first)
+    assert len(recipes) == 3
+    assert {'title', 'ingredients', 'macros', 'instructions', 'servings'} <= set(recipes[0])
+
+
+def test_create_llm_client_passes_acquire_timeout_to_the_client():
+    client = create_llm_client('fake', latency=0, max_concurrency=1, acquire_timeout=0.5)
+    assert client.acquire_timeout == 0.5
+    assert not hasattr(client.backend, 'acquire_timeout')
+
+
+def test_fake_backend_failure_rate_raises_retryable_errors():
+    backend = FakeBackend(latency=0, failure_rate=1.0)
+    with pytest.raises(LLMError) as info:
+        backend.complete(MESSAGES, 'model', 10, 0)
+    assert info.value.retryable
@@ -0,0 +1,76 @@
+import threading
+
+import pytest
+
+from meal_plan import BatchRejected, BatchRunner
+from stores import SQLiteStore
+
+
+def echo_job(job):
+    if job['ingredients'] == ['boom']:
+        raise RuntimeError('no recipes')
+    return {'count': job['count']}
+
+
+def test_normalize_job_validates_and_strips():
+    runner = BatchRunner(echo_job, max_count=3)
+    assert runner.normalize_job({'ingredients': [' rice ', ''], 'count': '2'}) == {
+        'ingredients': ['rice'], 'preferences': {}, 'count': 2}
+    for bad in ('rice', {'ingredients': []}, {'ingredients': ['rice'], 'preferences': []},
+                {'ingredients': ['rice'], 'count': 'x'}, {'ingredients': ['rice'], 'count': 4}):
+        with pytest.raises(BatchRejected):
+            runner.normalize_job(bad)
+
+
+def test_submit_rejects_empty_and_oversized_batches():
+    runner = BatchRunner(echo_job, max_jobs_per_batch=2)
+    with pytest.raises(BatchRejected) as e:
+        runner.submit([])
+    assert e.value.status == 400
+    with pytest.raises(BatchRejected) as e:
+        runner.submit([{'ingredients': ['a']}] * 3)
+    assert e.value.status == 413
+
+
+def test_results_stream_in_completion_order_with_errors():
+    runner = BatchRunner(echo_job, max_workers=2)
+    batch = runner.submit([{'ingredients': ['rice'], 'count': 1}, {'ingredients': ['boom']}])
+    results = list(runner.iter_results(batch, timeout=5))
+    assert sorted(r['job'] for r in results) == [0, 1]
+    by_job = {r['job']: r for r in results}
+    assert by_job[0]['status'] == 'ok' and by_job[0]['count'] == 1
+    assert by_job[1]['status'] == 'error' and by_job[1]['error'] == 'no recipes'
+
+    status = runner.status(batch, since=1)
+    assert status['done'] and status['failed'] == 1 and status['next'] == 2
+    assert len(status['results']) == 1
+    assert runner.get(batch.id) is batch
+    assert runner.stats()['failed'] == 1
+
+
+def test_pending_limit_rejects_with_503():
+    release = threading.Event()
+    runner = BatchRunner(lambda job: release.wait() and {}, max_workers=1, max_pending=2)
+    try:
+        runner.submit([{'ingredients': ['a']}, {'ingredients': ['b']}])
+        with pytest.raises(BatchRejected) as e:
+            runner.submit([{'ingredients': ['c']}])
+        assert e.value.status == 503
+        assert runner.stats()['rejected'] == 1
+    finally:
+        release.set()
+
+
+def test_status_store_lets_another_worker_answer_polls(tmp_path):
+    path = str(tmp_path / 'state.sqlite3')
+    runner = BatchRunner(echo_job, max_workers=2, status_store=SQLiteStore(path, 'meal_plans', read_cache_ttl=0))
+    other = BatchRunner(echo_job, status_store=SQLiteStore(path, 'meal_plans', read_cache_ttl=0))
+    batch = runner.submit([{'ingredients': ['rice'], 'count': 1}, {'ingredients': ['boom']}])
+    list(runner.iter_results(batch, timeout=5))
+
+    assert other.get(batch.id) is None
+    status = other.lookup(batch.id)
+    assert status == runner.status(batch)
+    assert other.lookup(batch.id, since=1)['results'] == batch.results[1:]
+    assert other.lookup('unknown') is None
+    assert BatchRunner(echo_job).lookup(batch.id) is None
@@ -0,0 +1,82 @@
+import logging
+import logging.handlers
+
+import pytest
+
+import logs
+from metrics import Counter, Histogram, Registry
+
+
+def test_counter_counts_per_label_set():
+    counter = Counter("c_total", "help", ("route",))
+    counter.inc(route="/a")
+    counter.inc(2, route="/a")
+    counter.inc(route="/b")
+    assert counter.value(route="/a") == 3
+    assert counter.value(route="/c") == 0
+    with pytest.raises(ValueError):
+        counter.inc(-1, route="/a")
+    with pytest.raises(ValueError):
+        counter.inc(status="200")
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("h_seconds", "help", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 5.0):
+        histogram.observe(value)
+    lines = histogram.render()
+    assert 'h_seconds_bucket{le="0.1"} 1' in lines
+    assert 'h_seconds_bucket{le="1"} 3' in lines
+    assert 'h_seconds_bucket{le="+Inf"} 4' in lines
+    assert "h_seconds_sum 6.25" in lines
+    assert "h_seconds_count 4" in lines
+
+
+def test_registry_renders_exposition_format():
+    registry = Registry()
+    registry.counter("req_total", "Requests.", ("path",)).inc(path='a"b')
+    registry.gauge("temp", "Temperature.").set(1.5)
+    registry.callback("items", "Items.", lambda: [({"kind": "x"}, 3)], labelnames=("kind",))
+    text = registry.render()
+    assert "# HELP req_total Requests.\n# TYPE req_total counter\n" in text
+    assert 'req_total{path="a\\"b"} 1' in text
+    assert "temp 1.5" in text
+    assert 'items{kind="x"} 3' in text
+    assert text.endswith("\n")
+
+
+def test_summary_callback_renders_sum_and_count():
+    registry = Registry()
+    registry.callback("stage_seconds", "Stage time.", lambda: [({"stage": "local"}, (0.25, 4))],
+                      kind="summary", labelnames=("stage",))
+    text = registry.render()
+    assert "# TYPE stage_seconds summary" in text
+    assert 'stage_seconds_sum{stage="local"} 0.25' in text
+    assert 'stage_seconds_count{stage="local"} 4' in text
+
+
+def test_registry_rejects_duplicates_and_survives_broken_callbacks():
+    registry = Registry()
+    registry.counter("dup_total", "help")
+    with pytest.raises(ValueError):
+        registry.counter("dup_total", "help")
+    registry.callback("broken", "help", lambda: 1 / 0)
+    assert "dup_total" in registry.render()
+
+
+def test_setup_logging_routes_through_a_queue(monkeypatch):
+    # Install fresh, even if the app already set up logging in this process
+    monkeypatch.setattr(logs, "_listener", None)
+    monkeypatch.setattr(logs.atexit, "register", lambda fn: None)
+    monkeypatch.delattr(logs.os, "register_at_fork", raising=False)
+    logger = logs.setup_logging("chefbot-test", level="debug")
+    try:
+        assert logger.level == logging.DEBUG
+        assert not logger.propagate
+        assert [type(h) for h in logger.handlers] == [logging.handlers.QueueHandler]
+        # Only the first call installs handlers
+        assert logs.setup_logging("chefbot-test") is logger
+        assert len(logger.handlers) == 1
+    finally:
+        logs._stop_listener()
+        logger.handlers.clear()
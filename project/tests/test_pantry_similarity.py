@@ -0,0 +1,67 @@
+from array import array
+
+import pytest
+
+from pantry_similarity import PantrySimilarityIndex, jaccard
+
+PANTRY = ["chicken", "rice", "garlic", "onion", "carrot", "peas", "soy sauce", "ginger"]
+
+
+def test_jaccard():
+    assert jaccard(set(), set()) == 1.0
+    assert jaccard({"a", "b"}, {"b", "c"}) == pytest.approx(1 / 3)
+
+
+def test_num_perm_must_split_into_bands():
+    with pytest.raises(ValueError):
+        PantrySimilarityIndex(num_perm=10, bands=3)
+
+
+def test_bucket_keys_are_packed_ints():
+    index = PantrySimilarityIndex(num_perm=64, bands=16)
+    keys = index._bucket_keys(frozenset(PANTRY), "")
+    assert isinstance(keys, array) and keys.typecode == "Q" and len(keys) == 16
+
+
+def test_reuses_similar_pantry_above_threshold():
+    index = PantrySimilarityIndex(threshold=0.8)
+    index.add(PANTRY, {}, "key-1")
+
+    key, score = index.lookup(PANTRY + ["salt"], {})
+    assert key == "key-1"
+    assert score == pytest.approx(8 / 9)
+    assert index.stats()["hits"] == 1
+
+
+def test_no_reuse_below_threshold():
+    index = PantrySimilarityIndex(threshold=0.8)
+    index.add(PANTRY, {}, "key-1")
+
+    key, score = index.lookup(PANTRY[:6], {})  # 6/8 = 0.75
+    assert key is None
+    assert score < 0.8
+    key, _ = index.lookup(PANTRY[:6], {}, threshold=0.7)
+    assert key == "key-1"
+
+
+def test_never_reuses_across_preferences():
+    index = PantrySimilarityIndex(threshold=0.5)
+    index.add(PANTRY, {"vegan": True}, "vegan-key")
+
+    assert index.lookup(PANTRY, {})[0] is None
+    assert index.lookup(PANTRY, {"glutenfree": True})[0] is None
+    assert index.lookup(PANTRY, {"vegan": True})[0] == "vegan-key"
+
+
+def test_eviction_and_discard_clean_up_buckets():
+    index = PantrySimilarityIndex(max_entries=2)
+    index.add(["a", "b", "c"], {}, "k1")
+    index.add(["d", "e", "f"], {}, "k2")
+    index.add(["g", "h", "i"], {}, "k3")
+    assert index.lookup(["a", "b", "c"], {})[0] is None
+    assert index.stats()["evictions"] == 1
+
+    index.discard("k2")
+    index.discard("k3")
+    stats = index.stats()
+    assert stats["entries"] == 0 and stats["buckets"] == 0
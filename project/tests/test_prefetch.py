@@ -0,0 +1,55 @@
+import threading
+
+from prefetch import RecipePrefetcher
+
+VEGAN = {'vegan': True}
+
+
+def make_prefetcher(**kwargs):
+    calls = []
+
+    def generate(ingredients, preferences):
+        calls.append((tuple(ingredients), dict(preferences)))
+        return [{'title': f'Batch {len(calls)}'}]
+
+    return RecipePrefetcher(generate, max_workers=1, **kwargs), calls
+
+
+def test_take_serves_the_batch_for_the_same_pantry():
+    prefetcher, calls = make_prefetcher()
+    assert prefetcher.schedule('s1', ['rice', 'beans'], VEGAN)
+    assert not prefetcher.schedule('s1', ['beans', 'rice'], VEGAN)  # already pending
+    assert prefetcher.take('s1', ['rice', 'beans'], VEGAN) == [{'title': 'Batch 1'}]
+    assert prefetcher.take('s1', ['rice', 'beans'], VEGAN) is None
+    assert len(calls) == 1
+    stats = prefetcher.stats()
+    assert stats['hits'] + stats['joined'] == 1 and stats['misses'] == 1
+
+
+def test_different_preferences_miss_and_cancel():
+    prefetcher, _ = make_prefetcher()
+    prefetcher.schedule('s1', ['rice'], VEGAN)
+    assert prefetcher.take('s1', ['rice'], {}) is None
+    assert prefetcher.stats()['cancelled'] == 1
+
+
+def test_preferences_of_the_pending_batch():
+    prefetcher, _ = make_prefetcher()
+    assert prefetcher.preferences('s1') is None
+    prefetcher.schedule('s1', ['rice'], VEGAN)
+    assert prefetcher.preferences('s1') == VEGAN
+
+
+def test_per_session_and_global_limits():
+    release = threading.Event()
+    prefetcher = RecipePrefetcher(lambda i, p: release.wait() and [{}], max_workers=1,
+                                  max_in_flight=2, per_session_limit=1)
+    try:
+        assert prefetcher.schedule('s1', ['a'], {})
+        assert not prefetcher.schedule('s1', ['b'], {})  # pantry changed, but limit reached
+        assert prefetcher.stats()['skipped_session'] == 1
+        assert prefetcher.schedule('s2', ['a'], {})
+        assert not prefetcher.schedule('s3', ['a'], {})
+        assert prefetcher.stats()['skipped_global'] == 1
+    finally:
+        release.set()
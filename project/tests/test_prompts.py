@@ -0,0 +1,53 @@
+import pytest
+
+import prompts
+from prompts import (
+    PromptBudgetError, PromptTemplate, compact_json, format_preferences, get_prompt, prompt_stats,
+)
+
+
+def test_default_variant_is_full():
+    if prompts.os.getenv('CHEFBOT_PROMPT_VARIANT') is None:
+        assert prompts.PROMPT_VARIANT == 'full'
+    assert get_prompt('recipes', 'full').variant == 'full'
+    assert get_prompt('recipes', 'compact').variant == 'compact'
+
+
+def test_compact_prefix_is_smaller():
+    assert get_prompt('recipes', 'compact').prefix_tokens < get_prompt('recipes', 'full').prefix_tokens
+
+
+def test_helpers():
+    assert compact_json({"a": [1, 2]}) == '{"a":[1,2]}'
+    assert format_preferences({"vegan": True, "glutenfree": False}) == "vegan"
+    assert format_preferences({}) == "none"
+
+
+def test_render_shares_prefix_and_appends_user_message():
+    template = PromptTemplate("t", "v", "system", "Q: {question}", examples=[("hi", "hello")])
+    messages, tokens = template.render(question="why?")
+    assert messages[:3] == list(template.prefix)
+    assert messages[-1] == {"role": "user", "content": "Q: why?"}
+    assert tokens > template.prefix_tokens
+
+
+def test_render_enforces_budget():
+    template = PromptTemplate("t", "v", "system " * 50, "{question}", max_tokens=100)
+    with pytest.raises(PromptBudgetError):
+        template.render(question="x", budget=120)
+    template.render(question="x", max_tokens=10, budget=120)
+
+
+def test_timed_updates_stats():
+    template = PromptTemplate("t", "v", "system", "{question}")
+    with template.timed(42):
+        pass
+    stats = template.stats()
+    assert stats["calls"] == 1 and stats["prompt_tokens"] == 42
+    assert stats["avg_prompt_tokens"] == 42 and stats["seconds"] >= 0
+
+
+def test_prompt_stats_covers_every_variant_and_template():
+    stats = prompt_stats()
+    assert set(stats) == {"full", "compact"}
+    assert set(stats["full"]) == {"recipes", "validate", "strict_recipes", "chat"}
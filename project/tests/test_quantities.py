@@ -0,0 +1,54 @@
+import pytest
+
+from quantities import Ingredient, MacroVector, RecipeScaler, format_amount, normalize_unit, parse_number
+
+
+@pytest.mark.parametrize('text, value', [('2', 2), ('1.5', 1.5), ('1/2', 0.5), ('1 1/2', 1.5)])
+def test_parse_number(text, value):
+    assert parse_number(text) == value
+
+
+def test_format_amount():
+    assert format_amount(1.5, 'cup') == '1 1/2'
+    assert format_amount(0.75, 'tsp') == '3/4'
+    assert format_amount(1.5, 'g') == '1.5'
+    assert format_amount(300.0, 'g') == '300'
+
+
+def test_normalize_unit():
+    assert normalize_unit(6, 'tsp') == (2, 'tbsp')
+    assert normalize_unit(1500, 'g') == (1.5, 'kg')
+    assert normalize_unit(3, 'pinch') == (3, 'pinch')
+
+
+@pytest.mark.parametrize('line, factor, expected', [
+    ('2 cups flour', 2, '4 cups flour'),
+    ('1/2 cup cream', 2, '1 cup cream'),
+    ('1½ cups milk', 2, '3 cups milk'),
+    ('1 cup sugar', 0.5, '1/2 cup sugar'),
+    ('3 tsp salt', 2, '2 tbsp salt'),
+    ('750 g potatoes', 2, '1.5 kg potatoes'),
+    ('2-3 cloves garlic', 2, '4-6 cloves garlic'),
+    ('3 eggs', 0.5, '1 1/2 eggs'),
+    ('salt to taste', 3, 'salt to taste'),
+    ('2 cups flour', 1, '2 cups flour'),
+])
+def test_scale_ingredient(line, factor, expected):
+    assert Ingredient.parse(line).scale(factor) == expected
+
+
+@pytest.mark.parametrize('macros, factor, expected', [
+    ('Calories: 467, Fat: 12g, Protein: 35g', 0.5, 'Calories: 233.5, Fat: 6g, Protein: 17.5g'),
+    ('Calories: 300, Fat: 15g', 1.5, 'Calories: 450, Fat: 22.5g'),
+    ('Calories: 100, High in fiber', 3, 'Calories: 300, High in fiber'),
+])
+def test_scale_macros_uses_decimals(macros, factor, expected):
+    assert MacroVector.parse(macros).scale(factor) == expected
+
+
+def test_recipe_scaler_is_idempotent():
+    recipe = {'ingredients': ['2 cups flour'], 'macros': 'Calories: 300', 'servings': 2}
+    scaler = RecipeScaler(recipe)
+    assert scaler.scale_to(4) == scaler.scale_to(4)
+    assert scaler.scale_to(4)['ingredients'] == ['4 cups flour']
+    assert scaler.scale_to(2) == recipe
@@ -0,0 +1,60 @@
+import time
+
+from recipe_cache import (
+    MemoryCacheBackend, RecipeCache, SQLiteCacheBackend, make_cache_key, normalize_ingredient,
+)
+
+
+def test_key_ignores_order_case_and_plurals():
+    a = make_cache_key(["Tomatoes", " onion "], {"vegan": True, "nut-free": False})
+    b = make_cache_key(["onions", "tomato"], {"vegan": True})
+    assert a == b
+    assert a != make_cache_key(["onion", "tomato"], {})
+    assert a != make_cache_key(["onion", "tomato"], {"vegan": True}, fresh_call=True)
+
+
+def test_normalize_ingredient():
+    assert normalize_ingredient("  Cherry   Tomatoes ") == "cherry tomato"
+    assert normalize_ingredient("Asparagus") == "asparagus"
+
+
+def test_memory_cache_ttl_and_lru():
+    cache = RecipeCache(MemoryCacheBackend(max_entries=2), ttl=60)
+    cache.set("a", [{"title": "A"}])
+    cache.set("b", [{"title": "B"}])
+    assert cache.get("a") == [{"title": "A"}]
+    cache.set("c", [{"title": "C"}])
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    cache.ttl = -1
+    cache.set("d", [])
+    assert cache.get("d") is None
+    assert cache.stats()["expired"] == 1
+
+
+def test_sqlite_hits_do_not_write_until_flushed(tmp_path):
+    backend = SQLiteCacheBackend(str(tmp_path / "cache.sqlite3"), max_entries=10, touch_batch=100,
+                                 touch_interval=3600)
+    cache = RecipeCache(backend, ttl=60)
+    cache.set("a", [{"title": "A"}])
+    before = backend._conn().execute("SELECT last_access FROM recipe_cache").fetchone()[0]
+    time.sleep(0.01)
+    for _ in range(5):
+        assert cache.get("a") == [{"title": "A"}]
+    assert backend._conn().execute("SELECT last_access FROM recipe_cache").fetchone()[0] == before
+    cache.flush()
+    assert backend._conn().execute("SELECT last_access FROM recipe_cache").fetchone()[0] > before
+
+
+def test_sqlite_eviction_uses_buffered_touches(tmp_path):
+    backend = SQLiteCacheBackend(str(tmp_path / "cache.sqlite3"), max_entries=2, touch_batch=100,
+                                 touch_interval=3600)
+    cache = RecipeCache(backend, ttl=60)
+    cache.set("a", [1])
+    time.sleep(0.01)
+    cache.set("b", [2])
+    time.sleep(0.01)
+    cache.get("a")    # touch only buffered, but set() flushes before evicting
+    cache.set("c", [3])
+    assert cache.get("a") == [1]
+    assert cache.get("b") is None
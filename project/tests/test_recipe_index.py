@@ -0,0 +1,87 @@
+from recipe_index import RecipeIndex, ingredient_words, missing_ingredients
+
+
+def recipe(title, *ingredients):
+    return {"title": title, "ingredients": list(ingredients), "instructions": ["Cook."]}
+
+
+def titles(results):
+    return [r["title"] for r, _, _ in results]
+
+
+def test_ingredient_words_drops_descriptors_and_amounts():
+    assert ingredient_words("2 cloves garlic, minced") == frozenset({"garlic"})
+    assert ingredient_words("1 lb boneless chicken breast") == frozenset({"chicken", "breast"})
+
+
+def test_exact_subset_ignores_staples():
+    index = RecipeIndex()
+    index.add(recipe("Garlic Chicken", "1 lb chicken breast", "2 cloves garlic", "salt", "olive oil"))
+    index.add(recipe("Lemon Chicken", "1 lb chicken breast", "1 lemon"))
+
+    results = index.search(["chicken", "garlic"])
+    assert titles(results) == ["Garlic Chicken"]
+    _, missing, coverage = results[0]
+    assert missing == 0 and coverage == 1.0
+
+
+def test_max_missing_ranks_by_missing_then_coverage():
+    index = RecipeIndex()
+    index.add(recipe("Pasta", "pasta", "tomato", "basil"))
+    index.add(recipe("Salad", "tomato", "cucumber", "feta", "olive"))
+    index.add(recipe("Soup", "tomato", "onion"))
+
+    assert index.search(["tomato", "basil"]) == []
+    results = index.search(["tomato", "basil"], max_missing=1)
+    assert titles(results) == ["Pasta", "Soup"]
+    assert [m for _, m, _ in results] == [1, 1]
+    assert titles(index.search(["tomato", "basil"], max_missing=3)) == ["Pasta", "Soup", "Salad"]
+
+
+def test_query_must_cover_every_word_of_an_ingredient():
+    index = RecipeIndex()
+    index.add(recipe("Thighs", "chicken thigh"))
+    assert index.search(["chicken breast"]) == []
+    assert titles(index.search(["chicken"])) == ["Thighs"]
+
+
+def test_accept_and_limit():
+    index = RecipeIndex()
+    for n in range(5):
+        index.add(recipe(f"Rice {n}", "rice"))
+    results = index.search(["rice"], limit=2, accept=lambda r: r["title"] != "Rice 0")
+    assert titles(results) == ["Rice 1", "Rice 2"]
+
+
+def test_duplicate_titles_are_skipped():
+    index = RecipeIndex()
+    assert index.add(recipe("Toast", "bread"))
+    assert not index.add(recipe("  toast ", "bread", "butter"))
+    assert not index.add(recipe("Water", "water", "salt"))
+    assert len(index) == 1
+
+
+def test_oldest_docs_are_dropped_past_max_docs():
+    index = RecipeIndex(max_docs=3)
+    for n in range(10):
+        index.add(recipe(f"Egg {n}", "egg", f"herb{n}"))
+    assert len(index) == 3
+    found = titles(index.search(["egg"], max_missing=1, limit=10))
+    assert sorted(found) == ["Egg 7", "Egg 8", "Egg 9"]
+    # Dropped titles can be added again
+    assert index.add(recipe("Egg 0", "egg"))
+    assert index.stats()["docs"] == 3
+
+
+def test_search_agrees_with_missing_ingredients():
+    index = RecipeIndex()
+    recipes = [
+        recipe("A", "chicken breast", "rice", "soy sauce"),
+        recipe("B", "beef", "rice"),
+        recipe("C", "tofu", "soy sauce", "garlic", "garlic"),
+    ]
+    for r in recipes:
+        index.add(r)
+    query = ["chicken", "rice", "soy sauce", "garlic"]
+    for _r, missing, _ in index.search(query, max_missing=5, limit=10):
+        assert missing == missing_ingredients(_r, query)
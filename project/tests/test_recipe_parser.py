@@ -0,0 +1,72 @@
+import json
+
+from recipe_parser import RecipeStreamParser, iter_recipes, normalize_recipe, strip_code_fences
+
+RECIPE = {
+    'title': 'Fried Rice',
+    'ingredients': ['2 cups rice', '2 eggs'],
+    'macros': 'Calories: 400',
+    'instructions': 'Fry it.',
+    'servings': 2,
+}
+
+
+def chunked(text, size=7):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def test_recipes_are_emitted_as_soon_as_each_object_closes():
+    text = json.dumps([RECIPE, dict(RECIPE, title='Egg Rice')])
+    parser = RecipeStreamParser()
+    first_close = text.index('}') + 1
+    assert [r['title'] for r in parser.feed(text[:first_close])] == ['Fried Rice']
+    assert [r['title'] for r in parser.feed(text[first_close:])] == ['Egg Rice']
+    assert parser.close() is True
+    assert parser.parsed == 2
+
+
+def test_code_fences_and_chatter_are_ignored():
+    text = "Sure! Here you go:\n```json\n" + json.dumps([RECIPE]) + "\n```\nEnjoy {cooking}!"
+    recipes = list(iter_recipes(chunked(text)))
+    assert [r['title'] for r in recipes] == ['Fried Rice']
+    assert strip_code_fences("```json\n[1]\n```") == "[1]"
+
+
+def test_truncated_reply_keeps_complete_recipes():
+    text = json.dumps([RECIPE, dict(RECIPE, title='Cut Off')])
+    parser = RecipeStreamParser()
+    recipes = list(iter_recipes(chunked(text[:-40]), parser))
+    assert [r['title'] for r in recipes] == ['Fried Rice']
+    assert parser.close() is False
+
+
+def test_braces_inside_strings_do_not_confuse_the_parser():
+    tricky = dict(RECIPE, instructions='Stir {gently} and "fold" ] twice')
+    recipes = list(iter_recipes(chunked(json.dumps([tricky]), 3)))
+    assert recipes[0]['instructions'] == 'Stir {gently} and "fold" ] twice'
+
+
+def test_near_miss_objects_are_coerced():
+    recipe = normalize_recipe({
+        'title': ' Salad ',
+        'ingredients': 'lettuce, tomato',
+        'macros': {'Calories': 120, 'Fat': '5g'},
+        'instructions': ['Chop', 'Toss'],
+        'servings': 'four',
+    })
+    assert recipe == {
+        'title': 'Salad',
+        'ingredients': ['lettuce', 'tomato'],
+        'macros': 'Calories: 120, Fat: 5g',
+        'instructions': '1. Chop 2. Toss',
+        'servings': 2,
+    }
+
+
+def test_invalid_objects_are_rejected_and_counted():
+    assert normalize_recipe({'title': 'No ingredients'}) is None
+    assert normalize_recipe(dict(RECIPE, title='')) is None
+    parser = RecipeStreamParser()
+    recipes = parser.feed(json.dumps([{'title': 'x'}, RECIPE]))
+    assert [r['title'] for r in recipes] == ['Fried Rice']
+    assert parser.rejected == 1
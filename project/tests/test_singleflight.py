@@ -0,0 +1,84 @@
+import os
+import threading
+import time
+
+import pytest
+
+from singleflight import SingleFlight, SingleFlightTimeout
+
+
+def run_concurrently(n, target):
+    results = [None] * n
+    errors = [None] * n
+
+    def worker(i):
+        try:
+            results[i] = target()
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+def test_concurrent_calls_share_one_execution():
+    flights = SingleFlight()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.1)
+        return 'result'
+
+    results, errors = run_concurrently(5, lambda: flights.do('key', slow))
+    assert results == ['result'] * 5 and errors == [None] * 5
+    assert len(calls) == 1
+    stats = flights.stats()
+    assert stats['executions'] == 1 and stats['coalesced'] == 4 and stats['in_flight'] == 0
+
+
+def test_errors_reach_every_waiter():
+    flights = SingleFlight()
+
+    def boom():
+        time.sleep(0.05)
+        raise ValueError('boom')
+
+    _, errors = run_concurrently(3, lambda: flights.do('key', boom))
+    assert all(isinstance(e, ValueError) for e in errors)
+    assert flights.stats()['errors'] == 1
+
+
+def test_waiter_times_out():
+    flights = SingleFlight()
+    started = threading.Event()
+
+    def slow():
+        started.set()
+        time.sleep(0.3)
+        return 1
+
+    leader = threading.Thread(target=lambda: flights.do('key', slow))
+    leader.start()
+    started.wait()
+    with pytest.raises(SingleFlightTimeout):
+        flights.do('key', slow, timeout=0.05)
+    leader.join()
+    assert flights.stats()['timeouts'] == 1
+
+
+def test_lock_files_are_striped(tmp_path):
+    flights = SingleFlight(lock_dir=str(tmp_path), lock_stripes=4)
+    for i in range(50):
+        assert flights.do(f'key-{i}', lambda: i) == i
+    assert len(os.listdir(tmp_path)) <= 4
+
+
+def test_shared_lookup_skips_execution(tmp_path):
+    flights = SingleFlight(lock_dir=str(tmp_path))
+    assert flights.do('key', lambda: 'fresh', lookup=lambda: 'shared') == 'shared'
+    assert flights.stats()['shared_hits'] == 1 and flights.stats()['executions'] == 0
@@ -0,0 +1,169 @@
+import os
+import time
+
+import pytest
+
+import store_log
+import stores
+from store_log import LOG_MAGIC, PersistentStore, StoreLog
+from stores import BoundedStore
+
+
+def open_store(directory, **options):
+    options.setdefault('fsync', 'never')
+    return PersistentStore(BoundedStore(ttl=3600), StoreLog(str(directory), **options))
+
+
+def test_changes_survive_a_restart(tmp_path):
+    store = open_store(tmp_path)
+    store['a'] = {'n': 1}
+    store.set_many([('b', [1, 2]), ('c', 'three')])
+    store.pop('b')
+    store.log.close()
+
+    restored = open_store(tmp_path)
+    assert restored['a'] == {'n': 1}
+    assert 'b' not in restored
+    assert restored.get('c') == 'three'
+    assert restored.log.stats()['replayed'] == 4
+    restored.log.close()
+
+
+def test_torn_tail_is_truncated(tmp_path):
+    store = open_store(tmp_path)
+    store['a'] = 'kept'
+    store.log.close()
+    path = store.log._path('log', 0)
+    with open(path, 'ab') as f:
+        f.write(b'\x07' * 10)
+
+    restored = open_store(tmp_path)
+    assert restored['a'] == 'kept'
+    assert restored.log.stats()['torn_bytes'] == 10
+    restored.log.close()
+    assert os.path.getsize(path) > len(LOG_MAGIC)
+
+
+def test_snapshot_compacts_older_files(tmp_path):
+    store = open_store(tmp_path, compress=True)
+    for n in range(20):
+        store[f'k{n}'] = {'text': 'x' * 300, 'n': n}
+    store.pop('k0')
+    store.log.snapshot()
+    store['after'] = 'snapshot'
+    store.log.close()
+    assert sorted(os.listdir(tmp_path)) == ['append.lock', 'lock', 'log-00000001.dat', 'snapshot-00000001.dat']
+
+    restored = open_store(tmp_path)
+    assert len(restored) == 20 and 'k0' not in restored
+    assert restored['k7']['n'] == 7 and restored['after'] == 'snapshot'
+    assert restored.log.stats()['restored'] == 19
+    restored.log.close()
+
+
+def test_reads_slide_the_restored_expiry(tmp_path, monkeypatch):
+    now = time.time()
+    clock = [now]
+    monkeypatch.setattr(stores.time, 'time', lambda: clock[0])
+    monkeypatch.setattr(store_log.time, 'time', lambda: clock[0])
+
+    store = open_store(tmp_path)
+    store.set('read', 'yes', ttl=10)
+    store.set('unread', 'no', ttl=10)
+    clock[0] = now + 8
+    assert store['read'] == 'yes'
+    store.flush()
+    store.log.close()
+    assert store.log.stats()['touches'] == 1
+
+    clock[0] = now + 15
+    restored = open_store(tmp_path)
+    assert restored.get('read') == 'yes'
+    assert restored.get('unread') is None
+    restored.log.close()
+
+
+@pytest.mark.skipif(store_log.fcntl is None, reason='needs flock')
+def test_read_only_worker_takes_over_the_lock(tmp_path):
+    owner = open_store(tmp_path, fsync='always')
+    owner['before'] = 1
+    follower = open_store(tmp_path, lock_timeout=0, fsync_interval=0.02)
+    assert follower.log.read_only
+    assert follower['before'] == 1
+
+    owner['after'] = 2
+    follower['local'] = 3   # appended to the owner's segment
+    assert follower.log.stats()['appended'] == 1 and follower.log.stats()['dropped'] == 0
+    owner.log.close()
+
+    deadline = time.monotonic() + 5
+    while follower.log.read_only and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not follower.log.read_only
+    assert follower['after'] == 2 and follower['local'] == 3
+    follower['later'] = 4
+    follower.log.close()
+    assert follower.log.stats()['promotions'] == 1
+
+    restored = open_store(tmp_path)
+    assert {key: restored[key] for key in ('before', 'after', 'local', 'later')} == {
+        'before': 1, 'after': 2, 'local': 3, 'later': 4}
+    restored.log.close()
+
+
+@pytest.mark.skipif(store_log.fcntl is None, reason='needs flock')
+def test_owner_keeps_other_workers_writes_through_a_snapshot(tmp_path):
+    owner = open_store(tmp_path)
+    follower = open_store(tmp_path, lock_timeout=0)
+    assert follower.log.read_only
+    follower['shared'] = {'from': 'follower'}
+    follower.pop('shared-never-set')
+    owner['own'] = 1
+    assert owner.log.stats()['merged'] == 1
+    assert owner['shared'] == {'from': 'follower'}
+
+    owner.log.snapshot()
+    follower['after-snapshot'] = 2   # lands in the new segment
+    follower.log.close()
+    owner.log.close()
+
+    restored = open_store(tmp_path)
+    assert restored['shared'] == {'from': 'follower'}
+    assert restored['own'] == 1 and restored['after-snapshot'] == 2
+    restored.log.close()
+
+
+@pytest.mark.skipif(store_log.fcntl is None, reason='needs flock')
+def test_dropped_writes_are_counted_and_logged(tmp_path, monkeypatch):
+    warnings = []
+    monkeypatch.setattr(store_log.log, 'warning', lambda *args: warnings.append(args))
+    owner = open_store(tmp_path)
+    follower = open_store(tmp_path, lock_timeout=0)
+    monkeypatch.setattr(follower.log, '_shared_segment', lambda: None)
+    follower['lost'] = 1
+    follower['lost-too'] = 2
+    assert follower.log.stats()['dropped'] == 2
+    assert len(warnings) == 1   # rate-limited
+    follower.log.close()
+    owner.log.close()
+
+
+def test_touches_are_coalesced_per_key(tmp_path):
+    store = open_store(tmp_path, touch_interval=3600)
+    store['a'] = 1
+    store['b'] = 2
+    for _ in range(5):
+        store.get('a')
+        store.get('b')
+        store.flush()
+    assert store.log.stats()['touches'] == 0
+    store.log.close()
+    assert store.log.stats()['touches'] == 2
+
+
+def test_leftover_snapshot_temp_files_are_removed(tmp_path):
+    (tmp_path / 'snapshot-00000003.dat.tmp').write_bytes(b'partial')
+    store = open_store(tmp_path)
+    assert not (tmp_path / 'snapshot-00000003.dat.tmp').exists()
+    assert store.log.stats()['tmp_removed'] == 1
+    store.log.close()
@@ -0,0 +1,150 @@
+import time
+
+from stores import BoundedStore, ConversationStore, RecipeStore, create_store, estimate_size
+
+
+def make_recipe(recipe_id, servings=2):
+    return {
+        'id': recipe_id,
+        'title': f'Recipe {recipe_id}',
+        'ingredients': ['2 cups flour', '1 tsp salt'],
+        'macros': 'Calories: 300, Fat: 10g',
+        'instructions': 'Mix and bake.',
+        'servings': servings,
+    }
+
+
+def test_lru_eviction_by_entries():
+    store = BoundedStore(max_entries=2)
+    store['a'] = 1
+    store['b'] = 2
+    assert store['a'] == 1      # a is now most recently used
+    store['c'] = 3
+    assert 'b' not in store
+    assert store.get('a') == 1 and store.get('c') == 3
+    assert store.stats()['evictions']['entries'] == 1
+
+
+def test_eviction_by_bytes():
+    store = BoundedStore(max_bytes=estimate_size('x' * 100) * 2)
+    for key in 'abc':
+        store[key] = 'x' * 100
+    assert len(store) == 2
+    assert store.stats()['evictions']['bytes'] == 1
+
+
+def test_ttl_expiry_and_sliding():
+    store = BoundedStore(ttl=0.05)
+    store['a'] = 1
+    store['b'] = 2
+    time.sleep(0.03)
+    assert store.get('a') == 1  # refreshes a's expiry
+    time.sleep(0.03)
+    assert store.get('a') == 1
+    assert store.get('b') is None
+    assert store.stats()['evictions']['ttl'] == 1
+
+
+def test_pop_and_missing_key():
+    store = BoundedStore()
+    store['a'] = {'x': 1}
+    assert store.pop('a') == {'x': 1}
+    assert store.pop('a', 'gone') == 'gone'
+    try:
+        store['a']
+    except KeyError:
+        pass
+    else:
+        raise AssertionError('expected KeyError')
+
+
+def test_set_many():
+    store = BoundedStore(max_entries=3)
+    store.set_many([(str(i), i) for i in range(5)])
+    assert len(store) == 3
+    assert store.get('4') == 4 and store.get('0') is None
+
+
+def test_recipe_store_returns_copies():
+    store = RecipeStore()
+    store['r1'] = make_recipe('r1')
+    recipe = store['r1']
+    recipe['ingredients'].append('mutated')
+    assert store['r1']['ingredients'] == ['2 cups flour', '1 tsp salt']
+
+
+def test_recipe_store_scaling_never_compounds():
+    store = RecipeStore()
+    store['r1'] = make_recipe('r1', servings=2)
+    assert store.get_scaled('r1', 4)['ingredients'] == ['4 cups flour', '2 tsp salt']
+    assert store.get_scaled('r1', 4)['ingredients'] == ['4 cups flour', '2 tsp salt']
+    assert store.get_scaled('r1', 1)['macros'] == 'Calories: 150, Fat: 5g'
+    assert store.get_scaled('missing', 4) is None
+
+
+def test_create_store_memory_backend():
+    assert isinstance(create_store('recipes'), RecipeStore)
+    assert isinstance(create_store('conversations', batch_size=8, read_cache_ttl=0), ConversationStore)
+
+
+def test_sqlite_store_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / 'state.sqlite3')
+    writer = create_store('recipes', backend='sqlite', path=path, batch_size=100)
+    reader = create_store('recipes', backend='sqlite', path=path, read_cache_ttl=0)
+    writer['r1'] = make_recipe('r1')
+    assert writer.get('r1')['title'] == 'Recipe r1'   # served from the pending buffer
+    assert reader.get('r1') is None
+    writer.flush()
+    assert reader.get('r1')['title'] == 'Recipe r1'
+    assert reader.get_scaled('r1', 4)['ingredients'] == ['4 cups flour', '2 tsp salt']
+
+
+def test_sqlite_store_limits_and_pop(tmp_path):
+    store = create_store('conversations', backend='sqlite', path=str(tmp_path / 's.sqlite3'),
+                         max_entries=2, batch_size=1, read_cache_ttl=0)
+    for key in 'abc':
+        store[key] = {'turns': [key]}
+        time.sleep(0.01)
+    assert len(store) == 2
+    assert 'a' not in store
+    assert store.pop('c') == {'turns': ['c']}
+    assert 'c' not in store
+
+
+def test_recipe_scalers_are_built_lazily_and_bounded():
+    store = RecipeStore(scaler_cache_size=1)
+    store['r1'] = make_recipe('r1')
+    store['r2'] = make_recipe('r2')
+    assert not store._scalers
+    store.get_scaled('r1', 4)
+    store.get_scaled('r2', 4)
+    assert list(store._scalers) == ['r2']
+
+
+def test_replacing_a_recipe_drops_its_scaler():
+    store = RecipeStore()
+    store['r1'] = make_recipe('r1')
+    store.get_scaled('r1', 4)
+    store['r1'] = dict(make_recipe('r1'), ingredients=['1 cup rice'])
+    assert store.get_scaled('r1', 4)['ingredients'] == ['2 cups rice']
+    store.pop('r1')
+    assert 'r1' not in store._scalers
+
+
+def test_sqlite_scaled_recipes_follow_expiry_and_other_workers(tmp_path):
+    path = str(tmp_path / 'state.sqlite3')
+    store = create_store('recipes', backend='sqlite', path=path, batch_size=1, read_cache_ttl=0)
+    other = create_store('recipes', backend='sqlite', path=path, batch_size=1, read_cache_ttl=0)
+    store.set('r1', make_recipe('r1'), ttl=0.05)
+    assert store.get_scaled('r1', 4)['ingredients'] == ['4 cups flour', '2 tsp salt']
+    time.sleep(0.06)
+    assert store.get('r1') is None
+    assert store.get_scaled('r1', 4) is None
+
+    store.set('r2', make_recipe('r2'))
+    store.get_scaled('r2', 4)
+    other.set('r2', dict(make_recipe('r2'), ingredients=['1 cup rice']))
+    assert store.get_scaled('r2', 4)['ingredients'] == ['2 cups rice']
+    other.pop('r2')
+    other.flush()
+    assert store.get_scaled('r2', 4) is None
@@ -0,0 +1,73 @@
+import pytest
+
+from validation import ValidationPipeline, classify_recipe, normalize_preference_key
+
+
+def verdict(ingredients, **preferences):
+    return classify_recipe({'ingredients': ingredients}, preferences)[0]
+
+
+@pytest.mark.parametrize('ingredients, preference', [
+    (['200g gluten-free pasta'], 'glutenFree'),
+    (['2 tbsp gluten free soy sauce', '1 cup rice flour'], 'glutenFree'),
+    (['1 cup dairy-free cheese'], 'dairyFree'),
+    (['1 cup non-dairy milk'], 'dairyFree'),
+    (['1 cup cashew milk'], 'vegan'),
+    (['1/2 cup oat cream', '2 tbsp peanut butter'], 'vegan'),
+    (['100g vegan cheddar cheese'], 'vegan'),
+    (['1 tsp nutmeg', '1 butternut squash'], 'nutFree'),
+    (['1 cup vegetable broth', '1 onion'], 'vegetarian'),
+    (['8 corn tortillas', '2 peaches'], 'glutenFree'),
+])
+def test_allowed_phrases_pass(ingredients, preference):
+    assert verdict(ingredients, **{preference: True}) == 'pass'
+
+
+@pytest.mark.parametrize('ingredients, preference', [
+    (['200g pasta'], 'glutenFree'),
+    (['gluten-free pasta and bread'], 'glutenFree'),
+    (['1 tsp gluten-free baking powder', 'pasta'], 'glutenFree'),
+    (['1 cup milk'], 'vegan'),
+    (['1 cup cashew milk'], 'nutFree'),
+    (['1 cup cheese'], 'dairyFree'),
+    (['2 chicken breasts'], 'vegetarian'),
+    (['4 pork sausages'], 'vegetarian'),
+    (['2 steaks'], 'vegetarian'),
+    (['6 anchovies'], 'vegetarian'),
+    (['8 flour tortillas'], 'glutenFree'),
+])
+def test_banned_terms_fail(ingredients, preference):
+    assert verdict(ingredients, **{preference: True}) == 'fail'
+
+
+def test_ambiguous_and_unknown_preferences():
+    assert verdict(['1 cup stock'], vegetarian=True) == 'ambiguous'
+    assert verdict(['1 cup rice'], lowSodium=True) == 'ambiguous'
+    assert verdict(['1 cup rice'], vegan=False) == 'pass'
+
+
+def test_normalize_preference_key():
+    assert {normalize_preference_key(k) for k in ('glutenFree', 'gluten-free', 'gluten_free')} == {'glutenfree'}
+
+
+def test_pipeline_checks_only_ambiguous_with_model_and_regenerates_failures():
+    checked = []
+
+    def model_check(recipes, preferences):
+        checked.extend(r['title'] for r in recipes)
+        return [True] * len(recipes)
+
+    def regenerate(count, preferences, avoid):
+        return [{'title': f'new {i}', 'ingredients': ['1 cup rice']} for i in range(count)]
+
+    pipeline = ValidationPipeline(model_check, max_rounds=1)
+    recipes = [
+        {'title': 'ok', 'ingredients': ['1 cup rice']},
+        {'title': 'unsure', 'ingredients': ['1 cup stock']},
+        {'title': 'bad', 'ingredients': ['1 chicken']},
+    ]
+    valid, report = pipeline.run(recipes, {'vegetarian': True}, regenerate=regenerate)
+    assert [r['title'] for r in valid] == ['ok', 'unsure', 'new 0']
+    assert checked == ['unsure']
+    assert report['failed'] == 1 and report['regenerate_calls'] == 1
+    assert pipeline.stats()['runs'] == 1
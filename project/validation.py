@@ -0,0 +1,273 @@
+"""
+Recipe validation against dietary preferences.
+
+Most recipes can be checked locally: each preference maps to a lexicon of
+banned ingredients. Only recipes the rules can't decide ("ambiguous") are
+sent to the model, and only recipes that fail are regenerated, within a
+hard round and time budget.
+"""
+import re
+import threading
+import time
+
+# ----------------------------------------------------------------
+# RULES
+# ----------------------------------------------------------------
+
+_MEAT_AND_FISH = [
+    "chicken", "beef", "pork", "bacon", "ham", "sausage", "turkey", "lamb", "veal",
+    "duck", "goose", "venison", "prosciutto", "salami", "pepperoni", "chorizo",
+    "steak", "mince", "fish", "salmon", "tuna", "cod", "trout", "anchovy", "anchovies",
+    "sardine", "sardines", "shrimp", "prawn", "prawns", "crab", "lobster", "clam",
+    "clams", "mussel", "mussels", "oyster", "oysters", "scallop", "scallops", "squid",
+    "octopus", "gelatin", "lard", "fish sauce",
+]
+_DAIRY = [
+    "milk", "cheese", "butter", "cream", "yogurt", "yoghurt", "ghee", "ricotta",
+    "mozzarella", "parmesan", "cheddar", "feta", "mascarpone", "buttermilk",
+    "cottage cheese", "sour cream", "whey", "custard",
+]
+_EGGS = ["egg", "eggs", "mayonnaise", "mayo", "meringue"]
+_GLUTEN = [
+    "wheat", "flour", "bread", "breadcrumbs", "pasta", "spaghetti", "noodles",
+    "couscous", "barley", "rye", "semolina", "bulgur", "farro", "seitan", "tortilla",
+    "soy sauce", "beer", "croutons", "crackers", "pastry", "pita", "bun", "buns",
+]
+_NUTS = [
+    "nut", "nuts", "almond", "almonds", "walnut", "walnuts", "pecan", "pecans",
+    "cashew", "cashews", "pistachio", "pistachios", "hazelnut", "hazelnuts",
+    "peanut", "peanuts", "macadamia", "pine nut", "pine nuts", "praline",
+    "marzipan", "nutella", "pesto",
+]
+
+
+
+def _qualified(*qualifiers):
+    # A qualifier plus the (up to two-word) noun it applies to, e.g.
+    # "gluten-free pasta", "dairy-free cheddar cheese"
+    alternatives = "|".join(re.escape(q) for q in qualifiers)
+    return rf"(?:{alternatives})(?:\s+(?!(?:and|or|with)\b)[a-z]+){{1,2}}"
+
+
+# "cashew milk", "oat cream", "almond yogurt", ...
+_PLANT_DAIRY = (
+    r"(?:almond|cashew|oat|soy|rice|coconut|hazelnut|macadamia|hemp|pea|peanut|pistachio|walnut|cocoa)"
+    r"\s+(?:milk|cream|butter|cheese|yogurt|yoghurt)"
+)
+
+# Each rule: banned terms, terms that need a model check, and phrases
+# that look banned but aren't. Allowed phrases (literal "allowed" terms and
+# "allowed_patterns" regexes) are removed from the text before matching.
+PREFERENCE_RULES = {
+    "vegetarian": {
+        "banned": _MEAT_AND_FISH,
+        "ambiguous": ["broth", "stock", "worcestershire"],
+        "allowed": ["vegetable broth", "vegetable stock", "veggie broth", "veggie stock"],
+    },
+    "vegan": {
+        "banned": _MEAT_AND_FISH + _DAIRY + _EGGS + ["honey"],
+        "ambiguous": ["broth", "stock", "worcestershire", "chocolate", "pesto"],
+        "allowed": [
+            "vegetable broth", "vegetable stock", "veggie broth", "veggie stock",
+            "peanut butter", "almond butter", "cashew butter", "coconut milk",
+            "almond milk", "oat milk", "soy milk", "rice milk", "coconut cream",
+            "vegan cheese", "vegan butter", "vegan mayo", "vegan mayonnaise",
+            "cocoa butter",
+        ],
+        "allowed_patterns": [_qualified("vegan", "plant-based", "dairy-free", "dairy free", "egg-free"),
+                             _PLANT_DAIRY],
+    },
+    "glutenfree": {
+        "banned": _GLUTEN,
+        "ambiguous": ["oats", "oat", "stock", "broth"],
+        "allowed": [
+            "gluten-free", "gluten free", "rice flour", "almond flour", "coconut flour",
+            "corn tortilla", "corn tortillas", "rice noodles", "tamari", "buckwheat",
+            "cornflour", "chickpea flour",
+        ],
+        "allowed_patterns": [_qualified("gluten-free", "gluten free")],
+    },
+    "dairyfree": {
+        "banned": _DAIRY,
+        "ambiguous": ["chocolate", "pesto"],
+        "allowed": [
+            "peanut butter", "almond butter", "cashew butter", "coconut milk",
+            "almond milk", "oat milk", "soy milk", "rice milk", "coconut cream",
+            "dairy-free", "dairy free", "vegan cheese", "vegan butter", "cocoa butter",
+        ],
+        "allowed_patterns": [_qualified("dairy-free", "dairy free", "non-dairy", "vegan", "plant-based"),
+                             _PLANT_DAIRY],
+    },
+    "nutfree": {
+        "banned": _NUTS,
+        "ambiguous": ["coconut", "granola", "chocolate"],
+        "allowed": ["nut-free", "nut free", "nutmeg", "butternut", "water chestnut"],
+        "allowed_patterns": [_qualified("nut-free", "nut free")],
+    },
+}
+
+
+def _plural(term):
+    # "sausage" => sausages, "anchovy" => anchovies, "peach" => peaches
+    if re.search(r"[^aeiou]y$", term):
+        return re.escape(term[:-1]) + "(?:y|ies)"
+    return re.escape(term) + "(?:e?s)?"
+
+
+def _compile(terms, patterns=(), plurals=False):
+    if not terms and not patterns:
+        return None
+    # Patterns first, so "gluten-free pasta" wins over the bare "gluten-free"
+    terms = sorted(terms, key=len, reverse=True)
+    alternatives = list(patterns) + [_plural(t) if plurals else re.escape(t) for t in terms]
+    return re.compile(r"\b(" + "|".join(alternatives) + r")\b")
+
+
+# Regexes are compiled once at import, not per recipe
+_COMPILED_RULES = {
+    key: (
+        _compile(rule["banned"], plurals=True),
+        _compile(rule["ambiguous"], plurals=True),
+        _compile(rule["allowed"], rule.get("allowed_patterns", ())),
+    )
+    for key, rule in PREFERENCE_RULES.items()
+}
+
+
+def normalize_preference_key(key):
+    """
+    "glutenFree", "gluten-free" and "gluten_free" all map to "glutenfree".
+    """
+    return re.sub(r"[^a-z]", "", str(key).lower())
+
+
+def active_preferences(preferences):
+    return [normalize_preference_key(k) for k, v in (preferences or {}).items() if v]
+
+
+def classify_recipe(recipe, preferences):
+    """
+    Check one recipe against the enabled preferences using the local rules.
+    Returns (verdict, reasons) where verdict is "pass", "fail" or "ambiguous".
+    """
+    # "; " keeps a qualifier at the end of one line from reaching into the next
+    text = "; ".join(str(i) for i in recipe.get("ingredients", [])).lower()
+    verdict = "pass"
+    reasons = []
+
+    for key in active_preferences(preferences):
+        if key not in _COMPILED_RULES:
+            # No local rule for this preference, so let the model decide
+            verdict = "ambiguous"
+            reasons.append(f"{key}: no local rule")
+            continue
+
+        banned, ambiguous, allowed = _COMPILED_RULES[key]
+        checked = allowed.sub(" ", text) if allowed else text
+        hit = banned.search(checked)
+        if hit:
+            return "fail", [f"{key}: contains '{hit.group(1)}'"]
+        if ambiguous:
+            hit = ambiguous.search(checked)
+            if hit:
+                verdict = "ambiguous"
+                reasons.append(f"{key}: unsure about '{hit.group(1)}'")
+
+    return verdict, reasons
+
+# ----------------------------------------------------------------
+# PIPELINE
+# ----------------------------------------------------------------
+
+
+class ValidationPipeline:
+    """
+    Local rules -> model check for ambiguous recipes -> regenerate failures.
+
+    model_check(recipes, preferences) returns one bool per recipe.
+    regenerate(count, preferences, avoid_titles), passed to run(), returns
+    replacement recipes.
+    """
+
+    STAGES = ("local", "model", "regenerate")
+
+    def __init__(self, model_check, max_rounds=2, time_budget=20.0):
+        self.model_check = model_check
+        self.max_rounds = max_rounds
+        self.time_budget = time_budget
+        self._lock = threading.Lock()
+        self._totals = {stage: 0.0 for stage in self.STAGES}
+        self._counts = {"runs": 0, "rounds": 0, "passed": 0, "failed": 0, "ambiguous": 0,
+                        "model_calls": 0, "regenerate_calls": 0, "dropped": 0}
+
+    def run(self, recipes, preferences, regenerate=None):
+        """
+        Return (valid_recipes, report). The report has per-stage timings
+        in milliseconds and per-verdict counts for this run.
+        """
+        deadline = time.monotonic() + self.time_budget
+        timings = {stage: 0.0 for stage in self.STAGES}
+        counts = {"rounds": 0, "passed": 0, "failed": 0, "ambiguous": 0,
+                  "model_calls": 0, "regenerate_calls": 0, "dropped": 0}
+        wanted = len(recipes)
+        valid = []
+        candidates = list(recipes)
+
+        for round_number in range(self.max_rounds + 1):
+            started = time.monotonic()
+            counts["rounds"] += 1
+            failed, unsure = [], []
+            for recipe in candidates:
+                verdict, _ = classify_recipe(recipe, preferences)
+                if verdict == "pass":
+                    valid.append(recipe)
+                elif verdict == "fail":
+                    failed.append(recipe)
+                else:
+                    unsure.append(recipe)
+            counts["passed"] += len(candidates) - len(failed) - len(unsure)
+            counts["failed"] += len(failed)
+            counts["ambiguous"] += len(unsure)
+            timings["local"] += time.monotonic() - started
+
+            if unsure and time.monotonic() < deadline:
+                started = time.monotonic()
+                counts["model_calls"] += 1
+                flags = self.model_check(unsure, preferences)
+                for recipe, ok in zip(unsure, flags):
+                    (valid if ok else failed).append(recipe)
+                timings["model"] += time.monotonic() - started
+            else:
+                # Out of time: drop recipes we couldn't confirm
+                counts["dropped"] += len(unsure)
+
+            missing = wanted - len(valid)
+            if (missing <= 0 or regenerate is None or round_number == self.max_rounds
+                    or time.monotonic() >= deadline):
+                break
+
+            started = time.monotonic()
+            counts["regenerate_calls"] += 1
+            avoid = [r.get("title", "") for r in valid + failed]
+            candidates = regenerate(missing, preferences, avoid) or []
+            timings["regenerate"] += time.monotonic() - started
+            if not candidates:
+                break
+
+        timings = {stage: round(seconds * 1000, 2) for stage, seconds in timings.items()}
+        with self._lock:
+            self._counts["runs"] += 1
+            for key, value in counts.items():
+                self._counts[key] += value
+            for stage, ms in timings.items():
+                self._totals[stage] += ms
+
+        return valid[:wanted], {"timings_ms": timings, **counts}
+
+    def stats(self):
+        """
+        Cumulative per-stage timings (ms) and counts across all runs.
+        The local stage runs once per round.
+        """
+        with self._lock:
+            return {"timings_ms": dict(self._totals), **self._counts}